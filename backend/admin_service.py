@@ -1,50 +1,16 @@
+import time
 from flask import Blueprint, request, jsonify
-from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, timedelta
-from app import db, app
 from functools import wraps
+from database import db, Bus, User, Booking, Payment, AdminUser, AdminLog, SystemReport
+from database_operations import InventoryOperations
+from seat_map import seat_maps
+from live_state import live_state
+from gps_stream import position_broker
 
 # Admin Service Blueprint
 admin_bp = Blueprint('admin', __name__, url_prefix='/api/admin')
 
-class AdminUser(db.Model):
-    __tablename__ = 'admin_users'
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    role = db.Column(db.String(50), nullable=False)  # super_admin, manager, operator
-    permissions = db.Column(db.JSON, nullable=True)
-    is_active = db.Column(db.Boolean, default=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    
-    user = db.relationship('User', backref='admin_profile')
-
-
-class AdminLog(db.Model):
-    __tablename__ = 'admin_logs'
-    id = db.Column(db.Integer, primary_key=True)
-    admin_id = db.Column(db.Integer, db.ForeignKey('admin_users.id'), nullable=False)
-    action = db.Column(db.String(100), nullable=False)
-    entity_type = db.Column(db.String(50), nullable=False)  # bus, user, payment, etc.
-    entity_id = db.Column(db.Integer, nullable=True)
-    changes = db.Column(db.JSON, nullable=True)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
-    
-    admin = db.relationship('AdminUser', backref='logs')
-
-
-class SystemReport(db.Model):
-    __tablename__ = 'system_reports'
-    id = db.Column(db.Integer, primary_key=True)
-    report_type = db.Column(db.String(50), nullable=False)  # daily, weekly, monthly
-    report_date = db.Column(db.DateTime, default=datetime.utcnow)
-    total_revenue = db.Column(db.Float, default=0)
-    total_bookings = db.Column(db.Integer, default=0)
-    total_users = db.Column(db.Integer, default=0)
-    total_buses = db.Column(db.Integer, default=0)
-    active_buses = db.Column(db.Integer, default=0)
-    report_data = db.Column(db.JSON, nullable=True)
-
-
 # ========== AUTHENTICATION DECORATOR ==========
 
 def admin_required(f):
@@ -69,18 +35,19 @@ def admin_required(f):
 def get_dashboard(admin=None):
     """Get admin dashboard data"""
     try:
-        from app import Bus, User, Seat
-        from payment_service import Payment, Booking
-        
         # Statistics
         total_buses = Bus.query.count()
         active_buses = Bus.query.filter_by(status='active').count()
         total_users = User.query.count()
-        total_seats = Seat.query.count()
-        reserved_seats = Seat.query.filter_by(is_reserved=True).count()
+        # Seats taken today, by bookings or undated reservations
+        today = datetime.utcnow().date()
+        buses = Bus.query.all()
+        maps = seat_maps.get_for_buses(buses)
+        masks = InventoryOperations.get_day_masks([bus.id for bus in buses], today) if buses else {}
+        total_seats = sum(seat_map.total_count for seat_map in maps.values())
+        reserved_seats = sum(maps[bus.id].count_reserved(taken=masks.get(bus.id, 0)) for bus in buses)
         
         # Revenue
-        today = datetime.utcnow().date()
         today_payments = Payment.query.filter(
             db.func.date(Payment.created_at) == today,
             Payment.payment_status == 'completed'
@@ -131,16 +98,18 @@ def get_dashboard(admin=None):
 def get_all_buses(admin=None):
     """Get all buses for management"""
     try:
-        from app import Bus
-        
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
         
         buses = Bus.query.paginate(page=page, per_page=per_page)
         
+        # Seats taken today, by bookings or undated reservations
+        maps = seat_maps.get_for_buses(buses.items)
+        masks = InventoryOperations.get_day_masks([bus.id for bus in buses.items], datetime.utcnow().date())
+        
         result = []
         for bus in buses.items:
-            reserved_seats = sum(1 for seat in bus.seats if seat.is_reserved)
+            reserved_seats = maps[bus.id].count_reserved(taken=masks.get(bus.id, 0))
             result.append({
                 'id': bus.id,
                 'bus_number': bus.bus_number,
@@ -173,8 +142,6 @@ def get_all_buses(admin=None):
 def update_bus_status(bus_id, admin=None):
     """Update bus status (active/inactive)"""
     try:
-        from app import Bus
-        
         data = request.json
         bus = Bus.query.get(bus_id)
         
@@ -196,6 +163,14 @@ def update_bus_status(bus_id, admin=None):
         db.session.add(log)
         db.session.commit()
         
+        # The live fleet copies the status at ingest; refresh it so the
+        # active-bus map and stream subscribers see the change now
+        state = live_state.get(bus_id)
+        if state is not None:
+            state = dict(state, status=bus.status, received_at=time.time())
+            if live_state.update_many([state]):
+                position_broker.publish([state])
+        
         return jsonify({'message': 'Bus status updated'}), 200
     except Exception as e:
         db.session.rollback()
@@ -207,8 +182,6 @@ def update_bus_status(bus_id, admin=None):
 def get_all_users(admin=None):
     """Get all users for management"""
     try:
-        from app import User
-        
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
         
@@ -242,8 +215,6 @@ def get_all_users(admin=None):
 def get_all_payments(admin=None):
     """Get all payments for management"""
     try:
-        from payment_service import Payment
-        
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
         status = request.args.get('status')
@@ -285,8 +256,6 @@ def get_all_payments(admin=None):
 def get_revenue_analytics(admin=None):
     """Get revenue analytics"""
     try:
-        from payment_service import Payment
-        
         days = request.args.get('days', 30, type=int)
         start_date = datetime.utcnow() - timedelta(days=days)
         
@@ -330,8 +299,6 @@ def get_revenue_analytics(admin=None):
 def get_booking_analytics(admin=None):
     """Get booking analytics"""
     try:
-        from payment_service import Booking
-        
         days = request.args.get('days', 30, type=int)
         start_date = datetime.utcnow() - timedelta(days=days)
         
@@ -359,9 +326,6 @@ def get_booking_analytics(admin=None):
 def generate_daily_report(admin=None):
     """Generate daily report"""
     try:
-        from app import Bus, User
-        from payment_service import Payment, Booking
-        
         today = datetime.utcnow().date()
         
         # Collect data
@@ -4,13 +4,33 @@ from datetime import datetime
 import os
 from dotenv import load_dotenv
 
+# Load .env before config classes read os.environ
+load_dotenv()
+
 # Import database
 from database import db, User, Bus, Seat, Wallet
 
 # Import routes blueprint
 from routes import api
-
-load_dotenv()
+from gps_service import gps_bp, stops_bp
+from payment_service import payment_bp
+from admin_service import admin_bp
+from gps_buffer import gps_write_buffer
+from live_state import live_state
+from gps_stream import position_broker
+from spatial_index import bus_spatial_index
+from gps_archive import gps_archive
+from eta_engine import eta_engine
+from stop_index import stop_index
+from map_matching import route_matcher
+from geofence import geofence_engine
+from arrival_detector import arrival_detector
+from gps_filter import gps_filter
+from gps_udp import gps_udp_listener
+from gps_pipeline import gps_pipeline
+from seat_holds import seat_holds
+from database_operations import GPSOperations
+from config import GPSConfig, BookingConfig
 
 app = Flask(__name__)  # ← Keep only ONE of these
 CORS(app)
@@ -22,11 +42,34 @@ app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
 )
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# GPS pipeline configuration (see config.GPSConfig)
+app.config.from_object(GPSConfig)
+app.config.from_object(BookingConfig)
+
 # Initialize extensions
 db.init_app(app)
+# Forks its worker processes, so it starts before anything else starts a thread
+gps_pipeline.init_app(app)
+gps_write_buffer.init_app(app, writer=GPSOperations.log_gps_batch, probe=GPSOperations.ping)
+gps_filter.init_app(app)
+live_state.init_app(app)
+position_broker.init_app(app, live_state)
+bus_spatial_index.init_app(app, position_broker)
+gps_archive.init_app(app)
+eta_engine.init_app(app)
+stop_index.init_app(app)
+route_matcher.init_app(app)
+geofence_engine.init_app(app)
+arrival_detector.init_app(app)
+gps_udp_listener.init_app(app)
+seat_holds.init_app(app)
 
 # Register blueprints (ALL routes are in routes.py)
 app.register_blueprint(api)
+app.register_blueprint(gps_bp)
+app.register_blueprint(stops_bp)
+app.register_blueprint(payment_bp)
+app.register_blueprint(admin_bp)
 
 # ==================== HEALTH CHECK ====================
 
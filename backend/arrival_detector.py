@@ -0,0 +1,143 @@
+"""
+Stop Arrival Detector
+Detects stop arrivals and departures from the GPS stream by dwell time inside a stop radius
+"""
+
+import threading
+from geo_utils import haversine_one_to_many
+
+
+class StopVisit:
+    """A bus's current stay inside one stop's radius"""
+
+    __slots__ = ('stop_index', 'entered_at', 'last_inside_at', 'arrived')
+
+    def __init__(self, stop_index, entered_at):
+        self.stop_index = stop_index
+        self.entered_at = entered_at
+        self.last_inside_at = entered_at
+        self.arrived = False
+
+
+class ArrivalDetector:
+    """Per-bus state machine over ingested fixes
+
+    A bus that stays within `radius_km` of a stop for `dwell_seconds` has
+    arrived (at the time it entered the radius) and departs when it leaves.
+    A bus that drives through without dwelling still completes the stop,
+    with arrival and departure recorded together on exit. Arriving at the
+    route's first stop starts a new trip and reopens the other stops.
+    """
+
+    def __init__(self, radius_km=0.05, dwell_seconds=20):
+        self.radius_km = radius_km
+        self.dwell_seconds = dwell_seconds
+        self._routes = {}   # bus_id -> stops (id, order, lat, lng), or [] without a route
+        self._visits = {}   # bus_id -> StopVisit
+        self._lock = threading.Lock()
+        self.stats = {'arrivals': 0, 'departures': 0, 'errors': 0}
+
+    def init_app(self, app):
+        """Read ARRIVAL_RADIUS_M / ARRIVAL_DWELL_S"""
+        self.radius_km = app.config.get('ARRIVAL_RADIUS_M', 50) / 1000
+        self.dwell_seconds = app.config.get('ARRIVAL_DWELL_S', self.dwell_seconds)
+
+    def invalidate(self, bus_id=None):
+        """Forget a bus's stops (or all), e.g. after its route was rewritten"""
+        with self._lock:
+            if bus_id is None:
+                self._routes = {}
+                self._visits = {}
+            else:
+                self._routes.pop(bus_id, None)
+                self._visits.pop(bus_id, None)
+
+    def _stops(self, bus_id):
+        stops = self._routes.get(bus_id)
+        if stops is None:
+            from database_operations import ETAOperations
+            rows, error = ETAOperations.get_route_stops(bus_id)
+            if error:
+                return []
+            stops = [(row.id, row.stop_order, row.latitude, row.longitude) for row in rows]
+            with self._lock:
+                self._routes[bus_id] = stops
+        return stops
+
+    def check(self, fix):
+        """Arrival/departure events caused by one fix"""
+        bus_id = fix['bus_id']
+        stops = self._stops(bus_id)
+        if not stops:
+            return []
+
+        distances = haversine_one_to_many(
+            fix['latitude'], fix['longitude'], [stop[2] for stop in stops], [stop[3] for stop in stops]
+        )
+        nearest = int(distances.argmin())
+        inside = distances[nearest] <= self.radius_km
+        at = fix['timestamp']
+
+        events = []
+        visit = self._visits.get(bus_id)
+        if visit is not None and (not inside or visit.stop_index != nearest):
+            # Left the previous stop
+            stop_id, stop_order = stops[visit.stop_index][:2]
+            if not visit.arrived:
+                events.append(_event('arrival', bus_id, stop_id, stop_order, visit.entered_at, stops))
+            events.append(_event('departure', bus_id, stop_id, stop_order, visit.last_inside_at, stops))
+            visit = None
+
+        if inside:
+            if visit is None:
+                visit = StopVisit(nearest, at)
+            visit.last_inside_at = max(visit.last_inside_at, at)
+            if not visit.arrived and (at - visit.entered_at).total_seconds() >= self.dwell_seconds:
+                visit.arrived = True
+                stop_id, stop_order = stops[nearest][:2]
+                events.append(_event('arrival', bus_id, stop_id, stop_order, visit.entered_at, stops))
+
+        if visit is None:
+            self._visits.pop(bus_id, None)
+        else:
+            self._visits[bus_id] = visit
+        return events
+
+    def process(self, fixes):
+        """Run a batch of fixes (oldest first) and record the events in one transaction
+
+        Returns:
+            list: events that were recorded"""
+        events = []
+        for fix in sorted(fixes, key=lambda fix: fix['timestamp']):
+            events.extend(self.check(fix))
+        if not events:
+            return []
+
+        from database_operations import GPSOperations
+        _, error = GPSOperations.record_stop_events(events)
+        if error:
+            self.stats['errors'] += 1
+            return []
+        for event in events:
+            self.stats['arrivals' if event['type'] == 'arrival' else 'departures'] += 1
+
+        from eta_engine import eta_engine
+        for bus_id in {event['bus_id'] for event in events}:
+            eta_engine.invalidate(bus_id)
+        return events
+
+
+def _event(kind, bus_id, stop_id, stop_order, at, stops):
+    return {
+        'type': kind,
+        'bus_id': bus_id,
+        'stop_id': stop_id,
+        'stop_order': stop_order,
+        'at': at,
+        'starts_trip': kind == 'arrival' and stop_order == stops[0][1]
+    }
+
+
+# Shared detector instance (configured by init_app in app.py)
+arrival_detector = ArrivalDetector()
@@ -0,0 +1,76 @@
+"""
+Geo Kernel Benchmark
+Compares the scalar geo_utils helpers with the vectorized distance, bearing
+and arrival-time kernels
+
+Usage: python benchmarks/bench_geo_kernels.py [--repeat N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geo_utils import (  # noqa: E402
+    calculate_distance, calculate_bearing, haversine_one_to_many, bearing_one_to_many, estimate_arrival_times
+)
+
+SIZES = (10, 1000, 100000)
+# Points are scattered around central Delhi
+ORIGIN = (28.6139, 77.2090)
+# Speed for the arrival-time kernel
+SPEED_KMH = 40
+
+
+def _points(count, seed=42):
+    rng = random.Random(seed)
+    lats = [ORIGIN[0] + rng.uniform(-0.5, 0.5) for _ in range(count)]
+    lngs = [ORIGIN[1] + rng.uniform(-0.5, 0.5) for _ in range(count)]
+    return lats, lngs
+
+
+def _best_of(repeat, func):
+    """Fastest wall time (seconds) of `repeat` calls"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _report(kernel, count, repeat, scalar_func, vector_func):
+    """Time both versions and print one row with their largest disagreement"""
+    scalar = _best_of(repeat, scalar_func)
+    vector = _best_of(repeat, vector_func)
+    error = max(abs(s - v) for s, v in zip(scalar_func(), vector_func().tolist()))
+    print(f"{kernel:<10} {count:>8} {scalar * 1000:>11.3f} {vector * 1000:>11.3f} "
+          f"{scalar / vector:>8.1f}x {error:>11.2e}")
+
+
+def run(repeat):
+    lat, lng = ORIGIN
+    print(f"{'kernel':<10} {'points':>8} {'scalar ms':>11} {'vector ms':>11} {'speedup':>9} {'max err':>11}")
+    for count in SIZES:
+        lats, lngs = _points(count)
+        pairs = list(zip(lats, lngs))
+
+        _report('distance', count, repeat,
+                lambda: [calculate_distance(lat, lng, a, b) for a, b in pairs],
+                lambda: haversine_one_to_many(lat, lng, lats, lngs))
+        _report('bearing', count, repeat,
+                lambda: [calculate_bearing(lat, lng, a, b) for a, b in pairs],
+                lambda: bearing_one_to_many(lat, lng, lats, lngs))
+        # Scalar arrival time: straight-line distance over SPEED_KMH, in minutes
+        _report('arrival', count, repeat,
+                lambda: [calculate_distance(lat, lng, a, b) / SPEED_KMH * 60 for a, b in pairs],
+                lambda: estimate_arrival_times(lat, lng, lats, lngs, SPEED_KMH)[1])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help='runs per measurement (best is reported)')
+    run(parser.parse_args().repeat)
@@ -0,0 +1,371 @@
+"""
+GPS Ingest Load Generator
+Simulates a fleet driving its RouteStop routes against a running server and measures the GPS write path
+
+Usage:
+    python benchmarks/load_gps.py [--buses N] [--rate HZ] [--duration S] [--mode single|batch|bus-batch]
+    python benchmarks/load_gps.py --provision N      (create N benchmark buses first, local database)
+    python benchmarks/load_gps.py --compare results/a.json results/b.json
+
+Requests are issued open-loop: every bus reports `rate` times a second
+whether or not earlier requests have finished, so a saturated server shows
+up as growing latency and lag rather than as a politely slower client.
+Each run is written to benchmarks/results/ as JSON for later comparison.
+"""
+
+import argparse
+import json
+import math
+import os
+import queue
+import random
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+DEFAULT_DB = os.path.join(BACKEND_DIR, 'instance', 'smart_bus.db')
+BENCH_PREFIX = 'BENCH'
+# Realistic coach speeds (km/h) and position noise (degrees, ~5 m)
+SPEED_RANGE_KMH = (35, 80)
+GPS_NOISE_DEG = 0.00005
+
+
+# ========== FLEET ==========
+
+class SimulatedBus:
+    """A bus driving back and forth along its stops at a steady speed"""
+
+    def __init__(self, bus_id, stops, rng):
+        self.bus_id = bus_id
+        self.stops = stops
+        self.speed_kmh = rng.uniform(*SPEED_RANGE_KMH)
+        self.rng = rng
+        self.legs = [_distance_km(a, b) for a, b in zip(stops, stops[1:])]
+        self.length_km = sum(self.legs) or 1.0
+        # Start somewhere along the route so the fleet is spread out
+        self.offset_km = rng.uniform(0, self.length_km)
+
+    def fix(self, elapsed_s):
+        travelled = (self.offset_km + elapsed_s * self.speed_kmh / 3600) % (2 * self.length_km)
+        forward = travelled <= self.length_km
+        distance = travelled if forward else 2 * self.length_km - travelled
+
+        a, b, t = self.stops[0], self.stops[-1], 1.0
+        for (start, end), length in zip(zip(self.stops, self.stops[1:]), self.legs):
+            if distance <= length:
+                a, b, t = start, end, (distance / length if length else 0.0)
+                break
+            distance -= length
+        if not forward:
+            a, b, t = b, a, 1.0 - t
+
+        heading = math.degrees(math.atan2(
+            (b[1] - a[1]) * math.cos(math.radians(a[0])), b[0] - a[0]
+        )) % 360
+        return {
+            'bus_id': self.bus_id,
+            'latitude': round(a[0] + (b[0] - a[0]) * t + self.rng.gauss(0, GPS_NOISE_DEG), 6),
+            'longitude': round(a[1] + (b[1] - a[1]) * t + self.rng.gauss(0, GPS_NOISE_DEG), 6),
+            'speed': round(self.speed_kmh + self.rng.gauss(0, 2), 1),
+            'heading': round(heading, 1),
+            'accuracy': round(self.rng.uniform(3, 15), 1),
+            'timestamp': time.time()
+        }
+
+
+def _distance_km(a, b):
+    dy = (b[0] - a[0]) * 110.574
+    dx = (b[1] - a[1]) * 111.32 * math.cos(math.radians((a[0] + b[0]) / 2))
+    return math.hypot(dx, dy)
+
+
+def load_fleet(session, base_url, count, seed):
+    """Simulated buses over the server's active buses that have at least two route stops"""
+    response = session.get(f'{base_url}/buses', timeout=10)
+    response.raise_for_status()
+    routes = {}
+    for bus in response.json()['buses']:
+        stops = session.get(f"{base_url}/api/gps/buses/{bus['id']}/route-stops", timeout=10).json()
+        if isinstance(stops, list) and len(stops) >= 2:
+            routes[bus['id']] = [(stop['latitude'], stop['longitude']) for stop in stops]
+    if not routes:
+        raise SystemExit('No active bus with at least two route stops (try --provision N)')
+
+    # Reuse bus ids when asked for more buses than exist
+    bus_ids = sorted(routes)
+    if len(bus_ids) < count:
+        print(f'note: {len(bus_ids)} buses with routes, {count} simulated; bus ids are shared')
+    rng = random.Random(seed)
+    return [SimulatedBus(bus_ids[index % len(bus_ids)], routes[bus_ids[index % len(bus_ids)]], rng)
+            for index in range(count)]
+
+
+def provision(count):
+    """Create up to `count` BENCH buses, each copying the stops of a seeded route (local database)"""
+    from app import app
+    from database import db, Bus, RouteStop
+
+    with app.app_context():
+        templates = {}
+        for stop in RouteStop.query.filter(~RouteStop.bus.has(Bus.bus_number.like(f'{BENCH_PREFIX}%'))) \
+                .order_by(RouteStop.bus_id, RouteStop.stop_order):
+            templates.setdefault(stop.bus_id, []).append(stop)
+        templates = [stops for stops in templates.values() if len(stops) >= 2]
+        if not templates:
+            raise SystemExit('No seeded route with at least two stops to copy (run migrations.py first)')
+
+        existing = Bus.query.filter(Bus.bus_number.like(f'{BENCH_PREFIX}%')).count()
+        for number in range(existing + 1, count + 1):
+            template = templates[number % len(templates)]
+            bus = Bus(
+                bus_number=f'{BENCH_PREFIX}{number:05d}',
+                driver_name='Load Test',
+                driver_phone='0000000000',
+                registration_number=f'{BENCH_PREFIX}-{number:05d}',
+                route=f'Benchmark {number}',
+                start_point=template[0].stop_name,
+                end_point=template[-1].stop_name,
+                status='active'
+            )
+            db.session.add(bus)
+            db.session.flush()
+            db.session.add_all([
+                RouteStop(bus_id=bus.id, stop_order=stop.stop_order, stop_name=stop.stop_name,
+                          latitude=stop.latitude, longitude=stop.longitude)
+                for stop in template
+            ])
+        db.session.commit()
+        print(f'{max(existing, count)} benchmark buses provisioned ({max(0, count - existing)} new)')
+
+
+# ========== LOAD ==========
+
+def _requests(mode, fleet, elapsed_s, batch_size):
+    """(method path, json body, fix count) items for one reporting tick"""
+    fixes = [bus.fix(elapsed_s) for bus in fleet]
+    if mode == 'single':
+        return [(f"/api/gps/buses/{fix['bus_id']}/location", fix, 1) for fix in fixes]
+    if mode == 'bus-batch':
+        by_bus = {}
+        for fix in fixes:
+            by_bus.setdefault(fix['bus_id'], []).append(fix)
+        return [(f'/api/gps/buses/{bus_id}/locations/batch', {'fixes': bus_fixes}, len(bus_fixes))
+                for bus_id, bus_fixes in by_bus.items()]
+    return [('/api/gps/locations/batch', {'fixes': fixes[start:start + batch_size]},
+             len(fixes[start:start + batch_size]))
+            for start in range(0, len(fixes), batch_size)]
+
+
+def run_load(args, fleet):
+    """Drive the server for args.duration seconds; returns raw measurements"""
+    work = queue.Queue()
+    latencies = []
+    lags = []
+    counts = {'requests': 0, 'fixes': 0, 'errors': 0, 'status': {}}
+    lock = threading.Lock()
+
+    def worker():
+        session = requests.Session()
+        while True:
+            item = work.get()
+            if item is None:
+                return
+            path, body, fixes, scheduled = item
+            started = time.perf_counter()
+            try:
+                response = session.post(args.base_url + path, json=body, timeout=30)
+                status = response.status_code
+            except requests.RequestException:
+                status = 'error'
+            finished = time.perf_counter()
+            with lock:
+                latencies.append(finished - started)
+                lags.append(started - scheduled)
+                counts['requests'] += 1
+                counts['status'][str(status)] = counts['status'].get(str(status), 0) + 1
+                if status == 200:
+                    counts['fixes'] += fixes
+                else:
+                    counts['errors'] += 1
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+
+    interval = 1.0 / args.rate
+    start = time.perf_counter()
+    tick = 0
+    while True:
+        scheduled = start + tick * interval
+        if scheduled - start >= args.duration:
+            break
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        for path, body, fixes in _requests(args.mode, fleet, scheduled - start, args.batch_size):
+            work.put((path, body, fixes, scheduled))
+        tick += 1
+
+    for _ in threads:
+        work.put(None)
+    for thread in threads:
+        thread.join()
+    # The last tick's interval counts even when its requests finished early
+    counts['wall_seconds'] = max(args.duration, time.perf_counter() - start)
+    return latencies, lags, counts
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def db_snapshot(path):
+    """File size and gps_trackers rows of a SQLite database, or None when unavailable"""
+    if not path or not os.path.exists(path):
+        return None
+    size = sum(os.path.getsize(path + suffix) for suffix in ('', '-wal') if os.path.exists(path + suffix))
+    try:
+        with sqlite3.connect(f'file:{path}?mode=ro', uri=True) as conn:
+            rows = conn.execute('SELECT COUNT(*) FROM gps_trackers').fetchone()[0]
+    except sqlite3.Error:
+        rows = None
+    return {'bytes': size, 'gps_rows': rows}
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ========== REPORTING ==========
+
+def summarize(args, fleet, latencies, lags, counts, before, after):
+    wall = counts['wall_seconds']
+    result = {
+        'recorded_at': datetime.utcnow().isoformat(),
+        'revision': _git_revision(),
+        'config': {
+            'base_url': args.base_url,
+            'mode': args.mode,
+            'buses': len(fleet),
+            'distinct_bus_ids': len({bus.bus_id for bus in fleet}),
+            'rate_hz': args.rate,
+            'batch_size': args.batch_size if args.mode == 'batch' else None,
+            'duration_s': args.duration,
+            'concurrency': args.concurrency
+        },
+        'throughput': {
+            'requests_per_s': round(counts['requests'] / wall, 1),
+            'fixes_per_s': round(counts['fixes'] / wall, 1),
+            'offered_fixes_per_s': round(len(fleet) * args.rate, 1),
+            'errors': counts['errors'],
+            'status': counts['status']
+        },
+        'latency_ms': {
+            name: round(_percentile(latencies, q) * 1000, 2) if latencies else None
+            for name, q in (('p50', 50), ('p95', 95), ('p99', 99), ('max', 100))
+        },
+        'max_lag_ms': round(max(lags) * 1000, 1) if lags else None,
+        'db': None
+    }
+    if before and after:
+        rows = (after['gps_rows'] - before['gps_rows']) if None not in (after['gps_rows'], before['gps_rows']) else None
+        growth = after['bytes'] - before['bytes']
+        result['db'] = {
+            'path': args.db,
+            'bytes_added': growth,
+            'rows_added': rows,
+            'bytes_per_fix': round(growth / counts['fixes'], 1) if counts['fixes'] else None,
+            'rows_per_fix': round(rows / counts['fixes'], 3) if rows is not None and counts['fixes'] else None
+        }
+    return result
+
+
+def print_result(result):
+    config, throughput, latency = result['config'], result['throughput'], result['latency_ms']
+    print(f"{config['mode']}: {config['buses']} buses at {config['rate_hz']} Hz for {config['duration_s']}s "
+          f"({config['concurrency']} connections, revision {result['revision']})")
+    print(f"  throughput  {throughput['fixes_per_s']:,.1f} fixes/s of {throughput['offered_fixes_per_s']:,.1f} offered, "
+          f"{throughput['requests_per_s']:,.1f} requests/s, {throughput['errors']} errors")
+    print(f"  latency ms  p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}  "
+          f"(max lag {result['max_lag_ms']} ms)")
+    if result['db']:
+        db = result['db']
+        print(f"  db growth   {db['bytes_added']:,} bytes, {db['rows_added']} rows "
+              f"({db['bytes_per_fix']} bytes and {db['rows_per_fix']} rows per fix)")
+
+
+def compare(paths):
+    """Side-by-side summary of saved runs"""
+    runs = []
+    for path in paths:
+        with open(path) as handle:
+            runs.append(json.load(handle))
+    print(f"{'run':<32} {'rev':<9} {'mode':<10} {'buses':>6} {'fixes/s':>10} {'p50':>8} {'p95':>8} {'p99':>8} {'B/fix':>8}")
+    for path, run in zip(paths, runs):
+        latency = run['latency_ms']
+        db = run.get('db') or {}
+        print(f"{os.path.basename(path)[:32]:<32} {str(run.get('revision')):<9} {run['config']['mode']:<10} "
+              f"{run['config']['buses']:>6} {run['throughput']['fixes_per_s']:>10,.1f} "
+              f"{latency['p50']:>8} {latency['p95']:>8} {latency['p99']:>8} {str(db.get('bytes_per_fix')):>8}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--base-url', default='http://localhost:5000')
+    parser.add_argument('--buses', type=int, default=100, help='simulated buses')
+    parser.add_argument('--rate', type=float, default=1.0, help='fixes per bus per second')
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds of load')
+    parser.add_argument('--mode', choices=('single', 'batch', 'bus-batch'), default='single',
+                        help='one fix per request, fleet-wide batches, or one batch per bus per tick')
+    parser.add_argument('--batch-size', type=int, default=500, help='fixes per request in batch mode')
+    parser.add_argument('--concurrency', type=int, default=16, help='parallel HTTP connections')
+    parser.add_argument('--db', default=DEFAULT_DB, help='SQLite file to measure growth of')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='result file (default: results/<time>-<mode>.json)')
+    parser.add_argument('--provision', type=int, metavar='N', help='create N benchmark buses and exit')
+    parser.add_argument('--compare', nargs='+', metavar='RESULT', help='compare saved runs and exit')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.compare)
+        sys.exit(0)
+    if args.provision:
+        provision(args.provision)
+        sys.exit(0)
+
+    session = requests.Session()
+    fleet = load_fleet(session, args.base_url, args.buses, args.seed)
+    before = db_snapshot(args.db)
+    latencies, lags, counts = run_load(args, fleet)
+    # Let a write-behind buffer drain before measuring growth
+    time.sleep(2)
+    after = db_snapshot(args.db)
+
+    result = summarize(args, fleet, latencies, lags, counts, before, after)
+    print_result(result)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{args.mode}-{len(fleet)}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as handle:
+        json.dump(result, handle, indent=2)
+    print(f'  saved to {output}')
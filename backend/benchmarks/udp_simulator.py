@@ -0,0 +1,164 @@
+"""
+UDP Fleet Simulator
+Replays a fleet of buses as binary GPS datagrams, or measures how fast one core decodes them
+
+Usage:
+    python benchmarks/udp_simulator.py [--buses N] [--rate HZ] [--duration S] [--processes P]
+    python benchmarks/udp_simulator.py --sink [--duration S]
+
+Sending with --rate 0 floods as fast as possible. The sink binds the port
+itself and only decodes, giving the per-core ceiling of the wire format;
+compare with GET /api/gps/udp/stats of a running server for the full
+ingest pipeline.
+"""
+
+import argparse
+import math
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gps_udp import RECORD, encode_record, decode_datagram  # noqa: E402
+
+# Seed route (Delhi ISBT -> Gurgaon -> Faridabad -> Jaipur Station, see migrations.py)
+ROUTE = [(28.6139, 77.2090), (28.4595, 77.0266), (28.4089, 77.3178), (26.8124, 75.8231)]
+SPEED_KMH = 60
+
+
+def _leg_lengths():
+    lengths = []
+    for (lat1, lng1), (lat2, lng2) in zip(ROUTE, ROUTE[1:]):
+        dy = (lat2 - lat1) * 110.574
+        dx = (lng2 - lng1) * 111.32 * math.cos(math.radians((lat1 + lat2) / 2))
+        lengths.append(math.hypot(dx, dy))
+    return lengths
+
+
+LEGS = _leg_lengths()
+ROUTE_KM = sum(LEGS)
+
+
+def position(distance_km):
+    """(latitude, longitude, heading) at a distance along the route, looping"""
+    distance_km %= ROUTE_KM
+    for (lat1, lng1), (lat2, lng2), length in zip(ROUTE, ROUTE[1:], LEGS):
+        if distance_km <= length:
+            t = distance_km / length
+            heading = math.degrees(math.atan2(
+                (lng2 - lng1) * math.cos(math.radians(lat1)), lat2 - lat1
+            )) % 360
+            return lat1 + (lat2 - lat1) * t, lng1 + (lng2 - lng1) * t, heading
+        distance_km -= length
+    return ROUTE[-1][0], ROUTE[-1][1], 0.0
+
+
+def send(args, bus_ids, results):
+    """Send fixes for a share of the fleet; records (packets, records, seconds)"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    target = (args.host, args.port)
+    # Spread the buses along the route
+    offsets = {bus_id: (index * ROUTE_KM / max(1, args.buses)) for index, bus_id in enumerate(bus_ids)}
+    interval = 1.0 / args.rate if args.rate else 0.0
+
+    packets = records = 0
+    start = time.perf_counter()
+    tick = 0
+    while time.perf_counter() - start < args.duration:
+        now = time.time()
+        travelled = (time.perf_counter() - start) * SPEED_KMH / 3600
+        batch = []
+        for bus_id in bus_ids:
+            lat, lng, heading = position(offsets[bus_id] + travelled)
+            batch.append(encode_record(bus_id, lat, lng, SPEED_KMH, heading, now))
+            if len(batch) == args.records_per_packet:
+                sock.sendto(b''.join(batch), target)
+                packets += 1
+                records += len(batch)
+                batch = []
+        if batch:
+            sock.sendto(b''.join(batch), target)
+            packets += 1
+            records += len(batch)
+
+        tick += 1
+        if interval:
+            delay = start + tick * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    results.put((packets, records, time.perf_counter() - start))
+
+
+def run_senders(args):
+    bus_ids = list(range(args.first_bus_id, args.first_bus_id + args.buses))
+    shares = [bus_ids[index::args.processes] for index in range(args.processes)]
+    results = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=send, args=(args, share, results))
+        for share in shares if share
+    ]
+    for worker in workers:
+        worker.start()
+    totals = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+
+    packets = sum(total[0] for total in totals)
+    records = sum(total[1] for total in totals)
+    seconds = max(total[2] for total in totals)
+    print(f"sent {packets} packets / {records} records in {seconds:.1f}s "
+          f"from {len(workers)} process(es) ({RECORD.size} bytes per record)")
+    print(f"  {packets / seconds:,.0f} packets/s, {records / seconds:,.0f} records/s, "
+          f"{packets / seconds / len(workers):,.0f} packets/s per process")
+
+
+def run_sink(args):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+    sock.bind((args.host, args.port))
+    sock.settimeout(1.0)
+    print(f"sink listening on {args.host}:{args.port} for {args.duration}s")
+
+    packets = records = malformed = 0
+    busy = 0.0
+    start = time.perf_counter()
+    while time.perf_counter() - start < args.duration:
+        try:
+            data, _ = sock.recvfrom(65535)
+        except socket.timeout:
+            continue
+        began = time.perf_counter()
+        fixes = decode_datagram(data)
+        busy += time.perf_counter() - began
+        packets += 1
+        if fixes is None:
+            malformed += 1
+        else:
+            records += len(fixes)
+
+    elapsed = time.perf_counter() - start
+    print(f"received {packets} packets / {records} records ({malformed} malformed) in {elapsed:.1f}s")
+    print(f"  {packets / elapsed:,.0f} packets/s received")
+    if busy:
+        print(f"  decode alone: {packets / busy:,.0f} packets/s, {records / busy:,.0f} records/s on one core")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--buses', type=int, default=100, help='simulated buses')
+    parser.add_argument('--first-bus-id', type=int, default=1, help='bus ids are consecutive from here')
+    parser.add_argument('--rate', type=float, default=1.0, help='fixes per bus per second (0 = flood)')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds to run')
+    parser.add_argument('--records-per-packet', type=int, default=1, help='records packed into one datagram')
+    parser.add_argument('--processes', type=int, default=1, help='sender processes')
+    parser.add_argument('--sink', action='store_true', help='receive and decode instead of sending')
+    args = parser.parse_args()
+    if args.sink:
+        run_sink(args)
+    else:
+        run_senders(args)
@@ -1,7 +1,110 @@
 import os
 from datetime import timedelta
 
-class Config:
+class GPSConfig:
+    """GPS tracking pipeline configuration"""
+    
+    # Write-behind buffer (off by default: every fix is committed immediately)
+    GPS_WRITE_BEHIND = os.environ.get('GPS_WRITE_BEHIND', 'False') == 'True'
+    GPS_FLUSH_INTERVAL_MS = int(os.environ.get('GPS_FLUSH_INTERVAL_MS', 1000))
+    GPS_FLUSH_MAX_ROWS = int(os.environ.get('GPS_FLUSH_MAX_ROWS', 2000))
+    GPS_MAX_LOSS_MS = int(os.environ.get('GPS_MAX_LOSS_MS', 5000))
+    GPS_BUFFER_CAPACITY_PER_BUS = int(os.environ.get('GPS_BUFFER_CAPACITY_PER_BUS', 600))
+    GPS_BUFFER_BLOCK_TIMEOUT_MS = int(os.environ.get('GPS_BUFFER_BLOCK_TIMEOUT_MS', 200))
+    # Failed flushes in a row before a batch is split to set its bad rows aside
+    GPS_FLUSH_MAX_RETRIES = int(os.environ.get('GPS_FLUSH_MAX_RETRIES', 3))
+    GPS_DEAD_LETTER_CAPACITY = int(os.environ.get('GPS_DEAD_LETTER_CAPACITY', 10000))
+    
+    # Live fleet state: 'memory' (per process) or 'sqlite' (shared by all workers)
+    GPS_LIVE_STATE_BACKEND = os.environ.get('GPS_LIVE_STATE_BACKEND', 'memory')
+    GPS_LIVE_STATE_PATH = os.environ.get('GPS_LIVE_STATE_PATH', 'instance/live_state.db')
+    # 'memory' only: seconds before a worker re-reads bus_latest_positions to
+    # pick up fixes and status changes handled by other workers
+    GPS_LIVE_STATE_MAX_AGE_S = float(os.environ.get('GPS_LIVE_STATE_MAX_AGE_S', 5))
+    
+    # Server-Sent Events position stream
+    GPS_STREAM_MAX_SUBSCRIBERS = int(os.environ.get('GPS_STREAM_MAX_SUBSCRIBERS', 5000))
+    GPS_STREAM_POLL_MS = int(os.environ.get('GPS_STREAM_POLL_MS', 500))
+    
+    # Spatial grid over current bus positions (degrees per cell)
+    GPS_SPATIAL_CELL_DEG = float(os.environ.get('GPS_SPATIAL_CELL_DEG', 0.05))
+    
+    # Ingest filter: a fix is written only if the bus moved GPS_FILTER_MIN_DISTANCE_M,
+    # turned GPS_FILTER_MIN_HEADING_DEG or was silent GPS_FILTER_KEEPALIVE_S;
+    # fixes less accurate than GPS_FILTER_MAX_ACCURACY_M are rejected (0 = no limit)
+    GPS_FILTER_ENABLED = os.environ.get('GPS_FILTER_ENABLED', 'True') == 'True'
+    GPS_FILTER_MIN_DISTANCE_M = float(os.environ.get('GPS_FILTER_MIN_DISTANCE_M', 10))
+    GPS_FILTER_MIN_HEADING_DEG = float(os.environ.get('GPS_FILTER_MIN_HEADING_DEG', 20))
+    GPS_FILTER_MAX_ACCURACY_M = float(os.environ.get('GPS_FILTER_MAX_ACCURACY_M', 100))
+    GPS_FILTER_KEEPALIVE_S = int(os.environ.get('GPS_FILTER_KEEPALIVE_S', 60))
+    
+    # Binary UDP ingest (20-byte records, see gps_udp.py); off by default
+    GPS_UDP_ENABLED = os.environ.get('GPS_UDP_ENABLED', 'False') == 'True'
+    GPS_UDP_HOST = os.environ.get('GPS_UDP_HOST', '0.0.0.0')
+    GPS_UDP_PORT = int(os.environ.get('GPS_UDP_PORT', 5055))
+    GPS_UDP_BATCH_MS = int(os.environ.get('GPS_UDP_BATCH_MS', 200))
+    
+    # Post-ingest processing (geofences, arrivals, ETAs) in worker processes
+    # sharded by bus_id; 0 runs it inline in the request thread
+    GPS_PIPELINE_WORKERS = int(os.environ.get('GPS_PIPELINE_WORKERS', 0))
+    GPS_PIPELINE_QUEUE_SIZE = int(os.environ.get('GPS_PIPELINE_QUEUE_SIZE', 1000))
+    GPS_PIPELINE_PUT_TIMEOUT_MS = int(os.environ.get('GPS_PIPELINE_PUT_TIMEOUT_MS', 1000))
+    
+    # Retention: raw gps_trackers rows are kept GPS_RAW_RETENTION_DAYS, then rolled
+    # into gps_track_samples tiers given as resolution_seconds:max_age_days,
+    # finest first (max_age_days 0 keeps that tier forever)
+    GPS_RAW_RETENTION_DAYS = int(os.environ.get('GPS_RAW_RETENTION_DAYS', 7))
+    GPS_RETENTION_TIERS = os.environ.get('GPS_RETENTION_TIERS', '30:90,300:730')
+    GPS_RETENTION_BATCH_SIZE = int(os.environ.get('GPS_RETENTION_BATCH_SIZE', 2000))
+    GPS_RETENTION_BATCH_PAUSE_MS = int(os.environ.get('GPS_RETENTION_BATCH_PAUSE_MS', 50))
+    
+    # Cold archive: closed days older than GPS_ARCHIVE_AFTER_DAYS move from
+    # gps_trackers into per-bus columnar files under GPS_ARCHIVE_PATH
+    GPS_ARCHIVE_ENABLED = os.environ.get('GPS_ARCHIVE_ENABLED', 'False') == 'True'
+    GPS_ARCHIVE_PATH = os.environ.get('GPS_ARCHIVE_PATH', 'instance/gps_archive')
+    GPS_ARCHIVE_AFTER_DAYS = int(os.environ.get('GPS_ARCHIVE_AFTER_DAYS', 2))
+    
+    # ETA engine: learned per-segment travel times, refreshed every
+    # ETA_REFRESH_INTERVAL_S (0 = only on demand); unknown segments use the fallback speed
+    ETA_FALLBACK_SPEED_KMH = float(os.environ.get('ETA_FALLBACK_SPEED_KMH', 40))
+    ETA_REFRESH_INTERVAL_S = int(os.environ.get('ETA_REFRESH_INTERVAL_S', 300))
+    ETA_STOP_RADIUS_M = float(os.environ.get('ETA_STOP_RADIUS_M', 75))
+    ETA_EWMA_ALPHA = float(os.environ.get('ETA_EWMA_ALPHA', 0.2))
+    ETA_HISTORY_DAYS = int(os.environ.get('ETA_HISTORY_DAYS', 14))
+    ETA_MAX_FIXES_PER_REFRESH = int(os.environ.get('ETA_MAX_FIXES_PER_REFRESH', 20000))
+    
+    # Next-stop index: grid over route segments (degrees per cell, ~1.1 km)
+    STOP_INDEX_CELL_DEG = float(os.environ.get('STOP_INDEX_CELL_DEG', 0.01))
+    
+    # Map matching: fixes farther than MAP_MATCH_MAX_OFFSET_M from the route are
+    # unmatched; MAP_MATCH_WINDOW segments ahead of the last match are tried first
+    MAP_MATCH_MAX_OFFSET_M = float(os.environ.get('MAP_MATCH_MAX_OFFSET_M', 150))
+    MAP_MATCH_WINDOW = int(os.environ.get('MAP_MATCH_WINDOW', 8))
+    
+    # Geofences for wake-up alerts and announcements: grid cell (degrees, also the
+    # farthest a fence fires from), arrival radius and reload period of cached fences
+    GEOFENCE_CELL_DEG = float(os.environ.get('GEOFENCE_CELL_DEG', 0.02))
+    GEOFENCE_ARRIVAL_RADIUS_M = float(os.environ.get('GEOFENCE_ARRIVAL_RADIUS_M', 100))
+    GEOFENCE_MIN_SPEED_KMH = float(os.environ.get('GEOFENCE_MIN_SPEED_KMH', 10))
+    GEOFENCE_RELOAD_S = int(os.environ.get('GEOFENCE_RELOAD_S', 30))
+    
+    # Automatic stop arrivals: a bus within ARRIVAL_RADIUS_M of a stop for
+    # ARRIVAL_DWELL_S has arrived; leaving the radius is the departure
+    ARRIVAL_RADIUS_M = float(os.environ.get('ARRIVAL_RADIUS_M', 50))
+    ARRIVAL_DWELL_S = int(os.environ.get('ARRIVAL_DWELL_S', 20))
+
+
+class BookingConfig:
+    """Seat booking configuration"""
+    
+    # Seat holds: an unpaid booking holds its seat SEAT_HOLD_TTL_S; the reaper checks
+    # for expired holds every SEAT_HOLD_TICK_S and sweeps the seats table every SEAT_HOLD_SWEEP_S
+    SEAT_HOLD_TTL_S = int(os.environ.get('SEAT_HOLD_TTL_S', 600))
+    SEAT_HOLD_TICK_S = float(os.environ.get('SEAT_HOLD_TICK_S', 1))
+    SEAT_HOLD_SWEEP_S = int(os.environ.get('SEAT_HOLD_SWEEP_S', 60))
+
+
+class Config(GPSConfig, BookingConfig):
     """Base configuration"""
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///smart_bus.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
@@ -92,6 +92,7 @@ class Bus(db.Model):
     # Status
     status = db.Column(db.String(20), default='active')  # active, inactive, maintenance
     is_available = db.Column(db.Boolean, default=True)
+    seat_version = db.Column(db.Integer, default=0)  # bumped with every seat reservation change
     
     # Amenities
     amenities = db.Column(db.JSON, nullable=True)  # wifi, usb_charging, water, etc.
@@ -108,6 +109,7 @@ class Bus(db.Model):
     seats = db.relationship('Seat', backref='bus', lazy=True, cascade='all, delete-orphan')
     bookings = db.relationship('Booking', backref='bus', lazy=True, cascade='all, delete-orphan')
     gps_trackers = db.relationship('GPSTracker', backref='bus', lazy=True, cascade='all, delete-orphan')
+    latest_position = db.relationship('BusLatestPosition', backref='bus', uselist=False, cascade='all, delete-orphan')
     route_stops = db.relationship('RouteStop', backref='bus', lazy=True, cascade='all, delete-orphan')
     announcements = db.relationship('Announcement', backref='bus', lazy=True, cascade='all, delete-orphan')
     emergencies = db.relationship('Emergency', backref='bus', lazy=True, cascade='all, delete-orphan')
@@ -116,14 +118,23 @@ class Bus(db.Model):
     def __repr__(self):
         return f'<Bus {self.bus_number}>'
     
-    def to_dict(self):
+    def to_dict(self, taken=0, seat_map=None):
+        """Bus summary with its free seats
+        
+        Args:
+            taken: mask of the seats taken on the travel date; list callers
+                fetch it for every bus at once with InventoryOperations.get_day_masks
+            seat_map: the bus's SeatMap when already loaded (seat_maps.get_for_buses)"""
+        if seat_map is None:
+            from seat_map import seat_maps
+            seat_map = seat_maps.get(self.id, self.seat_version or 0)
         return {
             'id': self.id,
             'bus_number': self.bus_number,
             'driver_name': self.driver_name,
             'route': self.route,
             'total_seats': self.total_seats,
-            'available_seats': sum(1 for seat in self.seats if not seat.is_reserved),
+            'available_seats': seat_map.count_available(taken),
             'status': self.status,
             'current_lat': self.current_lat,
             'current_lng': self.current_lng
@@ -166,6 +177,26 @@ class Seat(db.Model):
         }
 
 
+class SeatInventory(db.Model):
+    __tablename__ = 'seat_inventory'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    bus_id = db.Column(db.Integer, db.ForeignKey('buses.id'), nullable=False)
+    travel_date = db.Column(db.Date, nullable=False)
+    
+    # Seats taken on this date as a little-endian bitset (bit n - 1 is seat n)
+    reserved_mask = db.Column(db.LargeBinary, nullable=False, default=b'')
+    reserved_count = db.Column(db.Integer, default=0)
+    version = db.Column(db.Integer, nullable=False, default=0)  # compare-and-set token
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # One row per bus and date; the index also serves date-range reads
+    __table_args__ = (db.UniqueConstraint('bus_id', 'travel_date', name='_bus_travel_date_uc'),)
+    
+    def __repr__(self):
+        return f'<SeatInventory Bus:{self.bus_id} {self.travel_date} reserved:{self.reserved_count}>'
+
+
 # ========== BOOKING & PAYMENT MODELS ==========
 
 class Booking(db.Model):
@@ -193,6 +224,7 @@ class Booking(db.Model):
     status = db.Column(db.String(20), default='pending')  # pending, confirmed, cancelled, completed
     cancellation_reason = db.Column(db.String(255), nullable=True)
     cancelled_at = db.Column(db.DateTime, nullable=True)
+    hold_expires_at = db.Column(db.DateTime, nullable=True, index=True)  # seat held until paid or expired
     
     # Timestamps
     booking_date = db.Column(db.DateTime, default=datetime.utcnow, index=True)
@@ -358,6 +390,9 @@ class GPSTracker(db.Model):
     accuracy = db.Column(db.Float, default=0)
     altitude = db.Column(db.Float, default=0)
     
+    # Map-matched distance along the bus's route (km), None when off route
+    distance_along_route = db.Column(db.Float, nullable=True)
+    
     # Status
     is_active = db.Column(db.Boolean, default=True)
     
@@ -377,6 +412,85 @@ class GPSTracker(db.Model):
         }
 
 
+# Downsampled GPS track: one point per bus per `resolution`-second bucket,
+# filled by the retention job as raw fixes age out (see retention.py)
+class GPSTrackSample(db.Model):
+    __tablename__ = 'gps_track_samples'
+    __table_args__ = (
+        db.UniqueConstraint('bus_id', 'resolution', 'bucket', name='uq_gps_track_sample_bucket'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    bus_id = db.Column(db.Integer, db.ForeignKey('buses.id'), nullable=False, index=True)
+    
+    # Bucket width in seconds and bucket number (seconds since epoch // resolution)
+    resolution = db.Column(db.Integer, nullable=False)
+    bucket = db.Column(db.Integer, nullable=False)
+    
+    # First fix of the bucket
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    speed = db.Column(db.Float, default=0)
+    heading = db.Column(db.Float, default=0)
+    timestamp = db.Column(db.DateTime, nullable=False, index=True)
+    
+    # Number of raw fixes folded into this sample
+    point_count = db.Column(db.Integer, default=1)
+    
+    def __repr__(self):
+        return f'<GPSTrackSample Bus:{self.bus_id} {self.resolution}s>'
+    
+    def to_dict(self):
+        return {
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+            'speed': self.speed,
+            'heading': self.heading,
+            'timestamp': self.timestamp.isoformat(),
+            'resolution': self.resolution,
+            'point_count': self.point_count
+        }
+
+
+# Newest GPS fix per bus, upserted on ingest so fleet snapshots are one query
+class BusLatestPosition(db.Model):
+    __tablename__ = 'bus_latest_positions'
+    
+    bus_id = db.Column(db.Integer, db.ForeignKey('buses.id'), primary_key=True)
+    
+    # Location
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    
+    # Movement details
+    speed = db.Column(db.Float, default=0)
+    heading = db.Column(db.Float, default=0)
+    accuracy = db.Column(db.Float, default=0)
+    altitude = db.Column(db.Float, default=0)
+    
+    # Map-matched distance along the bus's route (km)
+    distance_along_route = db.Column(db.Float, nullable=True)
+    
+    # Timestamp of the fix (not of the upsert)
+    timestamp = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<BusLatestPosition Bus:{self.bus_id}>'
+    
+    def to_dict(self):
+        return {
+            'bus_id': self.bus_id,
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+            'speed': self.speed,
+            'heading': self.heading,
+            'accuracy': self.accuracy,
+            'altitude': self.altitude,
+            'distance_along_route': self.distance_along_route,
+            'timestamp': self.timestamp.isoformat()
+        }
+
+
 class RouteStop(db.Model):
     __tablename__ = 'route_stops'
     
@@ -395,6 +509,7 @@ class RouteStop(db.Model):
     # Time
     estimated_arrival = db.Column(db.DateTime, nullable=True)
     actual_arrival = db.Column(db.DateTime, nullable=True)
+    actual_departure = db.Column(db.DateTime, nullable=True)
     
     # Status
     is_completed = db.Column(db.Boolean, default=False)
@@ -406,6 +521,71 @@ class RouteStop(db.Model):
         return f'<RouteStop {self.stop_name}>'
 
 
+# Uploaded road geometry of a bus's route, used by map matching instead of
+# straight lines between stops (see map_matching.py)
+class RouteShape(db.Model):
+    __tablename__ = 'route_shapes'
+    
+    bus_id = db.Column(db.Integer, db.ForeignKey('buses.id'), primary_key=True)
+    points = db.Column(db.JSON, nullable=False)  # [[lat, lng], ...] in travel order
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<RouteShape Bus:{self.bus_id} ({len(self.points or [])} points)>'
+
+
+# Learned travel time between two consecutive stops, per hour of day (UTC).
+# Segments are keyed by their end-point coordinates, so they survive route
+# stop rewrites and are shared by buses serving the same stops (see eta_engine.py)
+class SegmentTravelTime(db.Model):
+    __tablename__ = 'segment_travel_times'
+    __table_args__ = (
+        db.UniqueConstraint('segment_key', 'hour', name='uq_segment_travel_time_hour'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    segment_key = db.Column(db.String(64), nullable=False, index=True)
+    hour = db.Column(db.Integer, nullable=False)
+    
+    # Exponentially weighted mean of observed travel times
+    mean_seconds = db.Column(db.Float, nullable=False)
+    samples = db.Column(db.Integer, default=0)
+    
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<SegmentTravelTime {self.segment_key} @{self.hour}h>'
+
+
+# Per-bus progress of the incremental segment refresh
+class ETARefreshState(db.Model):
+    __tablename__ = 'eta_refresh_states'
+    
+    bus_id = db.Column(db.Integer, db.ForeignKey('buses.id'), primary_key=True)
+    last_fix_at = db.Column(db.DateTime, nullable=True)
+    last_arrival_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ETARefreshState Bus:{self.bus_id}>'
+
+
+# Store-and-forward progress of a driver device (see POST /api/gps/devices/<id>/sync).
+# Sequence numbers start at 1; acked_seq is the highest contiguous one stored and
+# received_seqs lists those already stored above it (gaps still to be filled)
+class DeviceSyncState(db.Model):
+    __tablename__ = 'device_sync_states'
+    
+    device_id = db.Column(db.String(64), primary_key=True)
+    bus_id = db.Column(db.Integer, db.ForeignKey('buses.id'), nullable=False)
+    acked_seq = db.Column(db.BigInteger, nullable=False, default=0)
+    received_seqs = db.Column(db.JSON, nullable=False, default=list)
+    last_sync_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<DeviceSyncState {self.device_id} Bus:{self.bus_id} ack:{self.acked_seq}>'
+
+
 # ========== ANNOUNCEMENT & ALERT MODELS ==========
 
 class Announcement(db.Model):
@@ -3,12 +3,19 @@ Database Operations Module
 Contains all database query operations for the Smart Bus Management System
 """
 
+import uuid
 from datetime import datetime, timedelta
-from sqlalchemy import func, and_, or_
+from sqlalchemy import func, and_, or_, bindparam, exists
 from database import db, User, Bus, Seat, Booking, Payment, Wallet, GPSTracker
 from database import RouteStop, Announcement, WakeUpAlert, Emergency, LostItem
 from database import AdminUser, AdminLog, BusReview, Notification, PromoCode
-from database import WalletTransaction, Refund, SystemReport
+from database import WalletTransaction, Refund, SystemReport, BusLatestPosition, GPSTrackSample
+from database import SegmentTravelTime, ETARefreshState, RouteShape, DeviceSyncState, SeatInventory
+from gps_buffer import gps_write_buffer
+from geofence import geofence_engine
+from gps_pipeline import gps_pipeline
+from seat_map import seat_maps, mask_to_bytes, mask_from_bytes
+from seat_holds import seat_holds
 
 # ==================== USER OPERATIONS ====================
 
@@ -180,8 +187,10 @@ class BusOperations:
                     is_women_seat=(seat_num <= women_seats)
                 )
                 db.session.add(seat)
+            SeatOperations.bump_version(bus_id)
             
             db.session.commit()
+            seat_maps.invalidate(bus_id)
             return True, None
         except Exception as e:
             db.session.rollback()
@@ -207,29 +216,35 @@ class BusOperations:
             return None, str(e)
     
     @staticmethod
-    def get_available_seats(bus_id):
-        """Get available seats for a bus"""
-        return Seat.query.filter(
+    def get_available_seats(bus_id, travel_date=None):
+        """Get seats of a bus free on a travel date (default today)"""
+        taken = BusOperations._taken_numbers(bus_id, travel_date)
+        return [seat for seat in Seat.query.filter(
             Seat.bus_id == bus_id,
             Seat.is_reserved == False
-        ).all()
+        ).all() if seat.seat_number not in taken]
     
     @staticmethod
-    def get_reserved_seats(bus_id):
-        """Get reserved seats for a bus"""
-        return Seat.query.filter(
-            Seat.bus_id == bus_id,
-            Seat.is_reserved == True
-        ).all()
+    def get_reserved_seats(bus_id, travel_date=None):
+        """Get seats of a bus reserved on a travel date (default today)"""
+        taken = BusOperations._taken_numbers(bus_id, travel_date)
+        return [seat for seat in Seat.query.filter(Seat.bus_id == bus_id).all()
+                if seat.is_reserved or seat.seat_number in taken]
     
     @staticmethod
-    def get_bus_occupancy(bus_id):
-        """Get bus occupancy percentage"""
+    def _taken_numbers(bus_id, travel_date=None):
+        """Seat numbers taken by bookings on a travel date"""
+        mask = InventoryOperations.get_day_masks([bus_id], travel_date or datetime.utcnow().date()).get(bus_id, 0)
+        return {index + 1 for index in range(mask.bit_length()) if mask >> index & 1}
+    
+    @staticmethod
+    def get_bus_occupancy(bus_id, travel_date=None):
+        """Get bus occupancy percentage on a travel date (default today)"""
         bus = Bus.query.get(bus_id)
         if not bus:
             return 0
         
-        reserved = len(BusOperations.get_reserved_seats(bus_id))
+        reserved = len(BusOperations.get_reserved_seats(bus_id, travel_date))
         return (reserved / bus.total_seats) * 100
     
     @staticmethod
@@ -240,6 +255,16 @@ class BusOperations:
             if not bus:
                 return None, "Bus not found"
             
+            # Write-behind mode: queue the fix, the flusher updates the bus row
+            if gps_write_buffer.enabled:
+                accepted, error = gps_write_buffer.append({
+                    'bus_id': bus_id,
+                    'latitude': latitude,
+                    'longitude': longitude,
+                    'timestamp': datetime.utcnow()
+                })
+                return (bus, None) if accepted else (None, error)
+            
             bus.current_lat = latitude
             bus.current_lng = longitude
             bus.last_location_update = datetime.utcnow()
@@ -248,9 +273,16 @@ class BusOperations:
             gps_tracker = GPSTracker(
                 bus_id=bus_id,
                 latitude=latitude,
-                longitude=longitude
+                longitude=longitude,
+                timestamp=bus.last_location_update
             )
             db.session.add(gps_tracker)
+            GPSOperations.upsert_latest_positions([{
+                'bus_id': bus_id,
+                'latitude': latitude,
+                'longitude': longitude,
+                'timestamp': bus.last_location_update
+            }])
             db.session.commit()
             
             return bus, None
@@ -267,6 +299,326 @@ class BusOperations:
                 Bus.route.ilike(f'%{query}%')
             )
         ).all()
+    
+    @staticmethod
+    def get_seat_states(bus_ids):
+        """Seat flags of several buses as plain rows, without loading Seat objects
+         Args:
+            bus_ids: IDs of the buses
+        
+        Returns:
+            tuple: ([(bus_id, seat_id, seat_number, is_reserved, is_women_seat, is_accessible)],
+            {bus_id: seat_version})"""
+        # Versions first: a change committed in between only makes the map look stale
+        versions = {
+            bus_id: version or 0
+            for bus_id, version in db.session.query(Bus.id, Bus.seat_version).filter(Bus.id.in_(bus_ids))
+        }
+        rows = db.session.query(
+            Seat.bus_id, Seat.id, Seat.seat_number, Seat.is_reserved, Seat.is_women_seat, Seat.is_accessible
+        ).filter(Seat.bus_id.in_(bus_ids)).all()
+        return rows, versions
+
+
+# ==================== SEAT OPERATIONS ====================
+
+class SeatOperations:
+    """Undated seat reservations kept on the seat row
+    
+    A seat reserved here is taken on every travel date; bookings reserve
+    per date through InventoryOperations instead.
+    
+    Reservations are compare-and-set UPDATEs: the seat only changes if it
+    is still in the expected state (and passes the women-only rule) when
+    the statement runs, and the affected-row count tells the caller
+    whether it won. No row is read and written back, so concurrent
+    reservations of the same seat cannot both succeed.
+    
+    Each change bumps buses.seat_version in the caller's transaction, so
+    cached seat maps (seat_map.seat_maps) in every process notice it. Once
+    the caller has committed, it passes the returned change to
+    seat_maps.apply to update this process's map in place."""
+    
+    @staticmethod
+    def bump_version(bus_id):
+        """Mark a bus's seats as changed (does not commit)"""
+        buses = Bus.__table__
+        db.session.execute(
+            buses.update()
+            .where(buses.c.id == bus_id)
+            .values(seat_version=func.coalesce(buses.c.seat_version, 0) + 1)
+        )
+    
+    @staticmethod
+    def reserve(seat, user_id, allow_women_seat=True):
+        """Reserve a seat if it is still free (does not commit)
+        
+        An undated reservation blocks every travel date, so the seat must
+        also be free of pending or confirmed bookings for today onwards;
+        that is checked by the same UPDATE.
+         Args:
+            seat: Seat to reserve (only its id, bus and number are used)
+            user_id: ID of the user reserving it
+            allow_women_seat: Whether the user may take a women-only seat
+        
+        Returns:
+            tuple: ((bus_id, seat_number, True) for seat_maps.apply, error_message)"""
+        seats = Seat.__table__
+        bookings = Booking.__table__
+        today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+        booked = exists().where(and_(
+            bookings.c.seat_id == seats.c.id,
+            bookings.c.status.in_(['pending', 'confirmed']),
+            bookings.c.travel_date >= today
+        ))
+        conditions = [seats.c.id == seat.id, seats.c.is_reserved == False, ~booked]
+        if not allow_women_seat:
+            conditions.append(seats.c.is_women_seat == False)
+        
+        result = db.session.execute(
+            seats.update()
+            .where(and_(*conditions))
+            .values(is_reserved=True, reserved_by_user_id=user_id, reserved_at=datetime.utcnow())
+        )
+        if result.rowcount != 1:
+            if not allow_women_seat and seat.is_women_seat:
+                return None, "Women-only seat"
+            return None, "Seat already reserved"
+        
+        SeatOperations.bump_version(seat.bus_id)
+        return (seat.bus_id, seat.seat_number, True), None
+    
+    @staticmethod
+    def release(seat, user_id=None):
+        """Free a reserved seat (does not commit)
+         Args:
+            seat: Seat to free
+            user_id: Only free it while this user holds it (optional)
+        
+        Returns:
+            tuple: (bus_id, seat_number, False) for seat_maps.apply, or None
+            if the seat was not reserved (by that user)"""
+        seats = Seat.__table__
+        conditions = [seats.c.id == seat.id, seats.c.is_reserved == True]
+        if user_id is not None:
+            conditions.append(seats.c.reserved_by_user_id == user_id)
+        
+        result = db.session.execute(
+            seats.update()
+            .where(and_(*conditions))
+            .values(is_reserved=False, reserved_by_user_id=None, reserved_at=None)
+        )
+        if result.rowcount != 1:
+            return None
+        
+        SeatOperations.bump_version(seat.bus_id)
+        return seat.bus_id, seat.seat_number, False
+
+
+# ==================== SEAT INVENTORY OPERATIONS ====================
+
+def _travel_day(value):
+    """Calendar date of a travel date given as date or datetime"""
+    return value.date() if isinstance(value, datetime) else value
+
+
+class InventoryOperations:
+    """Per-travel-date seat inventory: one bitset row per (bus, date)
+    
+    Bit n - 1 of seat_inventory.reserved_mask is seat n, taken on that
+    date by a booking (held or paid). Availability over a calendar is one
+    range read on the (bus_id, travel_date) index, whatever the number of
+    bookings. Changes are compare-and-set on the row's version: read the
+    mask, compute the new one and write it WHERE version is unchanged;
+    losing a race re-reads and retries. Seats reserved on the seat row
+    (SeatOperations) count as taken on every date."""
+    
+    MAX_RETRIES = 5
+    
+    @staticmethod
+    def get_masks(bus_id, start_date, end_date):
+        """Taken-seat bitsets of a bus per travel date in [start_date, end_date]
+        
+        Returns:
+            dict: {date: mask}; dates without a row have nothing taken"""
+        rows = db.session.query(SeatInventory.travel_date, SeatInventory.reserved_mask).filter(
+            SeatInventory.bus_id == bus_id,
+            SeatInventory.travel_date >= _travel_day(start_date),
+            SeatInventory.travel_date <= _travel_day(end_date)
+        ).all()
+        return {travel_date: mask_from_bytes(mask) for travel_date, mask in rows}
+    
+    @staticmethod
+    def get_day_masks(bus_ids, travel_date):
+        """Taken-seat bitsets of several buses on one travel date
+        
+        Returns:
+            dict: {bus_id: mask}"""
+        rows = db.session.query(SeatInventory.bus_id, SeatInventory.reserved_mask).filter(
+            SeatInventory.bus_id.in_(bus_ids),
+            SeatInventory.travel_date == _travel_day(travel_date)
+        ).all()
+        return {bus_id: mask_from_bytes(mask) for bus_id, mask in rows}
+    
+    @staticmethod
+    def _ensure_row(bus_id, travel_date):
+        table = SeatInventory.__table__
+        params = {'bus_id': bus_id, 'travel_date': travel_date, 'reserved_mask': b'', 'reserved_count': 0, 'version': 0}
+        dialect = db.engine.dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            if dialect == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert
+            db.session.execute(
+                insert(table).on_conflict_do_nothing(index_elements=[table.c.bus_id, table.c.travel_date]),
+                params
+            )
+            return
+        
+        exists = db.session.query(table.c.id).filter(
+            table.c.bus_id == bus_id,
+            table.c.travel_date == travel_date
+        ).first()
+        if not exists:
+            db.session.execute(table.insert(), params)
+    
+    @staticmethod
+    def _update(bus_id, travel_date, take=0, free=0):
+        """Set `take` and clear `free` in a date's bitset by compare-and-set (does not commit)
+        
+        Returns:
+            tuple: (mask_after, error_message); fails if any seat in `take` is already taken"""
+        table = SeatInventory.__table__
+        if take:
+            InventoryOperations._ensure_row(bus_id, travel_date)
+        
+        for _ in range(InventoryOperations.MAX_RETRIES):
+            row = db.session.query(table.c.id, table.c.reserved_mask, table.c.version).filter(
+                table.c.bus_id == bus_id,
+                table.c.travel_date == travel_date
+            ).first()
+            if row is None:
+                return 0, None
+            
+            mask = mask_from_bytes(row.reserved_mask)
+            if take & mask:
+                return None, "Seat already reserved"
+            new_mask = (mask | take) & ~free
+            if new_mask == mask:
+                return mask, None
+            
+            result = db.session.execute(
+                table.update()
+                .where(and_(table.c.id == row.id, table.c.version == row.version))
+                .values(
+                    reserved_mask=mask_to_bytes(new_mask),
+                    reserved_count=bin(new_mask).count('1'),
+                    version=row.version + 1,
+                    updated_at=datetime.utcnow()
+                )
+            )
+            if result.rowcount == 1:
+                return new_mask, None
+        return None, "Seat inventory is busy, please retry"
+    
+    @staticmethod
+    def reserve(bus_id, travel_date, seat_numbers, allow_women_seat=True):
+        """Take seats of a bus on one travel date, all or nothing (does not commit)
+         Args:
+            bus_id: ID of the bus
+            travel_date: Date of travel (date or datetime)
+            seat_numbers: Seat numbers to take
+            allow_women_seat: Whether the user may take women-only seats
+        
+        Returns:
+            tuple: (taken_mask, error_message)"""
+        version = db.session.query(Bus.seat_version).filter(Bus.id == bus_id).scalar()
+        seat_map = seat_maps.get(bus_id, version or 0)
+        wanted = seat_map.mask_of(seat_numbers)
+        if not wanted or wanted & ~seat_map.present:
+            return None, "Seat not found on this bus"
+        if not allow_women_seat and wanted & seat_map.women:
+            return None, "Women-only seat"
+        if wanted & seat_map.reserved:
+            return None, "Seat already reserved"
+        
+        mask, error = InventoryOperations._update(bus_id, _travel_day(travel_date), take=wanted)
+        if error:
+            return None, error
+        return wanted, None
+    
+    @staticmethod
+    def release(bus_id, travel_date, seat_numbers):
+        """Give seats of a bus back on one travel date (does not commit)
+        
+        Returns:
+            tuple: (mask_after, error_message)"""
+        freed = 0
+        for number in seat_numbers:
+            freed |= 1 << (number - 1)
+        return InventoryOperations._update(bus_id, _travel_day(travel_date), free=freed)
+    
+    @staticmethod
+    def rebuild_from_bookings():
+        """Rebuild seat_inventory from pending and confirmed bookings
+        
+        Seats that those bookings had reserved on the seat row (before
+        per-date inventory) are freed there, and pending bookings get a
+        fresh hold so unpaid ones expire.
+        
+        Returns:
+            tuple: (number of (bus, date) rows written, error_message)"""
+        try:
+            active = db.session.query(
+                Booking.bus_id, Booking.travel_date, Booking.user_id, Seat.id.label('seat_id'), Seat.seat_number
+            ).join(Seat, Seat.id == Booking.seat_id).filter(
+                Booking.status.in_(['pending', 'confirmed'])
+            ).all()
+            
+            masks = {}
+            for row in active:
+                key = (row.bus_id, _travel_day(row.travel_date))
+                masks[key] = masks.get(key, 0) | (1 << (row.seat_number - 1))
+            
+            table = SeatInventory.__table__
+            db.session.execute(table.delete())
+            if masks:
+                db.session.execute(table.insert(), [{
+                    'bus_id': bus_id,
+                    'travel_date': travel_date,
+                    'reserved_mask': mask_to_bytes(mask),
+                    'reserved_count': bin(mask).count('1'),
+                    'version': 0
+                } for (bus_id, travel_date), mask in masks.items()])
+            
+            # Undated reservations that only stood for a booking
+            seats = Seat.__table__
+            freed_buses = set()
+            for row in active:
+                result = db.session.execute(
+                    seats.update()
+                    .where(and_(seats.c.id == row.seat_id, seats.c.reserved_by_user_id == row.user_id))
+                    .values(is_reserved=False, reserved_by_user_id=None, reserved_at=None)
+                )
+                if result.rowcount:
+                    freed_buses.add(row.bus_id)
+            for bus_id in freed_buses:
+                SeatOperations.bump_version(bus_id)
+            
+            hold_until = seat_holds.expires_at()
+            bookings = Booking.__table__
+            db.session.execute(
+                bookings.update()
+                .where(and_(bookings.c.status == 'pending', bookings.c.hold_expires_at.is_(None)))
+                .values(hold_expires_at=hold_until)
+            )
+            db.session.commit()
+            seat_maps.invalidate()
+            return len(masks), None
+        except Exception as e:
+            db.session.rollback()
+            return None, str(e)
 
 
 # ==================== BOOKING OPERATIONS ====================
@@ -274,9 +626,12 @@ class BusOperations:
 class BookingOperations:
     """Booking database operations"""
     
+    # Cancellation reason of bookings whose unpaid seat hold ran out
+    HOLD_EXPIRED_REASON = 'Seat hold expired'
+    
     @staticmethod
-    def create_booking(user_id, bus_id, seat_id, travel_date, price, booking_id=None):
-        """Create new booking
+    def create_booking(user_id, bus_id, seat_id, travel_date, price, booking_id=None, allow_women_seat=True):
+        """Create new booking, holding its seat on the travel date until paid
         
         Args:
             user_id: ID of user making booking
@@ -285,6 +640,7 @@ class BookingOperations:
             travel_date: Date of travel (datetime object)
             price: Ticket price
             booking_id: Custom booking reference (optional)
+            allow_women_seat: Whether the user may take a women-only seat
         
         Returns:
             tuple: (booking_object, error_message)
@@ -308,6 +664,19 @@ class BookingOperations:
             if not booking_id:
                 booking_id = f"BK{datetime.utcnow().timestamp()}"
             
+            seat = Seat.query.get(seat_id)
+            if not seat or seat.bus_id != bus_id:
+                return None, "Seat not found on this bus"
+            if seat_holds.conflicts((bus_id, _travel_day(travel_date), seat.seat_number), user_id):
+                return None, "Seat already reserved"
+            
+            # Held until the payment is verified; the reaper frees it otherwise
+            _, error = InventoryOperations.reserve(bus_id, travel_date, [seat.seat_number], allow_women_seat)
+            if error:
+                db.session.rollback()
+                return None, error
+            
+            hold_until = seat_holds.expires_at()
             booking = Booking(
                 booking_id=booking_id,
                 user_id=user_id,
@@ -316,15 +685,104 @@ class BookingOperations:
                 travel_date=travel_date,
                 price=price,
                 final_price=price,
-                status='pending'
+                status='pending',
+                hold_expires_at=hold_until
             )
             db.session.add(booking)
             db.session.commit()
+            seat_holds.track([(booking.id, user_id, (bus_id, _travel_day(travel_date), seat.seat_number))], hold_until)
             return booking, None
         except Exception as e:
             db.session.rollback()
             return None, str(e)
     
+    @staticmethod
+    def create_group_booking(user_id, bus_id, travel_date, price, seat_ids=None, count=None,
+                             allow_women_seat=True, payment_method='card'):
+        """Book several seats on one bus with a single payment, all or nothing
+        
+        The seats are held in the travel date's inventory by one
+        compare-and-set UPDATE, the bookings are written with one multi-row
+        INSERT and everything commits once. Without seat_ids, the first
+        `count` adjacent seats free on that date are picked.
+         Args:
+            user_id: ID of user making the booking
+            bus_id: ID of bus
+            travel_date: Date of travel (datetime object)
+            price: Ticket price per seat
+            seat_ids: IDs of the seats to book
+            count: Number of adjacent seats to pick when seat_ids is not given
+            allow_women_seat: Whether the user may take women-only seats
+            payment_method: Method recorded on the payment intent
+        
+        Returns:
+            tuple: ({'group_ref', 'bookings', 'payment', 'hold_expires_at'}, error_message)"""
+        try:
+            bus = Bus.query.get(bus_id)
+            if not bus:
+                return None, "Bus not found"
+            
+            travel_day = _travel_day(travel_date)
+            if not seat_ids:
+                seat_map = seat_maps.get(bus.id, bus.seat_version or 0)
+                taken = InventoryOperations.get_day_masks([bus.id], travel_day).get(bus.id, 0)
+                numbers = seat_map.find_adjacent(count or 0, women_allowed=allow_women_seat, taken=taken)
+                if not numbers:
+                    return None, f"No {count} adjacent seats available"
+                seat_ids = [seat_map.seat_ids[number] for number in numbers]
+            
+            seat_ids = sorted(set(seat_ids))
+            seats = db.session.query(Seat.id, Seat.seat_number).filter(
+                Seat.bus_id == bus_id,
+                Seat.id.in_(seat_ids)
+            ).order_by(Seat.seat_number).all()
+            if len(seats) != len(seat_ids):
+                return None, "Seat not found on this bus"
+            
+            # Held until the payment is verified; the reaper frees them otherwise
+            _, error = InventoryOperations.reserve(
+                bus_id, travel_day, [seat.seat_number for seat in seats], allow_women_seat
+            )
+            if error:
+                db.session.rollback()
+                return None, error
+            hold_until = seat_holds.expires_at()
+            
+            group_ref = f"GB{uuid.uuid4().hex[:10].upper()}"
+            refs = [f"{group_ref}-{index}" for index in range(1, len(seats) + 1)]
+            db.session.execute(Booking.__table__.insert(), [{
+                'booking_id': ref,
+                'user_id': user_id,
+                'bus_id': bus_id,
+                'seat_id': seat.id,
+                'travel_date': travel_date,
+                'price': price,
+                'final_price': price,
+                'status': 'pending',
+                'hold_expires_at': hold_until
+            } for ref, seat in zip(refs, seats)])
+            bookings = Booking.query.filter(Booking.booking_id.in_(refs)).order_by(Booking.id).all()
+            
+            # One payment intent for the whole group; verify/refund act on all its bookings
+            payment = Payment(
+                transaction_id=f"TXN{uuid.uuid4().hex[:12].upper()}",
+                user_id=user_id,
+                amount=price * len(bookings),
+                payment_method=payment_method,
+                payment_details={'group_ref': group_ref, 'booking_ids': [booking.id for booking in bookings]}
+            )
+            db.session.add(payment)
+            db.session.commit()
+            
+            numbers = {seat.id: seat.seat_number for seat in seats}
+            seat_holds.track([
+                (booking.id, user_id, (bus_id, travel_day, numbers[booking.seat_id])) for booking in bookings
+            ], hold_until)
+            return {'group_ref': group_ref, 'bookings': bookings, 'payment': payment, 'hold_expires_at': hold_until}, None
+        except Exception as e:
+            db.session.rollback()
+            return None, str(e)
+    
     @staticmethod
     def get_booking_by_id(booking_id):
         """Get booking by ID"""
@@ -351,6 +809,34 @@ class BookingOperations:
             query = query.filter_by(status=status)
         return query.all()
     
+    @staticmethod
+    def get_travelling_passengers(bus_id, travel_date):
+        """Passengers holding a seat on a bus for a travel date
+        
+        Covers pending and confirmed bookings of that date plus undated
+        seat reservations.
+        
+        Returns:
+            list: (seat_number, user) pairs"""
+        start = datetime.combine(_travel_day(travel_date), datetime.min.time())
+        booked = db.session.query(Seat.seat_number, User).join(
+            Booking, Booking.seat_id == Seat.id
+        ).join(
+            User, Booking.user_id == User.id
+        ).filter(
+            Booking.bus_id == bus_id,
+            Booking.status.in_(['pending', 'confirmed']),
+            Booking.travel_date >= start,
+            Booking.travel_date < start + timedelta(days=1)
+        ).all()
+        reserved = db.session.query(Seat.seat_number, User).join(
+            User, Seat.reserved_by_user_id == User.id
+        ).filter(
+            Seat.bus_id == bus_id,
+            Seat.is_reserved == True
+        ).all()
+        return booked + reserved
+    
     @staticmethod
     def confirm_booking(booking_id):
         """Confirm a booking"""
@@ -359,13 +845,157 @@ class BookingOperations:
             if not booking:
                 return None, "Booking not found"
             
-            booking.status = 'confirmed'
+            error = BookingOperations.claim(booking)
+            if error:
+                db.session.rollback()
+                return None, error
             db.session.commit()
+            seat_holds.forget([booking.id], confirmed=True)
             return booking, None
         except Exception as e:
             db.session.rollback()
             return None, str(e)
     
+    @staticmethod
+    def claim(booking, allow_women_seat=True):
+        """Confirm a booking once paid, keeping its seat for good (does not commit)
+        
+        A pending booking still holds its seat, so only the hold ends. If
+        the hold lapsed and the reaper cancelled the booking, the seat is
+        taken again unless someone else has it by now. Any other booking
+        (already paid, refunded or cancelled by the user) is refused, so
+        paying twice confirms nothing twice. Once committed, the caller
+        drops the in-memory hold with seat_holds.forget(..., confirmed=True).
+        
+        Returns:
+            str: error message, or None when the booking is confirmed"""
+        bookings = Booking.__table__
+        result = db.session.execute(
+            bookings.update()
+            .where(and_(bookings.c.id == booking.id, bookings.c.status == 'pending'))
+            .values(status='confirmed', hold_expires_at=None)
+        )
+        if result.rowcount != 1:
+            result = db.session.execute(
+                bookings.update()
+                .where(and_(
+                    bookings.c.id == booking.id,
+                    bookings.c.status == 'cancelled',
+                    bookings.c.cancellation_reason == BookingOperations.HOLD_EXPIRED_REASON
+                ))
+                .values(status='confirmed', hold_expires_at=None, cancellation_reason=None, cancelled_at=None)
+            )
+            if result.rowcount != 1:
+                db.session.refresh(booking)
+                if booking.status == 'confirmed':
+                    return "Booking is already paid"
+                return f"Booking is {booking.status}"
+            
+            _, error = InventoryOperations.reserve(
+                booking.bus_id, booking.travel_date, [booking.seat.seat_number], allow_women_seat
+            )
+            if error:
+                return error
+        
+        booking.status = 'confirmed'
+        booking.hold_expires_at = None
+        booking.cancellation_reason = None
+        booking.cancelled_at = None
+        return None
+    
+    @staticmethod
+    def release_booking(booking, reason=None):
+        """Cancel a booking and give its seat back on the travel date (does not commit)
+        
+        Only a pending or confirmed booking gives its seat back, so a
+        booking the reaper already cancelled cannot free a seat that was
+        taken again since. On error the caller must roll back, or the
+        booking would be cancelled with its seat still taken. Once
+        committed, the caller drops the in-memory hold with seat_holds.forget.
+        
+        Returns:
+            tuple: (whether this call cancelled the booking, error_message)"""
+        now = datetime.utcnow()
+        bookings = Booking.__table__
+        result = db.session.execute(
+            bookings.update()
+            .where(and_(bookings.c.id == booking.id, bookings.c.status.in_(['pending', 'confirmed'])))
+            .values(status='cancelled', cancellation_reason=reason, cancelled_at=now, hold_expires_at=None)
+        )
+        if result.rowcount != 1:
+            return False, None
+        
+        _, error = InventoryOperations.release(booking.bus_id, booking.travel_date, [booking.seat.seat_number])
+        if error:
+            return False, error
+        booking.status = 'cancelled'
+        booking.cancellation_reason = reason
+        booking.cancelled_at = now
+        booking.hold_expires_at = None
+        return True, None
+    
+    @staticmethod
+    def release_expired_holds(booking_ids=None, limit=500, now=None):
+        """Cancel pending bookings whose seat holds expired and give their seats back
+         Args:
+            booking_ids: Only consider these bookings (default: every booking)
+            limit: Most bookings released in one call
+            now: Time the holds are compared with (default: the current UTC time)
+        
+        Returns:
+            tuple: ({'booking_ids', 'seats'}, error_message)"""
+        try:
+            now = now or datetime.utcnow()
+            query = db.session.query(
+                Booking.id, Booking.bus_id, Booking.travel_date, Seat.seat_number
+            ).join(Seat, Seat.id == Booking.seat_id).filter(
+                Booking.status == 'pending',
+                Booking.hold_expires_at <= now
+            )
+            if booking_ids is not None:
+                query = query.filter(Booking.id.in_(booking_ids))
+            expired = query.order_by(Booking.hold_expires_at).limit(limit).with_for_update().all()
+            if not expired:
+                return {'booking_ids': [], 'seats': 0}, None
+            
+            # Some may be paid for meanwhile: only the ones cancelled here give seats back
+            bookings = Booking.__table__
+            cancel = (
+                bookings.update()
+                .where(and_(bookings.c.status == 'pending', bookings.c.hold_expires_at <= now))
+                .values(status='cancelled', cancellation_reason=BookingOperations.HOLD_EXPIRED_REASON, cancelled_at=now,
+                        hold_expires_at=None)
+            )
+            if db.engine.dialect.update_returning:
+                cancelled = {row[0] for row in db.session.execute(
+                    cancel.where(bookings.c.id.in_([row.id for row in expired])).returning(bookings.c.id)
+                )}
+            else:
+                cancelled = set()
+                for row in expired:
+                    if db.session.execute(cancel.where(bookings.c.id == row.id)).rowcount == 1:
+                        cancelled.add(row.id)
+            expired = [row for row in expired if row.id in cancelled]
+            
+            # One compare-and-set per bus and date
+            freed = {}
+            for row in expired:
+                key = (row.bus_id, _travel_day(row.travel_date))
+                freed.setdefault(key, []).append(row.seat_number)
+            for (bus_id, travel_date), numbers in freed.items():
+                _, error = InventoryOperations.release(bus_id, travel_date, numbers)
+                if error:
+                    db.session.rollback()
+                    return None, error
+            db.session.commit()
+            
+            released = [row.id for row in expired]
+            seat_holds.forget(released)
+            return {'booking_ids': released, 'seats': len(expired)}, None
+        except Exception as e:
+            db.session.rollback()
+            return None, str(e)
+    
     @staticmethod
     def cancel_booking(booking_id, reason=None):
         """Cancel a booking and a free up the seat
@@ -380,18 +1010,15 @@ class BookingOperations:
             if not booking:
                 return None, "Booking not found"
             
-            booking.status = 'cancelled'
-            booking.cancellation_reason = reason
-            booking.cancelled_at = datetime.utcnow()
-            
-            # Free up the seat
-            seat = Seat.query.get(booking.seat_id)
-            if seat:
-                seat.is_reserved = False
-                seat.reserved_by_user_id = None
-                seat.reserved_at = None
+            cancelled, error = BookingOperations.release_booking(booking, reason)
+            if error:
+                db.session.rollback()
+                return None, error
+            if not cancelled:
+                return None, "Booking is already cancelled"
             
             db.session.commit()
+            seat_holds.forget([booking.id])
             return booking, None
         except Exception as e:
             db.session.rollback()
@@ -697,8 +1324,36 @@ class GPSOperations:
             if error:
                 print(f"Error logging GPS: {error}")
             else:
-                print(f"GPS logged at {gps.timestamp}")"""
+                print(f"GPS logged at {gps.timestamp}")
+        
+        In write-behind mode the returned tracker is not yet persisted; the
+        background flusher writes it with the next bulk insert."""
         try:
+            if gps_write_buffer.enabled:
+                timestamp = datetime.utcnow()
+                accepted, error = gps_write_buffer.append({
+                    'bus_id': bus_id,
+                    'latitude': latitude,
+                    'longitude': longitude,
+                    'speed': speed,
+                    'heading': heading,
+                    'accuracy': accuracy,
+                    'altitude': altitude,
+                    'timestamp': timestamp
+                })
+                if not accepted:
+                    return None, error
+                return GPSTracker(
+                    bus_id=bus_id,
+                    latitude=latitude,
+                    longitude=longitude,
+                    speed=speed,
+                    heading=heading,
+                    accuracy=accuracy,
+                    altitude=altitude,
+                    timestamp=timestamp
+                ), None
+            
             gps = GPSTracker(
                 bus_id=bus_id,
                 latitude=latitude,
@@ -709,6 +1364,17 @@ class GPSOperations:
                 altitude=altitude
             )
             db.session.add(gps)
+            db.session.flush()
+            GPSOperations.upsert_latest_positions([{
+                'bus_id': bus_id,
+                'latitude': latitude,
+                'longitude': longitude,
+                'speed': speed,
+                'heading': heading,
+                'accuracy': accuracy,
+                'altitude': altitude,
+                'timestamp': gps.timestamp
+            }])
             db.session.commit()
             return gps, None
         except Exception as e:
@@ -732,24 +1398,760 @@ class GPSOperations:
         ).order_by(GPSTracker.timestamp.asc()).all()
     
     @staticmethod
-    def get_all_active_buses_gps():
-        """Get latest GPS for all active buses"""
-        buses = Bus.query.filter_by(status='active').all()
-        gps_data = []
-        
-        for bus in buses:
-            gps = GPSOperations.get_latest_gps(bus.id)
-            if gps:
-                gps_data.append({
-                    'bus_id': bus.id,
-                    'bus_number': bus.bus_number,
-                    'latitude': gps.latitude,
-                    'longitude': gps.longitude,
-                    'speed': gps.speed,
-                    'heading': gps.heading
-                })
+    def get_latest_positions_with_buses():
+        """Latest position of every bus joined with its bus details (one query)
+        
+        Returns:
+            list: (fix_dict, bus_dict) pairs"""
+        rows = db.session.query(Bus, BusLatestPosition).join(
+            BusLatestPosition, BusLatestPosition.bus_id == Bus.id
+        ).all()
         
-        return gps_data
+        return [({
+            'bus_id': position.bus_id,
+            'latitude': position.latitude,
+            'longitude': position.longitude,
+            'speed': position.speed,
+            'heading': position.heading,
+            'accuracy': position.accuracy,
+            'altitude': position.altitude,
+            'distance_along_route': position.distance_along_route,
+            'timestamp': position.timestamp
+        }, {
+            'bus_number': bus.bus_number,
+            'driver_name': bus.driver_name,
+            'route': bus.route,
+            'status': bus.status
+        }) for bus, position in rows]
+    
+    @staticmethod
+    def upsert_latest_positions(rows):
+        """Insert or refresh bus_latest_positions from the newest fix per bus
+        
+        A stored position is only replaced by a fix with an equal or newer
+        timestamp. Runs inside the caller's transaction (caller commits).
+        
+        Args:
+            rows: list of fix dicts, at most one per bus"""
+        if not rows:
+            return
+        
+        table = BusLatestPosition.__table__
+        params = [{
+            'bus_id': row['bus_id'],
+            'latitude': row['latitude'],
+            'longitude': row['longitude'],
+            'speed': row.get('speed', 0),
+            'heading': row.get('heading', 0),
+            'accuracy': row.get('accuracy', 0),
+            'altitude': row.get('altitude', 0),
+            'distance_along_route': row.get('distance_along_route'),
+            'timestamp': row['timestamp']
+        } for row in rows]
+        
+        dialect = db.engine.dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            if dialect == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert
+            stmt = insert(table)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.bus_id],
+                set_={key: stmt.excluded[key] for key in params[0] if key != 'bus_id'},
+                where=table.c.timestamp <= stmt.excluded.timestamp
+            )
+            db.session.execute(stmt, params)
+            return
+        
+        # Portable fallback: update rows that exist, insert the rest
+        existing = {row[0] for row in db.session.query(table.c.bus_id).filter(
+            table.c.bus_id.in_([p['bus_id'] for p in params])
+        ).all()}
+        updates = [{'u_' + key: value for key, value in p.items()} for p in params if p['bus_id'] in existing]
+        inserts = [p for p in params if p['bus_id'] not in existing]
+        if updates:
+            db.session.execute(
+                table.update()
+                .where(table.c.bus_id == bindparam('u_bus_id'))
+                .where(table.c.timestamp <= bindparam('u_timestamp'))
+                .values({key: bindparam('u_' + key) for key in params[0] if key != 'bus_id'}),
+                updates
+            )
+        if inserts:
+            db.session.execute(table.insert(), inserts)
+    
+    @staticmethod
+    def rebuild_latest_positions():
+        """Backfill bus_latest_positions from gps_trackers (one-off migration helper)
+        
+        Returns:
+            tuple: (number_of_buses, error_message)"""
+        try:
+            newest = db.session.query(
+                GPSTracker.bus_id,
+                func.max(GPSTracker.timestamp).label('timestamp')
+            ).filter(GPSTracker.is_active == True).group_by(GPSTracker.bus_id).subquery()
+            
+            trackers = GPSTracker.query.join(
+                newest,
+                and_(GPSTracker.bus_id == newest.c.bus_id, GPSTracker.timestamp == newest.c.timestamp)
+            ).all()
+            
+            rows = {}
+            for tracker in trackers:
+                rows[tracker.bus_id] = {
+                    'bus_id': tracker.bus_id,
+                    'latitude': tracker.latitude,
+                    'longitude': tracker.longitude,
+                    'speed': tracker.speed,
+                    'heading': tracker.heading,
+                    'accuracy': tracker.accuracy,
+                    'altitude': tracker.altitude,
+                    'distance_along_route': tracker.distance_along_route,
+                    'timestamp': tracker.timestamp
+                }
+            
+            GPSOperations.upsert_latest_positions(list(rows.values()))
+            db.session.commit()
+            return len(rows), None
+        except Exception as e:
+            db.session.rollback()
+            return 0, str(e)
+    
+    @staticmethod
+    def record_stop_events(events):
+        """Apply detected stop arrivals/departures in one transaction
+        
+        An event only moves a stop's times forward, so replayed or
+        out-of-order events cannot overwrite a newer trip. An arrival at a
+        route's first stop reopens the bus's other stops for the new trip.
+        
+        Args:
+            events: dicts with type ('arrival'/'departure'), bus_id, stop_id,
+                at and starts_trip, in the order they happened
+        
+        Returns:
+            tuple: (number_of_stops_updated, error)"""
+        try:
+            table = RouteStop.__table__
+            updated = 0
+            for event in events:
+                if event['type'] == 'arrival':
+                    if event['starts_trip']:
+                        db.session.execute(
+                            table.update()
+                            .where(and_(table.c.bus_id == event['bus_id'], table.c.id != event['stop_id']))
+                            .values(is_completed=False)
+                        )
+                    result = db.session.execute(
+                        table.update()
+                        .where(and_(
+                            table.c.id == event['stop_id'],
+                            or_(table.c.actual_arrival.is_(None), table.c.actual_arrival < event['at'])
+                        ))
+                        .values(actual_arrival=event['at'], actual_departure=None, is_completed=True)
+                    )
+                else:
+                    result = db.session.execute(
+                        table.update()
+                        .where(and_(
+                            table.c.id == event['stop_id'],
+                            or_(table.c.actual_departure.is_(None), table.c.actual_departure < event['at']),
+                            # Never before the recorded arrival, which may belong to a newer trip
+                            or_(table.c.actual_arrival.is_(None), table.c.actual_arrival <= event['at'])
+                        ))
+                        .values(actual_departure=event['at'], is_completed=True)
+                    )
+                updated += result.rowcount
+            
+            db.session.commit()
+            return updated, None
+        except Exception as e:
+            db.session.rollback()
+            return 0, str(e)
+    
+    @staticmethod
+    def get_route_shape(bus_id):
+        """Uploaded route geometry of a bus
+        
+        Returns:
+            tuple: (list of (lat, lng) or None, error)"""
+        try:
+            shape = RouteShape.query.get(bus_id)
+            return ([tuple(point) for point in shape.points] if shape else None), None
+        except Exception as e:
+            return None, str(e)
+    
+    @staticmethod
+    def save_route_shape(bus_id, points):
+        """Store (or replace) a bus's route geometry
+        
+        Returns:
+            tuple: (route_shape_object, error)"""
+        try:
+            shape = RouteShape.query.get(bus_id)
+            if shape is None:
+                shape = RouteShape(bus_id=bus_id)
+                db.session.add(shape)
+            shape.points = [[float(lat), float(lng)] for lat, lng in points]
+            db.session.commit()
+            return shape, None
+        except Exception as e:
+            db.session.rollback()
+            return None, str(e)
+    
+    @staticmethod
+    def get_bus_summaries(bus_ids):
+        """Look up the buses that exist among bus_ids, in a single query
+        
+        Returns:
+            dict: bus_id -> {bus_number, driver_name, route, status}"""
+        if not bus_ids:
+            return {}
+        rows = db.session.query(
+            Bus.id, Bus.bus_number, Bus.driver_name, Bus.route, Bus.status
+        ).filter(Bus.id.in_(list(bus_ids))).all()
+        return {
+            row.id: {
+                'bus_number': row.bus_number,
+                'driver_name': row.driver_name,
+                'route': row.route,
+                'status': row.status
+            } for row in rows
+        }
+    
+    @staticmethod
+    def ping():
+        """True while the database answers a trivial query"""
+        try:
+            db.session.execute(db.select(1))
+            return True
+        except Exception:
+            db.session.rollback()
+            return False
+    
+    @staticmethod
+    def log_gps_batch(fixes, chunk_size=500):
+        """Log many GPS fixes (for one or many buses) in one transaction
+         Args:
+            fixes: list of dicts with bus_id, latitude, longitude, speed,
+                heading, accuracy, altitude and timestamp keys
+            chunk_size: rows per multi-row INSERT statement (keeps SQLite
+                under its bound-parameter limit)
+        
+        Each bus's current position is set once per batch from its newest
+        fix, and only if that fix is newer than the stored position.
+        
+        Returns:
+            tuple: (number_of_rows_written, error_message)"""
+        if not fixes:
+            return 0, None
+        
+        try:
+            count = GPSOperations._write_fixes(fixes, chunk_size)
+            db.session.commit()
+            return count, None
+        except Exception as e:
+            db.session.rollback()
+            return 0, str(e)
+    
+    @staticmethod
+    def _write_fixes(fixes, chunk_size=500):
+        """Insert fixes and move bus positions forward (caller commits)
+        
+        Returns:
+            int: number of rows inserted"""
+        rows = [{
+            'bus_id': fix['bus_id'],
+            'latitude': fix['latitude'],
+            'longitude': fix['longitude'],
+            'speed': fix.get('speed', 0),
+            'heading': fix.get('heading', 0),
+            'accuracy': fix.get('accuracy', 0),
+            'altitude': fix.get('altitude', 0),
+            'distance_along_route': fix.get('distance_along_route'),
+            'is_active': True,
+            'timestamp': fix['timestamp']
+        } for fix in fixes]
+        
+        tracker_table = GPSTracker.__table__
+        for start in range(0, len(rows), chunk_size):
+            db.session.execute(tracker_table.insert().values(rows[start:start + chunk_size]))
+        
+        # Newest fix per bus drives the bus's current position
+        latest = {}
+        for row in rows:
+            current = latest.get(row['bus_id'])
+            if current is None or row['timestamp'] >= current['timestamp']:
+                latest[row['bus_id']] = row
+        
+        bus_table = Bus.__table__
+        db.session.execute(
+            bus_table.update()
+            .where(bus_table.c.id == bindparam('b_bus_id'))
+            .where(or_(
+                bus_table.c.last_location_update.is_(None),
+                bus_table.c.last_location_update <= bindparam('b_timestamp')
+            ))
+            .values(
+                current_lat=bindparam('b_latitude'),
+                current_lng=bindparam('b_longitude'),
+                last_location_update=bindparam('b_timestamp')
+            ),
+            [{
+                'b_bus_id': row['bus_id'],
+                'b_latitude': row['latitude'],
+                'b_longitude': row['longitude'],
+                'b_timestamp': row['timestamp']
+            } for row in latest.values()]
+        )
+        GPSOperations.upsert_latest_positions(list(latest.values()))
+        return len(rows)
+    
+    @staticmethod
+    def sync_device_fixes(device_id, bus_id, numbered_fixes, max_pending=10000):
+        """Store a device's buffered fixes once each, keyed by sequence number
+        
+        Sequences already stored are skipped, so a replayed or overlapping
+        upload is harmless. Fixes are inserted in one transaction together
+        with the device's sync state; bus and latest positions only move
+        forward, so old fixes never replace a newer position.
+        
+        Args:
+            device_id: reporting device
+            bus_id: bus the device is fitted to
+            numbered_fixes: list of (seq, fix dict or None); a None fix marks a
+                sequence as received without storing anything (e.g. invalid)
+            max_pending: most out-of-order sequences remembered above the ack
+        
+        Returns:
+            tuple: (dict with acked_seq, inserted, duplicates and stored fixes, error)"""
+        try:
+            state = (
+                DeviceSyncState.query.filter_by(device_id=device_id)
+                .with_for_update()
+                .first()
+            )
+            if state is None:
+                state = DeviceSyncState(device_id=device_id, bus_id=bus_id, acked_seq=0, received_seqs=[])
+                db.session.add(state)
+            elif state.bus_id != bus_id:
+                return None, f'Device {device_id} is registered to bus {state.bus_id}'
+            
+            received = set(state.received_seqs or [])
+            fresh = {}
+            for seq, fix in numbered_fixes:
+                if seq > state.acked_seq and seq not in received and seq not in fresh:
+                    fresh[seq] = fix
+            
+            # Advance the ack over the now contiguous run
+            received.update(fresh)
+            acked_seq = state.acked_seq
+            while acked_seq + 1 in received:
+                acked_seq += 1
+                received.discard(acked_seq)
+            pending = sorted(received)
+            if len(pending) > max_pending:
+                db.session.rollback()
+                return None, 'Too many out-of-order sequences; resend from the acknowledged sequence'
+            
+            stored = [fresh[seq] for seq in sorted(fresh) if fresh[seq] is not None]
+            if stored:
+                GPSOperations._write_fixes(stored)
+            
+            state.acked_seq = acked_seq
+            state.received_seqs = pending
+            state.last_sync_at = datetime.utcnow()
+            db.session.commit()
+            return {
+                'acked_seq': acked_seq,
+                'inserted': len(stored),
+                'duplicates': len(numbered_fixes) - len(fresh),
+                'fixes': stored
+            }, None
+        except Exception as e:
+            db.session.rollback()
+            return None, str(e)
+    
+    @staticmethod
+    def get_device_sync_state(device_id):
+        """Sync progress of a device, or None if it never synced"""
+        return DeviceSyncState.query.filter_by(device_id=device_id).first()
+
+
+# ==================== RETENTION OPERATIONS ====================
+
+# Fix timestamps are naive UTC; bucket numbers count from this epoch
+RETENTION_EPOCH = datetime(1970, 1, 1)
+# Ids per DELETE ... IN (...) statement (stays under SQLite's variable limit)
+DELETE_CHUNK_SIZE = 500
+
+
+class RetentionOperations:
+    """GPS retention operations
+    
+    Every call handles one bounded batch in its own short transaction, so
+    the retention job never holds locks long enough to stall ingest.
+    """
+    
+    @staticmethod
+    def _source(source_resolution):
+        """Table and age filter for raw fixes (None) or samples of a resolution"""
+        if source_resolution is None:
+            table = GPSTracker.__table__
+            return table, []
+        table = GPSTrackSample.__table__
+        return table, [table.c.resolution == source_resolution]
+    
+    @staticmethod
+    def _delete_ids(table, ids):
+        for start in range(0, len(ids), DELETE_CHUNK_SIZE):
+            db.session.execute(table.delete().where(table.c.id.in_(ids[start:start + DELETE_CHUNK_SIZE])))
+    
+    @staticmethod
+    def rollup_batch(cutoff, resolution, batch_size=2000, source_resolution=None):
+        """Fold the oldest rows older than cutoff into samples and delete them
+        
+        Rows are read oldest first, so the first fix seen for a bus and
+        bucket becomes the sample; later fixes only increase its point_count.
+        
+        Args:
+            cutoff: rows with an older timestamp are rolled up
+            resolution: bucket width (seconds) of the target samples
+            batch_size: maximum rows handled by this call
+            source_resolution: None for raw gps_trackers, else the sample tier to roll up
+        
+        Returns:
+            tuple: (rows_processed, error)"""
+        try:
+            table, filters = RetentionOperations._source(source_resolution)
+            count_column = table.c.point_count if source_resolution is not None else None
+            columns = [table.c.id, table.c.bus_id, table.c.latitude, table.c.longitude,
+                       table.c.speed, table.c.heading, table.c.timestamp]
+            if count_column is not None:
+                columns.append(count_column)
+            
+            rows = db.session.query(*columns).filter(
+                table.c.timestamp < cutoff, *filters
+            ).order_by(table.c.timestamp).limit(batch_size).all()
+            if not rows:
+                return 0, None
+            
+            samples = {}
+            for row in rows:
+                bucket = int((row.timestamp - RETENTION_EPOCH).total_seconds()) // resolution
+                points = (row.point_count or 1) if count_column is not None else 1
+                sample = samples.get((row.bus_id, bucket))
+                if sample is None:
+                    samples[(row.bus_id, bucket)] = {
+                        'bus_id': row.bus_id,
+                        'resolution': resolution,
+                        'bucket': bucket,
+                        'latitude': row.latitude,
+                        'longitude': row.longitude,
+                        'speed': row.speed or 0,
+                        'heading': row.heading or 0,
+                        'timestamp': row.timestamp,
+                        'point_count': points
+                    }
+                else:
+                    sample['point_count'] += points
+            
+            RetentionOperations._upsert_samples(list(samples.values()))
+            RetentionOperations._delete_ids(table, [row.id for row in rows])
+            db.session.commit()
+            return len(rows), None
+        except Exception as e:
+            db.session.rollback()
+            return 0, str(e)
+    
+    @staticmethod
+    def _upsert_samples(params):
+        """Insert samples; an existing bucket keeps its point and adds the counts"""
+        table = GPSTrackSample.__table__
+        dialect = db.engine.dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            if dialect == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert
+            stmt = insert(table)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.bus_id, table.c.resolution, table.c.bucket],
+                set_={'point_count': table.c.point_count + stmt.excluded.point_count}
+            )
+            db.session.execute(stmt, params)
+            return
+        
+        # Portable fallback: bump counts of existing buckets, insert the rest
+        existing = set(db.session.query(table.c.bus_id, table.c.bucket).filter(
+            table.c.resolution == params[0]['resolution'],
+            table.c.bus_id.in_({p['bus_id'] for p in params}),
+            table.c.bucket.in_({p['bucket'] for p in params})
+        ).all())
+        updates = [p for p in params if (p['bus_id'], p['bucket']) in existing]
+        inserts = [p for p in params if (p['bus_id'], p['bucket']) not in existing]
+        if updates:
+            db.session.execute(
+                table.update()
+                .where(table.c.bus_id == bindparam('u_bus_id'))
+                .where(table.c.resolution == bindparam('u_resolution'))
+                .where(table.c.bucket == bindparam('u_bucket'))
+                .values(point_count=table.c.point_count + bindparam('u_point_count')),
+                [{'u_' + key: p[key] for key in ('bus_id', 'resolution', 'bucket', 'point_count')} for p in updates]
+            )
+        if inserts:
+            db.session.execute(table.insert(), inserts)
+    
+    @staticmethod
+    def purge_batch(cutoff, batch_size=2000, source_resolution=None):
+        """Delete up to batch_size of the oldest rows older than cutoff
+        
+        Args:
+            cutoff: rows with an older timestamp are deleted
+            batch_size: maximum rows deleted by this call
+            source_resolution: None for raw gps_trackers, else the sample tier to purge
+        
+        Returns:
+            tuple: (rows_deleted, error)"""
+        try:
+            table, filters = RetentionOperations._source(source_resolution)
+            ids = [row[0] for row in db.session.query(table.c.id).filter(
+                table.c.timestamp < cutoff, *filters
+            ).order_by(table.c.timestamp).limit(batch_size).all()]
+            if not ids:
+                return 0, None
+            
+            RetentionOperations._delete_ids(table, ids)
+            db.session.commit()
+            return len(ids), None
+        except Exception as e:
+            db.session.rollback()
+            return 0, str(e)
+    
+    @staticmethod
+    def get_samples(bus_id, since=None, until=None, limit=None):
+        """Downsampled fixes of a bus in [since, until), newest `limit` of them
+        
+        Every tier is read: a fix lives in exactly one tier at a time, so
+        the tiers cover disjoint stretches of the track.
+        
+        Returns:
+            list: rows with latitude, longitude, timestamp, speed, heading, oldest first"""
+        query = db.session.query(
+            GPSTrackSample.latitude, GPSTrackSample.longitude, GPSTrackSample.timestamp,
+            GPSTrackSample.speed, GPSTrackSample.heading
+        ).filter(GPSTrackSample.bus_id == bus_id)
+        if since is not None:
+            query = query.filter(GPSTrackSample.timestamp >= since)
+        if until is not None:
+            query = query.filter(GPSTrackSample.timestamp < until)
+        query = query.order_by(GPSTrackSample.timestamp.desc())
+        if limit is not None:
+            query = query.limit(limit)
+        rows = query.all()
+        rows.reverse()
+        return rows
+    
+    # ---------- Cold archive support (see gps_archive.py) ----------
+    
+    @staticmethod
+    def get_oldest_fix_time():
+        """Timestamp of the oldest raw GPS fix
+        
+        Returns:
+            tuple: (datetime or None, error)"""
+        try:
+            return db.session.query(func.min(GPSTracker.timestamp)).scalar(), None
+        except Exception as e:
+            return None, str(e)
+    
+    @staticmethod
+    def get_buses_with_fixes(start, end):
+        """Ids of buses with raw fixes in [start, end)
+        
+        Returns:
+            tuple: (list of bus ids, error)"""
+        try:
+            rows = db.session.query(GPSTracker.bus_id).filter(
+                GPSTracker.timestamp >= start,
+                GPSTracker.timestamp < end
+            ).distinct().all()
+            return [row[0] for row in rows], None
+        except Exception as e:
+            return [], str(e)
+    
+    @staticmethod
+    def get_fixes_between(bus_id, start, end):
+        """Raw fixes of a bus in [start, end), oldest first
+        
+        Returns:
+            tuple: (list of (id, latitude, longitude, timestamp, speed, heading), error)"""
+        try:
+            rows = db.session.query(
+                GPSTracker.id, GPSTracker.latitude, GPSTracker.longitude,
+                GPSTracker.timestamp, GPSTracker.speed, GPSTracker.heading
+            ).filter(
+                GPSTracker.bus_id == bus_id,
+                GPSTracker.timestamp >= start,
+                GPSTracker.timestamp < end
+            ).order_by(GPSTracker.timestamp).all()
+            return [tuple(row) for row in rows], None
+        except Exception as e:
+            return [], str(e)
+    
+    @staticmethod
+    def delete_fixes(ids, batch_size=2000):
+        """Delete raw fixes by id, committing every batch_size rows
+        
+        Returns:
+            tuple: (rows_deleted, error)"""
+        deleted = 0
+        try:
+            table = GPSTracker.__table__
+            for start in range(0, len(ids), batch_size):
+                batch = ids[start:start + batch_size]
+                RetentionOperations._delete_ids(table, batch)
+                db.session.commit()
+                deleted += len(batch)
+            return deleted, None
+        except Exception as e:
+            db.session.rollback()
+            return deleted, str(e)
+
+
+# ==================== ETA OPERATIONS ====================
+
+class ETAOperations:
+    """Storage for the historical segment travel-time model (see eta_engine.py)"""
+    
+    @staticmethod
+    def load_segment_times():
+        """Whole travel-time table as {segment_key: [mean_seconds or None] * 24}
+        
+        Returns:
+            tuple: (table, error)"""
+        try:
+            table = {}
+            for key, hour, mean_seconds in db.session.query(
+                SegmentTravelTime.segment_key, SegmentTravelTime.hour, SegmentTravelTime.mean_seconds
+            ).all():
+                table.setdefault(key, [None] * 24)[hour] = mean_seconds
+            return table, None
+        except Exception as e:
+            return {}, str(e)
+    
+    @staticmethod
+    def get_buses_with_stops():
+        """Ids of buses that have at least two route stops"""
+        try:
+            rows = db.session.query(RouteStop.bus_id).group_by(RouteStop.bus_id).having(
+                func.count(RouteStop.id) >= 2
+            ).all()
+            return [row[0] for row in rows], None
+        except Exception as e:
+            return [], str(e)
+    
+    @staticmethod
+    def get_route_stops(bus_id):
+        """Route stops of a bus in stop order"""
+        try:
+            return RouteStop.query.filter_by(bus_id=bus_id).order_by(RouteStop.stop_order).all(), None
+        except Exception as e:
+            return [], str(e)
+    
+    @staticmethod
+    def get_all_route_stops():
+        """Route stops of every bus in one query
+        
+        Returns:
+            tuple: ({bus_id: [stops in stop order]}, error)"""
+        try:
+            routes = {}
+            for stop in RouteStop.query.order_by(RouteStop.bus_id, RouteStop.stop_order).all():
+                routes.setdefault(stop.bus_id, []).append(stop)
+            return routes, None
+        except Exception as e:
+            return {}, str(e)
+    
+    @staticmethod
+    def get_refresh_state(bus_id):
+        """Refresh watermarks of a bus
+        
+        Returns:
+            tuple: ((last_fix_at, last_arrival_at), error)"""
+        try:
+            state = ETARefreshState.query.get(bus_id)
+            if state is None:
+                return (None, None), None
+            return (state.last_fix_at, state.last_arrival_at), None
+        except Exception as e:
+            return (None, None), str(e)
+    
+    @staticmethod
+    def get_fixes_since(bus_id, since, limit=20000):
+        """Raw fixes of a bus at or after since, oldest first
+        
+        Returns:
+            tuple: (list of (timestamp, latitude, longitude), error)"""
+        try:
+            rows = db.session.query(
+                GPSTracker.timestamp, GPSTracker.latitude, GPSTracker.longitude
+            ).filter(
+                GPSTracker.bus_id == bus_id,
+                GPSTracker.timestamp >= since
+            ).order_by(GPSTracker.timestamp).limit(limit).all()
+            return [tuple(row) for row in rows], None
+        except Exception as e:
+            return [], str(e)
+    
+    @staticmethod
+    def record_segment_samples(bus_id, samples, alpha, last_fix_at, last_arrival_at):
+        """Fold observed segment times into the model and advance the bus's watermarks
+        
+        Both happen in one transaction, so a sample is never counted twice.
+        
+        Args:
+            bus_id: bus the samples were observed on
+            samples: list of (segment_key, hour, seconds)
+            alpha: weight of a new observation once a bucket has 1/alpha samples
+            last_fix_at: new GPS watermark
+            last_arrival_at: new stop-arrival watermark
+        
+        Returns:
+            tuple: (samples_recorded, error)"""
+        try:
+            if samples:
+                keys = {key for key, _, _ in samples}
+                rows = {
+                    (row.segment_key, row.hour): row
+                    for row in SegmentTravelTime.query.filter(SegmentTravelTime.segment_key.in_(keys)).all()
+                }
+                for key, hour, seconds in samples:
+                    row = rows.get((key, hour))
+                    if row is None:
+                        row = SegmentTravelTime(segment_key=key, hour=hour, mean_seconds=seconds, samples=1)
+                        db.session.add(row)
+                        rows[(key, hour)] = row
+                    else:
+                        # Plain average while the bucket is young, then an EWMA
+                        weight = max(alpha, 1.0 / ((row.samples or 0) + 1))
+                        row.mean_seconds += weight * (seconds - row.mean_seconds)
+                        row.samples = (row.samples or 0) + 1
+            
+            state = ETARefreshState.query.get(bus_id)
+            if state is None:
+                state = ETARefreshState(bus_id=bus_id)
+                db.session.add(state)
+            state.last_fix_at = last_fix_at
+            state.last_arrival_at = last_arrival_at
+            
+            db.session.commit()
+            return len(samples), None
+        except Exception as e:
+            db.session.rollback()
+            return 0, str(e)
 
 
 # ==================== ALERT OPERATIONS ====================
@@ -771,6 +2173,8 @@ class AlertOperations:
             )
             db.session.add(alert)
             db.session.commit()
+            geofence_engine.invalidate(bus_id)
+            gps_pipeline.invalidate(bus_id)
             return alert, None
         except Exception as e:
             db.session.rollback()
@@ -791,6 +2195,8 @@ class AlertOperations:
             
             alert.is_active = False
             db.session.commit()
+            geofence_engine.invalidate(alert.bus_id)
+            gps_pipeline.invalidate(alert.bus_id)
             return alert, None
         except Exception as e:
             db.session.rollback()
@@ -810,6 +2216,8 @@ class AlertOperations:
             )
             db.session.add(announcement)
             db.session.commit()
+            geofence_engine.invalidate(bus_id)
+            gps_pipeline.invalidate(bus_id)
             return announcement, None
         except Exception as e:
             db.session.rollback()
@@ -819,6 +2227,104 @@ class AlertOperations:
     def get_bus_announcements(bus_id):
         """Get all announcements for a bus"""
         return Announcement.query.filter_by(bus_id=bus_id).all()
+    
+    @staticmethod
+    def get_pending_fences(bus_id):
+        """Wake-up alerts and announcements of a bus that can still fire
+        
+        Returns:
+            tuple: (list of fence dicts for geofence.Fence, error)"""
+        try:
+            alerts = db.session.query(
+                WakeUpAlert.id, WakeUpAlert.user_id, WakeUpAlert.stop_name, WakeUpAlert.stop_lat,
+                WakeUpAlert.stop_lng, WakeUpAlert.alert_before_time, WakeUpAlert.alert_sent_before
+            ).filter(
+                WakeUpAlert.bus_id == bus_id,
+                WakeUpAlert.is_active == True,
+                WakeUpAlert.alert_sent_after == False
+            ).all()
+            announcements = db.session.query(
+                Announcement.id, Announcement.stop_name, Announcement.stop_lat,
+                Announcement.stop_lng, Announcement.time_before_arrival, Announcement.status
+            ).filter(
+                Announcement.bus_id == bus_id,
+                Announcement.status.in_(('pending', 'announced'))
+            ).all()
+            
+            fences = [{
+                'kind': 'wakeup', 'id': row.id, 'user_id': row.user_id, 'stop_name': row.stop_name,
+                'latitude': row.stop_lat, 'longitude': row.stop_lng,
+                'lead_seconds': row.alert_before_time, 'before_sent': bool(row.alert_sent_before)
+            } for row in alerts]
+            fences.extend({
+                'kind': 'announcement', 'id': row.id, 'stop_name': row.stop_name,
+                'latitude': row.stop_lat, 'longitude': row.stop_lng,
+                'lead_seconds': row.time_before_arrival, 'before_sent': row.status == 'announced'
+            } for row in announcements)
+            return fences, None
+        except Exception as e:
+            return [], str(e)
+    
+    @staticmethod
+    def apply_fence_transitions(transitions):
+        """Record geofence transitions, each at most once, in one transaction
+        
+        Every transition is a conditional UPDATE on the flag it sets, so a
+        transition already recorded (e.g. by another worker) changes no row
+        and is skipped. Wake-up transitions that do apply notify the user.
+        
+        Args:
+            transitions: dicts with kind, id, stage, user_id, stop_name, eta_seconds, at
+        
+        Returns:
+            tuple: (list of transitions applied, error)"""
+        try:
+            alerts = WakeUpAlert.__table__
+            announcements = Announcement.__table__
+            applied = []
+            for transition in transitions:
+                if transition['kind'] == 'wakeup':
+                    if transition['stage'] == 'before':
+                        stmt = alerts.update().where(and_(
+                            alerts.c.id == transition['id'], alerts.c.alert_sent_before == False
+                        )).values(alert_sent_before=True)
+                        title = 'Your stop is coming up'
+                        message = (f"Your bus is about {max(1, round(transition['eta_seconds'] / 60))} "
+                                   f"min from {transition['stop_name']}")
+                    else:
+                        stmt = alerts.update().where(and_(
+                            alerts.c.id == transition['id'], alerts.c.alert_sent_after == False
+                        )).values(alert_sent_before=True, alert_sent_after=True, is_active=False)
+                        title = 'You have reached your stop'
+                        message = f"Your bus has reached {transition['stop_name']}"
+                elif transition['stage'] == 'before':
+                    stmt = announcements.update().where(and_(
+                        announcements.c.id == transition['id'], announcements.c.status == 'pending'
+                    )).values(status='announced', announced_at=transition['at'])
+                else:
+                    stmt = announcements.update().where(and_(
+                        announcements.c.id == transition['id'],
+                        announcements.c.status.in_(('pending', 'announced'))
+                    )).values(status='completed')
+                
+                if db.session.execute(stmt).rowcount != 1:
+                    continue
+                applied.append(transition)
+                if transition['kind'] == 'wakeup':
+                    db.session.add(Notification(
+                        user_id=transition['user_id'],
+                        title=title,
+                        message=message,
+                        notification_type='alert',
+                        related_id=transition['id'],
+                        related_type='wakeup_alert'
+                    ))
+            
+            db.session.commit()
+            return applied, None
+        except Exception as e:
+            db.session.rollback()
+            return [], str(e)
 
 
 # ==================== EMERGENCY OPERATIONS ====================
@@ -0,0 +1,316 @@
+"""
+ETA Engine
+Predicts stop arrival times from learned per-segment, per-hour travel times
+"""
+
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+import numpy as np
+from geo_utils import calculate_distance, haversine_pairwise, haversine_one_to_many, haversine_many_to_many
+from live_state import EPOCH
+
+# Route stop fields the engine caches (plain tuples outlive the request's session)
+CachedStop = namedtuple('CachedStop', ['id', 'stop_order', 'stop_name', 'latitude', 'longitude', 'is_completed'])
+
+# Observed segment speeds outside this range (km/h, straight line) are discarded
+MIN_SEGMENT_SPEED_KMH = 2
+MAX_SEGMENT_SPEED_KMH = 120
+
+
+def segment_key(from_stop, to_stop):
+    """Location-based key of the segment between two stops (~10 m precision)"""
+    return (f'{from_stop.latitude:.4f},{from_stop.longitude:.4f}>'
+            f'{to_stop.latitude:.4f},{to_stop.longitude:.4f}')
+
+
+def detect_stop_visits(stops, fixes, radius_km):
+    """Times at which a track first comes within radius_km of each stop
+     Args:
+        stops: route stops in stop order
+        fixes: list of (timestamp, latitude, longitude), oldest first
+        radius_km: distance counting as "at the stop"
+
+    Returns:
+        list: (stop_index, arrival_time) per visit, consecutive repeats collapsed"""
+    if not fixes or not stops:
+        return []
+    distances = haversine_many_to_many(
+        [fix[1] for fix in fixes], [fix[2] for fix in fixes],
+        [stop.latitude for stop in stops], [stop.longitude for stop in stops]
+    )
+    nearest = distances.argmin(axis=1)
+    inside = distances[np.arange(len(fixes)), nearest] <= radius_km
+
+    visits = []
+    for index in np.flatnonzero(inside).tolist():
+        stop_index = int(nearest[index])
+        if not visits or visits[-1][0] != stop_index:
+            visits.append((stop_index, fixes[index][0]))
+    return visits
+
+
+class ETAEngine:
+    """Segment travel-time model plus a per-bus prediction cache
+
+    The model maps (segment, hour of day) to an exponentially weighted mean
+    travel time. It is rebuilt incrementally from GPS history and recorded
+    stop arrivals, held in memory as {segment_key: [seconds or None] * 24},
+    and a prediction walks the remaining segments once, in O(stops).
+    Predictions are cached per bus and reused until a newer fix arrives.
+    """
+
+    def __init__(self, fallback_speed_kmh=40):
+        self.fallback_speed_kmh = fallback_speed_kmh
+        self.stop_radius_km = 0.075
+        self.alpha = 0.2
+        self.history_days = 14
+        self.max_fixes = 20000
+        self.refresh_interval_s = 0
+
+        self._table = None
+        self._routes = {}        # bus_id -> (stops, segment keys, segment distances km)
+        self._predictions = {}   # bus_id -> (fix ts, predictions)
+        self._refresh_lock = threading.Lock()
+        self._app = None
+        self._thread = None
+
+    # ========== LIFECYCLE ==========
+
+    def init_app(self, app):
+        """Read the ETA_* settings and start the periodic refresher when configured"""
+        self._app = app
+        self.fallback_speed_kmh = app.config.get('ETA_FALLBACK_SPEED_KMH', self.fallback_speed_kmh)
+        self.stop_radius_km = app.config.get('ETA_STOP_RADIUS_M', 75) / 1000
+        self.alpha = app.config.get('ETA_EWMA_ALPHA', self.alpha)
+        self.history_days = app.config.get('ETA_HISTORY_DAYS', self.history_days)
+        self.max_fixes = app.config.get('ETA_MAX_FIXES_PER_REFRESH', self.max_fixes)
+        self.refresh_interval_s = app.config.get('ETA_REFRESH_INTERVAL_S', self.refresh_interval_s)
+
+        if self.refresh_interval_s and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='eta-refresh', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.refresh_interval_s)
+            try:
+                with self._app.app_context():
+                    self.refresh()
+            except Exception:
+                continue
+
+    def invalidate(self, bus_id=None):
+        """Drop cached stops and predictions (one bus, or all buses)"""
+        if bus_id is None:
+            self._routes = {}
+            self._predictions = {}
+        else:
+            self._routes.pop(bus_id, None)
+            self._predictions.pop(bus_id, None)
+
+    def reload(self):
+        """Re-read the segment table on next use (for processes that do not refresh it)"""
+        self._table = None
+        self._predictions = {}
+
+    # ========== MODEL REFRESH ==========
+
+    def refresh(self, now=None):
+        """Fold travel times observed since the last refresh into the model
+
+        Returns:
+            tuple: (samples_recorded, error)"""
+        from database_operations import ETAOperations
+
+        with self._refresh_lock:
+            now = now or datetime.utcnow()
+            bus_ids, error = ETAOperations.get_buses_with_stops()
+            if error:
+                return 0, error
+
+            recorded = 0
+            for bus_id in bus_ids:
+                stops, error = ETAOperations.get_route_stops(bus_id)
+                if error:
+                    return recorded, error
+                (last_fix_at, last_arrival_at), error = ETAOperations.get_refresh_state(bus_id)
+                if error:
+                    return recorded, error
+
+                samples, last_arrival_at = self._arrival_samples(stops, last_arrival_at)
+                since = last_fix_at or now - timedelta(days=self.history_days)
+                fixes, error = ETAOperations.get_fixes_since(bus_id, since, self.max_fixes)
+                if error:
+                    return recorded, error
+                gps_samples, last_fix_at = self._gps_samples(stops, fixes, since)
+                samples.extend(gps_samples)
+
+                count, error = ETAOperations.record_segment_samples(
+                    bus_id, samples, self.alpha, last_fix_at, last_arrival_at
+                )
+                if error:
+                    return recorded, error
+                recorded += count
+
+            table, error = ETAOperations.load_segment_times()
+            if error:
+                return recorded, error
+            self._table = table
+            self._predictions = {}
+            return recorded, None
+
+    def _sample(self, from_stop, to_stop, started, seconds):
+        """(segment_key, hour, seconds) or None when the time is implausible"""
+        if seconds <= 0:
+            return None
+        distance_km = calculate_distance(from_stop.latitude, from_stop.longitude, to_stop.latitude, to_stop.longitude)
+        speed_kmh = distance_km / (seconds / 3600)
+        if not MIN_SEGMENT_SPEED_KMH <= speed_kmh <= MAX_SEGMENT_SPEED_KMH:
+            return None
+        return segment_key(from_stop, to_stop), started.hour, seconds
+
+    def _arrival_samples(self, stops, watermark):
+        """Segment times from consecutive recorded stop arrivals newer than watermark"""
+        samples = []
+        newest = watermark
+        for from_stop, to_stop in zip(stops, stops[1:]):
+            start, end = from_stop.actual_arrival, to_stop.actual_arrival
+            if start is None or end is None or (watermark is not None and end <= watermark):
+                continue
+            sample = self._sample(from_stop, to_stop, start, (end - start).total_seconds())
+            if sample:
+                samples.append(sample)
+            newest = end if newest is None else max(newest, end)
+        return samples, newest
+
+    def _gps_samples(self, stops, fixes, since):
+        """Segment times from stop visits detected in a GPS track
+
+        The new watermark is the start of the last visit, so the next
+        refresh re-reads it and can pair it with the following stop."""
+        visits = detect_stop_visits(stops, fixes, self.stop_radius_km)
+        samples = []
+        for (from_index, started), (to_index, arrived) in zip(visits, visits[1:]):
+            if to_index == from_index + 1:
+                sample = self._sample(stops[from_index], stops[to_index], started, (arrived - started).total_seconds())
+                if sample:
+                    samples.append(sample)
+
+        if visits and visits[-1][1] > since:
+            return samples, visits[-1][1]
+        return samples, fixes[-1][0] if fixes else since
+
+    # ========== PREDICTION ==========
+
+    def _segment_table(self):
+        if self._table is None:
+            from database_operations import ETAOperations
+            table, error = ETAOperations.load_segment_times()
+            if error:
+                return {}
+            self._table = table
+        return self._table
+
+    def _route(self, bus_id):
+        """Stops of a bus with their segment keys and lengths (cached until invalidated)"""
+        route = self._routes.get(bus_id)
+        if route is None:
+            from database_operations import ETAOperations
+            rows, error = ETAOperations.get_route_stops(bus_id)
+            if error:
+                return [], [], []
+            stops = [
+                CachedStop(row.id, row.stop_order, row.stop_name, row.latitude, row.longitude, bool(row.is_completed))
+                for row in rows
+            ]
+            lats = [stop.latitude for stop in stops]
+            lngs = [stop.longitude for stop in stops]
+            route = (
+                stops,
+                [segment_key(a, b) for a, b in zip(stops, stops[1:])],
+                haversine_pairwise(lats[:-1], lngs[:-1], lats[1:], lngs[1:]).tolist()
+            )
+            self._routes[bus_id] = route
+        return route
+
+    def _segment_seconds(self, table, key, distance_km, at):
+        """Learned time for a segment at the given moment, else the fallback speed"""
+        hours = table.get(key)
+        if hours is not None and hours[at.hour] is not None:
+            return hours[at.hour], 'historical'
+        return distance_km / self.fallback_speed_kmh * 3600, 'fallback'
+
+    def segment_seconds(self, key, distance_km, at=None):
+        """Expected travel time over one segment starting at `at` (default now)
+
+        Returns:
+            tuple: (seconds, source)"""
+        return self._segment_seconds(self._segment_table(), key, distance_km, at or datetime.utcnow())
+
+    def predict(self, bus_id, position):
+        """ETA to every remaining stop of a bus
+         Args:
+            bus_id: bus to predict for
+            position: live state (latitude, longitude and ts of the newest fix)
+
+        Returns:
+            list: dicts with stop_id, stop_name, stop_order, distance_km,
+            eta_minutes and source ('historical' or 'fallback')"""
+        ts = position.get('ts')
+        cached = self._predictions.get(bus_id)
+        if cached is not None and ts is not None and cached[0] == ts:
+            return cached[1]
+
+        stops, keys, lengths = self._route(bus_id)
+        remaining = [index for index, stop in enumerate(stops) if not stop.is_completed]
+        if not remaining:
+            return []
+
+        table = self._segment_table()
+        now = EPOCH + timedelta(seconds=ts) if ts is not None else datetime.utcnow()
+        distances_km = haversine_one_to_many(
+            position['latitude'], position['longitude'],
+            [stops[index].latitude for index in remaining],
+            [stops[index].longitude for index in remaining]
+        ).tolist()
+
+        predictions = []
+        elapsed = 0.0
+        for position_index, (stop_index, distance_km) in enumerate(zip(remaining, distances_km)):
+            if position_index == 0:
+                if stop_index > 0:
+                    # Partway along the segment into the next stop: scale its learned time
+                    seconds, source = self._segment_seconds(
+                        table, keys[stop_index - 1], lengths[stop_index - 1], now
+                    )
+                    if lengths[stop_index - 1] > 0:
+                        seconds *= min(1.0, distance_km / lengths[stop_index - 1])
+                else:
+                    seconds, source = distance_km / self.fallback_speed_kmh * 3600, 'fallback'
+            else:
+                seconds, segment_source = self._segment_seconds(
+                    table, keys[stop_index - 1], lengths[stop_index - 1], now + timedelta(seconds=elapsed)
+                )
+                if segment_source == 'fallback':
+                    source = 'fallback'
+            elapsed += seconds
+
+            stop = stops[stop_index]
+            predictions.append({
+                'stop_id': stop.id,
+                'stop_name': stop.stop_name,
+                'stop_order': stop.stop_order,
+                'distance_km': round(distance_km, 2),
+                'eta_minutes': round(elapsed / 60),
+                'source': source
+            })
+
+        if ts is not None:
+            self._predictions[bus_id] = (ts, predictions)
+        return predictions
+
+
+# Shared engine instance (configured by init_app in app.py)
+eta_engine = ETAEngine()
@@ -0,0 +1,162 @@
+"""
+Geo Utilities
+Distance, bearing and arrival-time helpers shared by the GPS modules
+"""
+
+import math
+import numpy as np
+
+# Earth's mean radius in kilometers
+EARTH_RADIUS_KM = 6371
+# Kilometres per degree of latitude, and of longitude at the equator
+KM_PER_DEG_LAT = 110.574
+KM_PER_DEG_LNG = 111.32
+
+
+def calculate_distance(lat1, lon1, lat2, lon2):
+    """Calculate distance between two coordinates using Haversine formula (in km)"""
+    R = EARTH_RADIUS_KM
+    
+    lat1_rad = math.radians(lat1)
+    lat2_rad = math.radians(lat2)
+    delta_lat = math.radians(lat2 - lat1)
+    delta_lon = math.radians(lon2 - lon1)
+    
+    a = math.sin(delta_lat/2) ** 2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lon/2) ** 2
+    c = 2 * math.asin(math.sqrt(a))
+    
+    return R * c
+
+
+def calculate_bearing(lat1, lon1, lat2, lon2):
+    """Calculate bearing between two coordinates"""
+    lat1_rad = math.radians(lat1)
+    lat2_rad = math.radians(lat2)
+    delta_lon = math.radians(lon2 - lon1)
+    
+    y = math.sin(delta_lon) * math.cos(lat2_rad)
+    x = math.cos(lat1_rad) * math.sin(lat2_rad) - math.sin(lat1_rad) * math.cos(lat2_rad) * math.cos(delta_lon)
+    
+    bearing = math.degrees(math.atan2(y, x))
+    return (bearing + 360) % 360
+
+
+def radius_to_bbox(latitude, longitude, radius_km):
+    """Bounding box (min_lat, min_lng, max_lat, max_lng) enclosing a circle"""
+    lat_delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos_lat = max(math.cos(math.radians(latitude)), 1e-6)
+    lng_delta = min(math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat)), 180)
+    return (
+        max(latitude - lat_delta, -90),
+        longitude - lng_delta,
+        min(latitude + lat_delta, 90),
+        longitude + lng_delta
+    )
+
+
+# ========== VECTORIZED KERNELS ==========
+
+def haversine_one_to_many(lat, lng, lats, lngs):
+    """Distances (km) from one point to arrays of points"""
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lngs = np.radians(np.asarray(lngs, dtype=np.float64))
+    lat_rad = math.radians(lat)
+
+    a = np.sin((lats - lat_rad) / 2) ** 2 + math.cos(lat_rad) * np.cos(lats) * np.sin((lngs - math.radians(lng)) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def haversine_many_to_many(lats1, lngs1, lats2, lngs2):
+    """Distance matrix (km) of shape (len(lats1), len(lats2))"""
+    lats1 = np.radians(np.asarray(lats1, dtype=np.float64))[:, None]
+    lngs1 = np.radians(np.asarray(lngs1, dtype=np.float64))[:, None]
+    lats2 = np.radians(np.asarray(lats2, dtype=np.float64))[None, :]
+    lngs2 = np.radians(np.asarray(lngs2, dtype=np.float64))[None, :]
+
+    a = np.sin((lats2 - lats1) / 2) ** 2 + np.cos(lats1) * np.cos(lats2) * np.sin((lngs2 - lngs1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def haversine_pairwise(lats1, lngs1, lats2, lngs2):
+    """Element-wise distances (km) between two equal-length point arrays"""
+    lats1 = np.radians(np.asarray(lats1, dtype=np.float64))
+    lngs1 = np.radians(np.asarray(lngs1, dtype=np.float64))
+    lats2 = np.radians(np.asarray(lats2, dtype=np.float64))
+    lngs2 = np.radians(np.asarray(lngs2, dtype=np.float64))
+
+    a = np.sin((lats2 - lats1) / 2) ** 2 + np.cos(lats1) * np.cos(lats2) * np.sin((lngs2 - lngs1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+
+def bearing_one_to_many(lat, lng, lats, lngs):
+    """Bearings (degrees, 0-360) from one point to arrays of points"""
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    delta_lon = np.radians(np.asarray(lngs, dtype=np.float64)) - math.radians(lng)
+    lat_rad = math.radians(lat)
+
+    y = np.sin(delta_lon) * np.cos(lats)
+    x = math.cos(lat_rad) * np.sin(lats) - math.sin(lat_rad) * np.cos(lats) * np.cos(delta_lon)
+    return (np.degrees(np.arctan2(y, x)) + 360) % 360
+
+
+def bearing_pairwise(lats1, lngs1, lats2, lngs2):
+    """Element-wise bearings (degrees, 0-360) between two equal-length point arrays"""
+    lats1 = np.radians(np.asarray(lats1, dtype=np.float64))
+    lats2 = np.radians(np.asarray(lats2, dtype=np.float64))
+    delta_lon = np.radians(np.asarray(lngs2, dtype=np.float64) - np.asarray(lngs1, dtype=np.float64))
+
+    y = np.sin(delta_lon) * np.cos(lats2)
+    x = np.cos(lats1) * np.sin(lats2) - np.sin(lats1) * np.cos(lats2) * np.cos(delta_lon)
+    return (np.degrees(np.arctan2(y, x)) + 360) % 360
+
+
+def estimate_arrival_times(current_lat, current_lng, stop_lats, stop_lngs, speed_kmh=40):
+    """Straight-line arrival estimates (minutes) to many stops
+
+    Returns:
+        tuple: (distances_km, eta_minutes) arrays; eta_minutes is None when
+        speed_kmh is 0"""
+    distances_km = haversine_one_to_many(current_lat, current_lng, stop_lats, stop_lngs)
+    if speed_kmh == 0:
+        return distances_km, None
+    return distances_km, distances_km / speed_kmh * 60
+
+
+class PolylineProjector:
+    """Projects positions onto the segments of a polyline
+
+    Coordinates are projected once onto a plane around the polyline's mean
+    latitude, so projecting a position onto any set of segments is a
+    handful of vectorized operations.
+    """
+
+    def __init__(self, lats, lngs):
+        lats = np.asarray(lats, dtype=np.float64)
+        lngs = np.asarray(lngs, dtype=np.float64)
+        self._kx = KM_PER_DEG_LNG * math.cos(math.radians(float(lats.mean()))) if len(lats) else KM_PER_DEG_LNG
+        x = lngs * self._kx
+        y = lats * KM_PER_DEG_LAT
+        self._x0, self._y0 = x[:-1], y[:-1]
+        self._dx, self._dy = x[1:] - x[:-1], y[1:] - y[:-1]
+        self._len_sq = self._dx ** 2 + self._dy ** 2
+
+    @property
+    def segment_count(self):
+        return len(self._dx)
+
+    def project(self, latitude, longitude, segments=slice(None)):
+        """Position of a point relative to some of the segments
+         Args:
+            segments: slice or array of segment indexes
+
+        Returns:
+            tuple: (t, offsets_km) arrays; t is unclamped (0 at a segment's
+            start, 1 at its end), offsets_km is the distance to its closest point"""
+        px = longitude * self._kx - self._x0[segments]
+        py = latitude * KM_PER_DEG_LAT - self._y0[segments]
+        dx, dy, len_sq = self._dx[segments], self._dy[segments], self._len_sq[segments]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            t = np.where(len_sq > 0, (px * dx + py * dy) / len_sq, 0.0)
+        clamped = np.clip(t, 0.0, 1.0)
+        return t, np.hypot(px - clamped * dx, py - clamped * dy)
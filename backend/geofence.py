@@ -0,0 +1,198 @@
+"""
+Geofence Engine
+Evaluates wake-up alerts and stop announcements against incoming GPS fixes
+"""
+
+import math
+import threading
+import time
+from geo_utils import estimate_arrival_times
+
+
+class Fence:
+    """One pending trigger around a stop (a WakeUpAlert or an Announcement)"""
+
+    __slots__ = ('kind', 'id', 'user_id', 'stop_name', 'latitude', 'longitude',
+                 'lead_seconds', 'before_sent', 'after_sent', 'closest_km')
+
+    def __init__(self, kind, id, stop_name, latitude, longitude, lead_seconds,
+                 before_sent=False, after_sent=False, user_id=None):
+        self.kind = kind
+        self.id = id
+        self.user_id = user_id
+        self.stop_name = stop_name
+        self.latitude = latitude
+        self.longitude = longitude
+        self.lead_seconds = lead_seconds or 0
+        self.before_sent = before_sent
+        self.after_sent = after_sent
+        self.closest_km = None
+
+
+class BusFences:
+    """Grid of one bus's pending fences
+
+    Each fence sits in the cell of its stop. A fix only checks the fences
+    in its own cell and the eight around it, so the cost follows the
+    number of alerts near the bus rather than all alerts of the bus.
+    """
+
+    def __init__(self, fences, cell_deg):
+        self.cell_deg = cell_deg
+        self.loaded_at = time.monotonic()
+        self.cells = {}
+        for fence in fences:
+            self.cells.setdefault(self._cell(fence.latitude, fence.longitude), []).append(fence)
+
+    def _cell(self, latitude, longitude):
+        return (math.floor(latitude / self.cell_deg), math.floor(longitude / self.cell_deg))
+
+    def near(self, latitude, longitude):
+        row, col = self._cell(latitude, longitude)
+        for dr in (-1, 0, 1):
+            for dc in (-1, 0, 1):
+                yield from self.cells.get((row + dr, col + dc), ())
+
+    def discard(self, fence):
+        cell = self._cell(fence.latitude, fence.longitude)
+        members = self.cells.get(cell)
+        if members and fence in members:
+            members.remove(fence)
+            if not members:
+                del self.cells[cell]
+
+
+class GeofenceEngine:
+    """Per-bus fence grids checked on every ingested fix
+
+    A fence fires 'before' once the bus is within its lead time of the stop
+    (distance over current speed, floored at min_speed_kmh), and 'after'
+    once the bus reaches the stop or is seen moving away after passing
+    close to it. Transitions are written with conditional updates, so each
+    fires once even with several workers ingesting.
+    """
+
+    def __init__(self, cell_deg=0.02):
+        self.cell_deg = cell_deg
+        self.arrival_radius_km = 0.1
+        self.min_speed_kmh = 10
+        self.reload_seconds = 30
+        self._buses = {}     # bus_id -> BusFences
+        self._lock = threading.Lock()
+        self.stats = {'fixes': 0, 'checks': 0, 'fired': 0, 'errors': 0}
+
+    def init_app(self, app):
+        """Read the GEOFENCE_* settings"""
+        self.cell_deg = app.config.get('GEOFENCE_CELL_DEG', self.cell_deg)
+        self.arrival_radius_km = app.config.get('GEOFENCE_ARRIVAL_RADIUS_M', 100) / 1000
+        self.min_speed_kmh = app.config.get('GEOFENCE_MIN_SPEED_KMH', self.min_speed_kmh)
+        self.reload_seconds = app.config.get('GEOFENCE_RELOAD_S', self.reload_seconds)
+
+    @property
+    def max_lead_km(self):
+        """Farthest a fence can fire from: one cell, the reach of the 3x3 lookup"""
+        return self.cell_deg * 110.574
+
+    def invalidate(self, bus_id=None):
+        """Reload a bus's fences (or all) on the next fix, e.g. after alerts changed"""
+        with self._lock:
+            if bus_id is None:
+                self._buses = {}
+            else:
+                self._buses.pop(bus_id, None)
+
+    def _fences(self, bus_id):
+        fences = self._buses.get(bus_id)
+        if fences is None or time.monotonic() - fences.loaded_at > self.reload_seconds:
+            from database_operations import AlertOperations
+            rows, error = AlertOperations.get_pending_fences(bus_id)
+            if error:
+                return fences
+            fences = BusFences([Fence(**row) for row in rows], self.cell_deg)
+            with self._lock:
+                self._buses[bus_id] = fences
+        return fences
+
+    def check(self, fix):
+        """Transitions caused by one fix, updating the in-memory fence state"""
+        fences = self._fences(fix['bus_id'])
+        if fences is None or not fences.cells:
+            return []
+
+        candidates = list(fences.near(fix['latitude'], fix['longitude']))
+        if not candidates:
+            return []
+
+        speed_kmh = max(fix.get('speed') or 0, self.min_speed_kmh)
+        distances_km, eta_minutes = estimate_arrival_times(
+            fix['latitude'], fix['longitude'],
+            [fence.latitude for fence in candidates], [fence.longitude for fence in candidates], speed_kmh
+        )
+        distances_km = distances_km.tolist()
+        eta_seconds_all = (eta_minutes * 60).tolist() if eta_minutes is not None else [math.inf] * len(candidates)
+
+        transitions = []
+        for fence, distance_km, eta_seconds in zip(candidates, distances_km, eta_seconds_all):
+            self.stats['checks'] += 1
+
+            if not fence.before_sent and (
+                distance_km <= self.arrival_radius_km
+                or (eta_seconds <= fence.lead_seconds and distance_km <= self.max_lead_km)
+            ):
+                fence.before_sent = True
+                transitions.append(_transition(fence, 'before', fix, eta_seconds))
+
+            passed = (
+                fence.before_sent
+                and fence.closest_km is not None
+                and fence.closest_km <= 3 * self.arrival_radius_km
+                and distance_km > fence.closest_km + self.arrival_radius_km
+            )
+            if distance_km <= self.arrival_radius_km or passed:
+                fence.after_sent = True
+                transitions.append(_transition(fence, 'after', fix, 0))
+                fences.discard(fence)
+
+            if fence.closest_km is None or distance_km < fence.closest_km:
+                fence.closest_km = distance_km
+        return transitions
+
+    def process(self, fixes):
+        """Evaluate a batch of fixes (oldest first per bus) and persist what fired
+
+        Returns:
+            list: transitions that were recorded"""
+        transitions = []
+        for fix in sorted(fixes, key=lambda fix: fix['timestamp']):
+            self.stats['fixes'] += 1
+            transitions.extend(self.check(fix))
+        if not transitions:
+            return []
+
+        from database_operations import AlertOperations
+        fired, error = AlertOperations.apply_fence_transitions(transitions)
+        if error:
+            self.stats['errors'] += 1
+            # Let the next fix retry from the database state
+            for bus_id in {transition['bus_id'] for transition in transitions}:
+                self.invalidate(bus_id)
+            return []
+        self.stats['fired'] += len(fired)
+        return fired
+
+
+def _transition(fence, stage, fix, eta_seconds):
+    return {
+        'kind': fence.kind,
+        'id': fence.id,
+        'stage': stage,
+        'bus_id': fix['bus_id'],
+        'user_id': fence.user_id,
+        'stop_name': fence.stop_name,
+        'eta_seconds': eta_seconds,
+        'at': fix['timestamp']
+    }
+
+
+# Shared engine instance (configured by init_app in app.py)
+geofence_engine = GeofenceEngine()
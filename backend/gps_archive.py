@@ -0,0 +1,215 @@
+"""
+GPS Cold Archive
+Closed days of GPS history exported per bus into columnar .npy files and read back memory-mapped
+"""
+
+import os
+import shutil
+from collections import namedtuple
+from datetime import datetime, timedelta
+import numpy as np
+
+# One file per column: <root>/bus_<id>/<YYYY-MM-DD>/<column>.npy
+# dt_ms is milliseconds since the day's midnight UTC, which fits an int32
+COLUMNS = (
+    ('dt_ms', np.int32),
+    ('latitude', np.float32),
+    ('longitude', np.float32),
+    ('speed', np.float16),
+    ('heading', np.float16),
+)
+DAY_FORMAT = '%Y-%m-%d'
+
+# Archived fix, shaped like the history query rows
+ArchivedFix = namedtuple('ArchivedFix', ['latitude', 'longitude', 'timestamp', 'speed', 'heading'])
+
+
+class GPSArchive:
+    """Per-bus, per-day columnar archive of GPS fixes
+
+    Each day is written once (and rewritten only if late fixes arrive), so
+    files are immutable in practice. Reads memory-map the columns and use a
+    binary search on dt_ms, touching only the pages of the requested range.
+    """
+
+    def __init__(self, root='instance/gps_archive'):
+        self.root = root
+        self.enabled = False
+
+    def init_app(self, app):
+        """Read GPS_ARCHIVE_ENABLED / GPS_ARCHIVE_PATH"""
+        self.root = app.config.get('GPS_ARCHIVE_PATH', self.root)
+        self.enabled = app.config.get('GPS_ARCHIVE_ENABLED', False)
+
+    def _day_dir(self, bus_id, day):
+        return os.path.join(self.root, f'bus_{bus_id}', day.strftime(DAY_FORMAT))
+
+    # ========== WRITING ==========
+
+    def write_day(self, bus_id, day, rows):
+        """Store one bus's fixes for one UTC day, merging with any existing file
+         Args:
+            bus_id: bus the fixes belong to
+            day: date of the fixes (UTC)
+            rows: iterable of (latitude, longitude, timestamp, speed, heading)
+
+        Returns:
+            int: number of fixes in the day's archive after the write"""
+        midnight = datetime(day.year, day.month, day.day)
+        rows = list(rows)
+        new = {
+            'dt_ms': np.array([int((row[2] - midnight).total_seconds() * 1000) for row in rows], dtype=np.int32),
+            'latitude': np.array([row[0] for row in rows], dtype=np.float32),
+            'longitude': np.array([row[1] for row in rows], dtype=np.float32),
+            'speed': np.array([row[3] or 0 for row in rows], dtype=np.float16),
+            'heading': np.array([row[4] or 0 for row in rows], dtype=np.float16),
+        }
+
+        existing = self._load_day(bus_id, day, mmap=False)
+        if existing is not None:
+            new = {name: np.concatenate([existing[name], new[name]]) for name, _ in COLUMNS}
+        # Sorted by time; a fix archived twice (same millisecond) is kept once
+        _, order = np.unique(new['dt_ms'], return_index=True)
+
+        # Write into a temporary directory and swap it in, so readers never see half a day
+        final_dir = self._day_dir(bus_id, day)
+        tmp_dir = final_dir + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for name, dtype in COLUMNS:
+            np.save(os.path.join(tmp_dir, f'{name}.npy'), new[name][order].astype(dtype, copy=False))
+        if os.path.isdir(final_dir):
+            old_dir = final_dir + '.old'
+            shutil.rmtree(old_dir, ignore_errors=True)
+            os.rename(final_dir, old_dir)
+            os.rename(tmp_dir, final_dir)
+            shutil.rmtree(old_dir, ignore_errors=True)
+        else:
+            os.rename(tmp_dir, final_dir)
+        return len(order)
+
+    # ========== READING ==========
+
+    def _load_day(self, bus_id, day, mmap=True):
+        day_dir = self._day_dir(bus_id, day)
+        if not os.path.isdir(day_dir):
+            return None
+        return {
+            name: np.load(os.path.join(day_dir, f'{name}.npy'), mmap_mode='r' if mmap else None)
+            for name, _ in COLUMNS
+        }
+
+    def days(self, bus_id):
+        """Archived days of a bus, oldest first"""
+        bus_dir = os.path.join(self.root, f'bus_{bus_id}')
+        if not os.path.isdir(bus_dir):
+            return []
+        days = []
+        for name in os.listdir(bus_dir):
+            try:
+                days.append(datetime.strptime(name, DAY_FORMAT).date())
+            except ValueError:
+                continue  # .tmp / .old leftovers
+        return sorted(days)
+
+    def read_range(self, bus_id, since=None, until=None, limit=None):
+        """Archived fixes of a bus in [since, until), newest `limit` of them
+         Args:
+            bus_id: bus to read
+            since: inclusive lower bound (naive UTC) or None
+            until: exclusive upper bound (naive UTC) or None
+            limit: maximum fixes returned, counted from the newest
+
+        Returns:
+            list: ArchivedFix tuples in chronological order"""
+        chunks = []
+        remaining = limit
+        for day in reversed(self.days(bus_id)):
+            midnight = datetime(day.year, day.month, day.day)
+            if until is not None and midnight >= until:
+                continue
+            if since is not None and midnight + timedelta(days=1) <= since:
+                break
+
+            columns = self._load_day(bus_id, day)
+            if columns is None:
+                continue
+            dt_ms = columns['dt_ms']
+            lo = 0 if since is None or since <= midnight else int(
+                np.searchsorted(dt_ms, (since - midnight).total_seconds() * 1000, side='left'))
+            hi = len(dt_ms) if until is None else int(
+                np.searchsorted(dt_ms, (until - midnight).total_seconds() * 1000, side='left'))
+            if remaining is not None:
+                lo = max(lo, hi - remaining)
+            if hi <= lo:
+                continue
+
+            # Slicing a memmap only reads the pages in [lo, hi)
+            offsets = dt_ms[lo:hi].tolist()
+            chunks.append([
+                ArchivedFix(latitude, longitude, midnight + timedelta(milliseconds=offset), speed, heading)
+                for offset, latitude, longitude, speed, heading in zip(
+                    offsets,
+                    columns['latitude'][lo:hi].tolist(),
+                    columns['longitude'][lo:hi].tolist(),
+                    columns['speed'][lo:hi].tolist(),
+                    columns['heading'][lo:hi].tolist()
+                )
+            ])
+            if remaining is not None:
+                remaining -= hi - lo
+                if remaining <= 0:
+                    break
+
+        fixes = []
+        for chunk in reversed(chunks):
+            fixes.extend(chunk)
+        return fixes
+
+
+def archive_closed_days(config, now=None):
+    """Move GPS fixes of days older than GPS_ARCHIVE_AFTER_DAYS into the archive
+
+    Each bus-day is written to disk first and only the archived rows are
+    then deleted from gps_trackers, in bounded batches. A crash can at
+    worst leave rows that are archived again on the next run (duplicates
+    are dropped on merge), and late fixes for an archived day are merged
+    into its files.
+
+    Returns:
+        tuple: (summary dict, error)"""
+    from database_operations import RetentionOperations
+
+    now = now or datetime.utcnow()
+    today = datetime(now.year, now.month, now.day)
+    cutoff = today - timedelta(days=config.get('GPS_ARCHIVE_AFTER_DAYS', 2))
+    batch_size = config.get('GPS_RETENTION_BATCH_SIZE', 2000)
+
+    oldest, error = RetentionOperations.get_oldest_fix_time()
+    if error or oldest is None:
+        return {'days': 0, 'bus_days': 0, 'fixes': 0}, error
+
+    summary = {'days': 0, 'bus_days': 0, 'fixes': 0}
+    day_start = datetime(oldest.year, oldest.month, oldest.day)
+    while day_start < cutoff:
+        day_end = day_start + timedelta(days=1)
+        bus_ids, error = RetentionOperations.get_buses_with_fixes(day_start, day_end)
+        if error:
+            return summary, error
+        for bus_id in bus_ids:
+            rows, error = RetentionOperations.get_fixes_between(bus_id, day_start, day_end)
+            if error:
+                return summary, error
+            gps_archive.write_day(bus_id, day_start.date(), [row[1:] for row in rows])
+            deleted, error = RetentionOperations.delete_fixes([row[0] for row in rows], batch_size)
+            if error:
+                return summary, error
+            summary['bus_days'] += 1
+            summary['fixes'] += deleted
+        summary['days'] += 1
+        day_start = day_end
+    return summary, None
+
+
+# Shared archive instance (configured by init_app in app.py)
+gps_archive = GPSArchive()
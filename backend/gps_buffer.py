@@ -0,0 +1,260 @@
+"""
+GPS Write-Behind Buffer
+Holds accepted GPS fixes in memory and persists them to gps_trackers in bulk
+"""
+
+import atexit
+import threading
+import time
+from collections import deque
+
+
+class GPSWriteBuffer:
+    """Bounded per-bus ring buffers drained by a background flusher thread
+
+    Fixes are visible to readers as soon as they are appended. The flusher
+    writes them with one bulk call every min(`flush_interval_ms`,
+    `max_loss_ms`), or sooner when `flush_max_rows` fixes are pending.
+
+    Durability: a fix lives only in memory until the flush carrying it
+    commits. While writes succeed, a crash loses at most one tick of fixes
+    plus the write in flight. A failed batch goes back to its rings and is
+    retried on the next ticks, so during an outage fixes wait longer than
+    `max_loss_ms`. Each ring still holds at most `capacity_per_bus`; the
+    oldest rows past that go to `dead_letters`. After `max_retries` failed
+    flushes in a row the batch is split in halves until the rows that fail
+    on their own are found. Those rows go to `dead_letters` too, so one bad
+    row cannot block the fleet. `dead_letters` is in memory and bounded by
+    `dead_letter_capacity`, so it is lost on restart.
+    """
+
+    def __init__(self, capacity_per_bus=600, flush_interval_ms=1000, flush_max_rows=2000,
+                 max_loss_ms=5000, block_timeout_ms=200, max_retries=3, dead_letter_capacity=10000):
+        self.capacity_per_bus = capacity_per_bus
+        self.flush_interval_ms = flush_interval_ms
+        self.flush_max_rows = flush_max_rows
+        self.max_loss_ms = max_loss_ms
+        self.block_timeout_ms = block_timeout_ms
+        self.max_retries = max_retries
+
+        self.enabled = False
+        self._app = None
+        self._writer = None
+        self._probe = None
+        self._pending = {}        # bus_id -> deque of unflushed fixes
+        self._latest = {}         # bus_id -> newest fix seen
+        self._pending_count = 0
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+        self._failures = 0        # flushes failed in a row
+        self.dead_letters = deque(maxlen=dead_letter_capacity)
+
+        self.stats = {'appended': 0, 'flushed': 0, 'rejected': 0, 'flush_errors': 0, 'dead_lettered': 0}
+
+    # ========== LIFECYCLE ==========
+
+    def init_app(self, app, writer, probe=None):
+        """Configure from app.config and start the flusher when enabled
+         Args:
+            app: Flask app (flushes run inside its app context)
+            writer: callable taking a list of fixes, returning (count, error)
+            probe: optional callable returning True while the database is
+                reachable; tells a bad row from an outage when a batch is split"""
+        self._app = app
+        self._writer = writer
+        self._probe = probe
+        self.enabled = app.config.get('GPS_WRITE_BEHIND', False)
+        self.capacity_per_bus = app.config.get('GPS_BUFFER_CAPACITY_PER_BUS', self.capacity_per_bus)
+        self.flush_interval_ms = app.config.get('GPS_FLUSH_INTERVAL_MS', self.flush_interval_ms)
+        self.flush_max_rows = app.config.get('GPS_FLUSH_MAX_ROWS', self.flush_max_rows)
+        self.max_loss_ms = app.config.get('GPS_MAX_LOSS_MS', self.max_loss_ms)
+        self.block_timeout_ms = app.config.get('GPS_BUFFER_BLOCK_TIMEOUT_MS', self.block_timeout_ms)
+        self.max_retries = app.config.get('GPS_FLUSH_MAX_RETRIES', self.max_retries)
+        capacity = app.config.get('GPS_DEAD_LETTER_CAPACITY', self.dead_letters.maxlen)
+        if capacity != self.dead_letters.maxlen:
+            self.dead_letters = deque(self.dead_letters, maxlen=capacity)
+
+        if self.enabled and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='gps-write-behind', daemon=True)
+            self._thread.start()
+            atexit.register(self.shutdown)
+
+    def shutdown(self):
+        """Stop the flusher and persist everything still pending"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=max(self.flush_interval_ms, self.max_loss_ms) / 1000 + 5)
+            self._thread = None
+        self.flush()
+
+    # ========== PRODUCER SIDE ==========
+
+    def append(self, fix):
+        """Queue one fix for persistence
+
+        Blocks for up to `block_timeout_ms` when the bus's ring is full
+        (backpressure), then gives up.
+
+        Returns:
+            tuple: (accepted, error_message)"""
+        bus_id = fix['bus_id']
+        deadline = time.monotonic() + self.block_timeout_ms / 1000
+
+        with self._condition:
+            while len(self._pending.get(bus_id, ())) >= self.capacity_per_bus:
+                self._condition.notify_all()  # wake the flusher to make room
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._stopping:
+                    self.stats['rejected'] += 1
+                    return False, 'GPS buffer full, retry later'
+                self._condition.wait(remaining)
+
+            ring = self._pending.get(bus_id)
+            if ring is None:
+                ring = self._pending[bus_id] = deque()
+            fix['_enqueued_at'] = time.monotonic()
+            ring.append(fix)
+            self._pending_count += 1
+            self.stats['appended'] += 1
+
+            current = self._latest.get(bus_id)
+            if current is None or fix['timestamp'] >= current['timestamp']:
+                self._latest[bus_id] = fix
+
+            if self._pending_count >= self.flush_max_rows:
+                self._condition.notify_all()
+
+        return True, None
+
+    # ========== READ SIDE ==========
+
+    def latest(self, bus_id):
+        """Newest fix seen for a bus, flushed or not"""
+        return self._latest.get(bus_id)
+
+    def pending(self, bus_id):
+        """Unflushed fixes for a bus, oldest first"""
+        with self._condition:
+            return list(self._pending.get(bus_id, ()))
+
+    def pending_count(self):
+        """Number of fixes waiting to be persisted"""
+        return self._pending_count
+
+    # ========== FLUSHING ==========
+
+    def flush(self):
+        """Persist all pending fixes with a single bulk write
+
+        On failure the fixes go back to the front of their rings and are
+        retried on the next tick. Once `max_retries` flushes have failed in a
+        row, the batch is split to write every row that can be written.
+
+        Returns:
+            tuple: (rows_written, error_message)"""
+        with self._flush_lock:
+            with self._condition:
+                if not self._pending_count:
+                    return 0, None
+                drained = self._pending
+                self._pending = {}
+                self._pending_count = 0
+                self._condition.notify_all()
+
+            fixes = [fix for ring in drained.values() for fix in ring]
+
+            if self._app is not None:
+                with self._app.app_context():
+                    return self._flush(fixes)
+            return self._flush(fixes)
+
+    def _flush(self, fixes):
+        written, error = self._writer(fixes)
+        if not error:
+            self._failures = 0
+            self.stats['flushed'] += written
+            return written, None
+
+        self.stats['flush_errors'] += 1
+        self._failures += 1
+        if self._failures < self.max_retries:
+            self._requeue(fixes)
+            return 0, error
+
+        written, unwritten = self._isolate(fixes)
+        self.stats['flushed'] += written
+        # Done splitting: either the bad rows are gone, or the database is
+        # down and the next attempts start from plain retries again
+        self._failures = 0
+        if unwritten:
+            self._requeue(unwritten)
+            return written, error
+        return written, None
+
+    def _isolate(self, fixes):
+        """Write fixes in ever smaller slices, dead-lettering rows that fail alone
+
+        Returns:
+            tuple: (rows_written, fixes_left) where fixes_left is non-empty
+            when the database looks unreachable rather than a row being bad"""
+        written = 0
+        reachable = False
+        slices = [fixes]
+        while slices:
+            chunk = slices.pop()
+            count, error = self._writer(chunk)
+            if not error:
+                written += count
+                reachable = True
+            elif len(chunk) > 1:
+                middle = len(chunk) // 2
+                slices.append(chunk[middle:])
+                slices.append(chunk[:middle])
+            elif reachable or self._probe is None or self._probe():
+                reachable = True
+                self._dead_letter(chunk)
+            else:
+                return written, chunk + [fix for rest in reversed(slices) for fix in rest]
+        return written, []
+
+    def _requeue(self, fixes):
+        """Put unwritten fixes back in front of newer ones, keeping each ring's bound"""
+        with self._condition:
+            rings = {}
+            for fix in fixes:
+                rings.setdefault(fix['bus_id'], deque()).append(fix)
+            overflow = []
+            for bus_id, ring in rings.items():
+                ring.extend(self._pending.get(bus_id, ()))
+                while len(ring) > self.capacity_per_bus:
+                    overflow.append(ring.popleft())
+                self._pending[bus_id] = ring
+            self._pending_count = sum(len(ring) for ring in self._pending.values())
+        self._dead_letter(overflow)
+
+    def _dead_letter(self, fixes):
+        self.dead_letters.extend(fixes)
+        self.stats['dead_lettered'] += len(fixes)
+
+    def _run(self):
+        """Flusher loop: wake on interval, row threshold or loss-window expiry"""
+        tick = min(self.flush_interval_ms, self.max_loss_ms) / 1000
+        while True:
+            with self._condition:
+                if not self._stopping and self._pending_count < self.flush_max_rows:
+                    self._condition.wait(tick)
+                if self._stopping:
+                    return
+                # Every tick drains the buffer, so no fix waits longer than
+                # min(flush interval, loss window) plus one write
+                due = self._pending_count > 0
+            if due:
+                self.flush()
+
+
+# Shared buffer instance (configured by init_app in app.py)
+gps_write_buffer = GPSWriteBuffer()
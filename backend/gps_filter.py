@@ -0,0 +1,123 @@
+"""
+GPS Ingest Filter
+Drops redundant fixes (a parked or idling bus) before they are written to gps_trackers
+"""
+
+import threading
+from geo_utils import calculate_distance
+
+# Verdicts of GPSFilter.check
+STORE = 'store'
+SKIP = 'skip'
+INACCURATE = 'inaccurate'
+
+# Below this speed (km/h) the reported heading is noise and is ignored
+STATIONARY_SPEED_KMH = 3
+
+
+class GPSFilter:
+    """Per-bus comparison of each fix with the last one written
+
+    A fix is stored when the bus has moved at least `min_distance_m` or
+    turned by `min_heading_deg` since the last stored fix, or when
+    `keepalive_s` has passed without one. Other fixes are redundant: they
+    still update the live position, the stream and the geofence/arrival
+    engines, but get no gps_trackers row. Fixes reporting an accuracy
+    worse than `max_accuracy_m` are rejected outright.
+
+    The reference fixes live in process memory, so with several workers
+    each keeps its own and a bus may get a few more rows than with one.
+    """
+
+    def __init__(self, min_distance_m=10, min_heading_deg=20, max_accuracy_m=100, keepalive_s=60):
+        self.min_distance_m = min_distance_m
+        self.min_heading_deg = min_heading_deg
+        self.max_accuracy_m = max_accuracy_m
+        self.keepalive_s = keepalive_s
+
+        self.enabled = False
+        self._last = {}     # bus_id -> (latitude, longitude, heading, timestamp) of the last stored fix
+        self._lock = threading.Lock()
+        self.stats = {'fixes': 0, 'stored': 0, 'keepalive': 0, 'suppressed': 0, 'inaccurate': 0}
+
+    def init_app(self, app):
+        """Read the GPS_FILTER_* settings"""
+        self.enabled = app.config.get('GPS_FILTER_ENABLED', False)
+        self.min_distance_m = app.config.get('GPS_FILTER_MIN_DISTANCE_M', self.min_distance_m)
+        self.min_heading_deg = app.config.get('GPS_FILTER_MIN_HEADING_DEG', self.min_heading_deg)
+        self.max_accuracy_m = app.config.get('GPS_FILTER_MAX_ACCURACY_M', self.max_accuracy_m)
+        self.keepalive_s = app.config.get('GPS_FILTER_KEEPALIVE_S', self.keepalive_s)
+
+    def reset(self, bus_id=None):
+        """Forget the reference fix of a bus (or all), so its next fix is stored"""
+        with self._lock:
+            if bus_id is None:
+                self._last = {}
+            else:
+                self._last.pop(bus_id, None)
+
+    def check(self, fix):
+        """Verdict for one fix (STORE, SKIP or INACCURATE), updating the reference"""
+        self.stats['fixes'] += 1
+        if not self.enabled:
+            self.stats['stored'] += 1
+            return STORE
+        accuracy = fix.get('accuracy') or 0
+        if self.max_accuracy_m and accuracy > self.max_accuracy_m:
+            self.stats['inaccurate'] += 1
+            return INACCURATE
+
+        bus_id = fix['bus_id']
+        with self._lock:
+            last = self._last.get(bus_id)
+            if last is not None and fix['timestamp'] < last[3]:
+                # Late fix from before the reference: keep it, leave the reference alone
+                self.stats['stored'] += 1
+                return STORE
+
+            verdict = STORE
+            if last is not None:
+                moved_m = calculate_distance(last[0], last[1], fix['latitude'], fix['longitude']) * 1000
+                turned = (
+                    (fix.get('speed') or 0) >= STATIONARY_SPEED_KMH
+                    and _angle_diff(fix.get('heading') or 0, last[2]) >= self.min_heading_deg
+                )
+                if moved_m < self.min_distance_m and not turned:
+                    if (fix['timestamp'] - last[3]).total_seconds() >= self.keepalive_s:
+                        self.stats['keepalive'] += 1
+                    else:
+                        verdict = SKIP
+
+            if verdict == SKIP:
+                self.stats['suppressed'] += 1
+            else:
+                self.stats['stored'] += 1
+                self._last[bus_id] = (fix['latitude'], fix['longitude'], fix.get('heading') or 0, fix['timestamp'])
+            return verdict
+
+    def classify(self, fixes):
+        """Verdicts for a batch, evaluated oldest first per bus
+
+        Returns:
+            list: one verdict per fix, in the order given"""
+        verdicts = [None] * len(fixes)
+        for index in sorted(range(len(fixes)), key=lambda index: fixes[index]['timestamp']):
+            verdicts[index] = self.check(fixes[index])
+        return verdicts
+
+    def snapshot(self):
+        """Counters plus the share of writes the filter saved"""
+        stats = dict(self.stats)
+        stats['writes_saved'] = stats['suppressed'] + stats['inaccurate']
+        stats['saved_ratio'] = round(stats['writes_saved'] / stats['fixes'], 4) if stats['fixes'] else 0.0
+        stats['enabled'] = self.enabled
+        stats['tracked_buses'] = len(self._last)
+        return stats
+
+
+def _angle_diff(a, b):
+    return abs((a - b + 180) % 360 - 180)
+
+
+# Shared filter instance (configured by init_app in app.py)
+gps_filter = GPSFilter()
@@ -0,0 +1,270 @@
+"""
+GPS Ingest Module
+Validates incoming GPS fixes and writes them in bulk for the Smart Bus Management System
+"""
+
+import base64
+import json
+import zlib
+from datetime import datetime, timezone
+from database_operations import GPSOperations
+from gps_buffer import gps_write_buffer
+from live_state import live_state, state_from_fix
+from gps_stream import position_broker
+from map_matching import route_matcher
+from gps_pipeline import gps_pipeline
+from gps_filter import gps_filter, SKIP, INACCURATE
+
+# Upper bound on fixes accepted in one batch request
+MAX_BATCH_SIZE = 5000
+# Upper bound on a decompressed device sync payload
+MAX_SYNC_PAYLOAD_BYTES = 8 * 1024 * 1024
+
+
+# ==================== VALIDATION ====================
+
+def parse_timestamp(value):
+    """Parse a fix timestamp (ISO string or epoch seconds) into naive UTC"""
+    if value is None:
+        return datetime.utcnow()
+
+    if isinstance(value, (int, float)):
+        return datetime.utcfromtimestamp(value)
+
+    parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def parse_fix(data, bus_id=None):
+    """Validate a raw fix payload and normalise it into a row dict
+     Args:
+        data: fix object from the request body
+        bus_id: bus the fix belongs to when not given in the payload
+
+    Returns:
+        tuple: (fix_dict, error_message)"""
+    if not isinstance(data, dict):
+        return None, 'Fix must be an object'
+
+    try:
+        fix_bus_id = int(data.get('bus_id', bus_id))
+    except (TypeError, ValueError):
+        return None, 'Invalid bus_id'
+
+    if 'latitude' not in data or 'longitude' not in data:
+        return None, 'latitude and longitude are required'
+
+    try:
+        latitude = float(data['latitude'])
+        longitude = float(data['longitude'])
+        speed = float(data.get('speed') or 0)
+        heading = float(data.get('heading') or 0)
+        accuracy = float(data.get('accuracy') or 0)
+        altitude = float(data.get('altitude') or 0)
+    except (TypeError, ValueError):
+        return None, 'Invalid numeric field'
+
+    if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+        return None, 'Coordinates out of range'
+
+    try:
+        timestamp = parse_timestamp(data.get('timestamp'))
+    except (TypeError, ValueError, OverflowError, OSError):
+        return None, 'Invalid timestamp'
+
+    return {
+        'bus_id': fix_bus_id,
+        'latitude': latitude,
+        'longitude': longitude,
+        'speed': speed,
+        'heading': heading,
+        'accuracy': accuracy,
+        'altitude': altitude,
+        'timestamp': timestamp
+    }, None
+
+
+# ==================== INGEST ====================
+
+def ingest_fixes(raw_fixes, bus_id=None):
+    """Validate and persist a batch of fixes with one bulk write
+     Args:
+        raw_fixes: list of fix objects (each may carry its own bus_id)
+        bus_id: default bus for fixes that do not name one
+
+    Returns:
+        tuple: (report, error_message) where report holds per-fix results
+        ('accepted'/'rejected' with a reason) and the newest accepted fix
+        per bus under 'latest'. Accepted fixes the jitter filter found
+        redundant are marked 'stored': False and only reach the live-state
+        store, which receives the newest fix per bus."""
+    results = [None] * len(raw_fixes)
+    candidates = []
+
+    for index, raw in enumerate(raw_fixes):
+        fix, error = parse_fix(raw, bus_id)
+        if error:
+            results[index] = {'index': index, 'status': 'rejected', 'error': error}
+        else:
+            candidates.append((index, fix))
+
+    buses = GPSOperations.get_bus_summaries({fix['bus_id'] for _, fix in candidates})
+    known = [(index, fix) for index, fix in candidates if fix['bus_id'] in buses]
+
+    # Snap fixes of known buses onto their routes (sets distance_along_route)
+    route_matcher.match_fixes([fix for _, fix in known])
+    # Decide which fixes are worth a gps_trackers row
+    verdicts = dict(zip((index for index, _ in known), gps_filter.classify([fix for _, fix in known])))
+
+    accepted = []
+    stored = []
+    for index, fix in candidates:
+        verdict = verdicts.get(index)
+        if fix['bus_id'] not in buses:
+            results[index] = {'index': index, 'status': 'rejected', 'error': 'Bus not found'}
+        elif verdict == INACCURATE:
+            results[index] = {
+                'index': index, 'status': 'rejected',
+                'error': f'Accuracy worse than {gps_filter.max_accuracy_m:g} m'
+            }
+        elif verdict == SKIP:
+            # Redundant fix: updates the live position only
+            results[index] = {'index': index, 'status': 'accepted', 'stored': False}
+            accepted.append(fix)
+        elif gps_write_buffer.enabled:
+            queued, error = gps_write_buffer.append(fix)
+            if queued:
+                results[index] = {'index': index, 'status': 'accepted'}
+                accepted.append(fix)
+                stored.append(fix)
+            else:
+                results[index] = {'index': index, 'status': 'rejected', 'error': error}
+        else:
+            results[index] = {'index': index, 'status': 'accepted'}
+            accepted.append(fix)
+            stored.append(fix)
+
+    if not gps_write_buffer.enabled:
+        _, error = GPSOperations.log_gps_batch(stored)
+        if error:
+            return None, error
+
+    latest = {}
+    for fix in accepted:
+        current = latest.get(fix['bus_id'])
+        if current is None or fix['timestamp'] >= current['timestamp']:
+            latest[fix['bus_id']] = fix
+
+    # Publish the newest position per bus to the live state and stream subscribers
+    states = [state_from_fix(fix, buses[fix_bus_id]) for fix_bus_id, fix in latest.items()]
+    changed = set(live_state.update_many(states))
+    position_broker.publish([state for state in states if state['bus_id'] in changed])
+
+    # Wake-up alerts, stop announcements and stop arrivals (inline or in the
+    # worker process owning each bus)
+    gps_pipeline.submit(accepted)
+
+    return {
+        'accepted': len(accepted),
+        'rejected': len(raw_fixes) - len(accepted),
+        'stored': len(stored),
+        'results': results,
+        'latest': latest
+    }, None
+
+
+# ==================== DEVICE SYNC ====================
+
+def decode_sync_payload(data):
+    """Fixes of a sync request: inline 'fixes', or 'payload' as base64 of a gzipped JSON array
+    
+    Returns:
+        tuple: (list_of_fix_objects, error_message)"""
+    if 'fixes' in data:
+        fixes = data['fixes']
+    else:
+        try:
+            compressed = base64.b64decode(data.get('payload') or '', validate=True)
+            # Bounded inflate: a small payload must not expand without limit
+            inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            raw = inflater.decompress(compressed, MAX_SYNC_PAYLOAD_BYTES)
+            if inflater.unconsumed_tail:
+                return None, f'Payload exceeds {MAX_SYNC_PAYLOAD_BYTES} bytes uncompressed'
+            fixes = json.loads(raw)
+        except (ValueError, zlib.error):
+            return None, 'payload must be base64-encoded gzipped JSON'
+    
+    if not isinstance(fixes, list) or not fixes:
+        return None, 'No fixes in sync payload'
+    if len(fixes) > MAX_BATCH_SIZE:
+        return None, f'At most {MAX_BATCH_SIZE} fixes per sync'
+    return fixes, None
+
+
+def sync_device(device_id, data):
+    """Store a batch of fixes buffered by an offline device, exactly once
+     Args:
+        device_id: reporting device
+        data: request body with bus_id, first_seq, last_seq and the fixes
+            ('fixes' or a compressed 'payload'); fixes are numbered first_seq
+            upwards in order unless they carry their own 'seq'
+    
+    Returns:
+        tuple: (report, error_message) where report holds acked_seq (the
+        highest contiguous sequence stored; the device may drop everything
+        up to it), inserted, duplicates and per-fix rejections"""
+    if not isinstance(data, dict):
+        return None, 'Body must be an object'
+    try:
+        bus_id = int(data['bus_id'])
+        first_seq = int(data['first_seq'])
+        last_seq = int(data['last_seq'])
+    except (KeyError, TypeError, ValueError):
+        return None, 'bus_id, first_seq and last_seq are required integers'
+    if first_seq < 1 or last_seq < first_seq:
+        return None, 'Invalid sequence range'
+    
+    raw_fixes, error = decode_sync_payload(data)
+    if error:
+        return None, error
+    
+    numbered = []
+    rejected = []
+    for position, raw in enumerate(raw_fixes):
+        seq = raw.get('seq', first_seq + position) if isinstance(raw, dict) else first_seq + position
+        if not isinstance(seq, int) or not first_seq <= seq <= last_seq:
+            return None, f'Fix {position} has a sequence outside {first_seq}-{last_seq}'
+        fix, error = parse_fix(raw, bus_id)
+        if fix is not None and fix['bus_id'] != bus_id:
+            fix, error = None, 'Fix belongs to another bus'
+        if error:
+            # Still acknowledged: resending an invalid fix would not make it valid
+            rejected.append({'seq': seq, 'error': error})
+        numbered.append((seq, fix))
+    
+    buses = GPSOperations.get_bus_summaries({bus_id})
+    if bus_id not in buses:
+        return None, 'Bus not found'
+    
+    route_matcher.match_fixes([fix for _, fix in numbered if fix is not None])
+    result, error = GPSOperations.sync_device_fixes(device_id, bus_id, numbered)
+    if error:
+        return None, error
+    
+    # Only a fix newer than the live position replaces it; historical fixes
+    # skip the geofence and arrival engines, whose moment has passed
+    if result['fixes']:
+        newest = max(result['fixes'], key=lambda fix: fix['timestamp'])
+        state = state_from_fix(newest, buses[bus_id])
+        if live_state.update_many([state]):
+            position_broker.publish([state])
+    
+    return {
+        'device_id': device_id,
+        'acked_seq': result['acked_seq'],
+        'inserted': result['inserted'],
+        'duplicates': result['duplicates'],
+        'rejected': rejected
+    }, None
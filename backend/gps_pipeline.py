@@ -0,0 +1,251 @@
+"""
+GPS Processing Pipeline
+Runs post-ingest work (geofences, stop arrivals, ETAs) in worker processes sharded by bus_id
+"""
+
+import atexit
+import multiprocessing
+import queue
+import threading
+import time
+
+
+def process_fixes(fixes, predict_eta=False):
+    """Derived state for a batch of accepted fixes (the per-fix work after storage)
+     Args:
+        fixes: accepted fix dicts
+        predict_eta: also predict the next stop from each bus's newest fix
+
+    Returns:
+        dict: fired (alert count), arrivals (bus ids with stop events) and
+        next_stops as (bus_id, ts, prediction or None)"""
+    from geofence import geofence_engine
+    from arrival_detector import arrival_detector
+    from live_state import EPOCH
+
+    fired = geofence_engine.process(fixes)
+    events = arrival_detector.process(fixes)
+    result = {
+        'fired': len(fired),
+        'arrivals': sorted({event['bus_id'] for event in events}),
+        'next_stops': []
+    }
+
+    if predict_eta:
+        from eta_engine import eta_engine
+        latest = {}
+        for fix in fixes:
+            current = latest.get(fix['bus_id'])
+            if current is None or fix['timestamp'] >= current['timestamp']:
+                latest[fix['bus_id']] = fix
+        for bus_id, fix in latest.items():
+            ts = (fix['timestamp'] - EPOCH).total_seconds()
+            predictions = eta_engine.predict(bus_id, {'latitude': fix['latitude'], 'longitude': fix['longitude'], 'ts': ts})
+            result['next_stops'].append((bus_id, ts, predictions[0] if predictions else None))
+    return result
+
+
+def _worker_main(app, shard, inbox, outbox, model_reload_s):
+    """Entry point of one worker process (forked from the app process)"""
+    from database import db
+    from geofence import geofence_engine
+    from arrival_detector import arrival_detector
+    from eta_engine import eta_engine
+
+    # The parent refreshes the ETA model; workers only re-read it
+    app.config['ETA_REFRESH_INTERVAL_S'] = 0
+    with app.app_context():
+        # Never reuse database connections inherited from the parent
+        db.engine.dispose()
+    geofence_engine.init_app(app)
+    arrival_detector.init_app(app)
+    eta_engine.init_app(app)
+    reloaded_at = time.monotonic()
+
+    while True:
+        message = inbox.get()
+        if message is None:
+            return
+        kind, payload = message
+        if kind == 'invalidate':
+            geofence_engine.invalidate(payload)
+            arrival_detector.invalidate(payload)
+            eta_engine.invalidate(payload)
+            continue
+
+        if model_reload_s and time.monotonic() - reloaded_at > model_reload_s:
+            eta_engine.reload()
+            reloaded_at = time.monotonic()
+        try:
+            with app.app_context():
+                result = process_fixes(payload, predict_eta=True)
+        except Exception as e:
+            result = {'error': str(e), 'fixes': len(payload)}
+        result['shard'] = shard
+        outbox.put(result)
+
+
+class GPSPipeline:
+    """Pool of worker processes, one queue each, fixes routed by bus_id % workers
+
+    Every fix of a bus goes to the same process through a FIFO queue, so
+    per-bus ordering holds while different buses are processed in
+    parallel, outside the request threads and the GIL. Each worker keeps
+    its own geofence, arrival and ETA caches for its buses. Results come
+    back on one queue: next-stop predictions are merged into the live
+    state and arrivals invalidate this process's ETA cache.
+
+    With workers = 0 (the default) the same work runs inline in the
+    request thread. Workers are forked, so init_app must run before any
+    other component starts a thread; where fork is unavailable the
+    pipeline stays inline.
+    """
+
+    def __init__(self, workers=0, queue_size=1000, put_timeout_ms=1000):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.put_timeout_ms = put_timeout_ms
+
+        self._app = None
+        self._context = None
+        self._inboxes = []
+        self._processes = []
+        self._outbox = None
+        self._collector = None
+        self._model_reload_s = 0
+        self._lock = threading.Lock()
+        self.stats = {'batches': 0, 'fixes': 0, 'dropped': 0, 'results': 0, 'errors': 0,
+                      'fired': 0, 'arrivals': 0, 'restarts': 0}
+
+    # ========== LIFECYCLE ==========
+
+    def init_app(self, app):
+        """Read GPS_PIPELINE_* and start the workers when configured"""
+        self._app = app
+        self.workers = app.config.get('GPS_PIPELINE_WORKERS', self.workers)
+        self.queue_size = app.config.get('GPS_PIPELINE_QUEUE_SIZE', self.queue_size)
+        self.put_timeout_ms = app.config.get('GPS_PIPELINE_PUT_TIMEOUT_MS', self.put_timeout_ms)
+        self._model_reload_s = app.config.get('ETA_REFRESH_INTERVAL_S', 0)
+
+        if self.workers and 'fork' not in multiprocessing.get_all_start_methods():
+            self.workers = 0
+        if not self.workers or self._processes:
+            return
+
+        self._context = multiprocessing.get_context('fork')
+        self._outbox = self._context.Queue()
+        for shard in range(self.workers):
+            self._inboxes.append(self._context.Queue(maxsize=self.queue_size))
+            self._processes.append(self._start(shard))
+        self._collector = threading.Thread(target=self._collect, name='gps-pipeline-results', daemon=True)
+        self._collector.start()
+        atexit.register(self.shutdown)
+
+    def _start(self, shard):
+        process = self._context.Process(
+            target=_worker_main,
+            args=(self._app, shard, self._inboxes[shard], self._outbox, self._model_reload_s),
+            name=f'gps-pipeline-{shard}',
+            daemon=True
+        )
+        process.start()
+        return process
+
+    def shutdown(self):
+        """Let the workers finish their queues and exit"""
+        for inbox in self._inboxes:
+            try:
+                inbox.put(None, timeout=1)
+            except queue.Full:
+                pass
+        for process in self._processes:
+            process.join(timeout=5)
+
+    # ========== DISPATCH ==========
+
+    def shard(self, bus_id):
+        return bus_id % self.workers
+
+    def submit(self, fixes):
+        """Process accepted fixes: inline, or queued to their buses' workers
+
+        Returns:
+            dict: the inline result, or None when the work was queued"""
+        if not fixes:
+            return None
+        if not self.workers:
+            return process_fixes(fixes)
+
+        batches = {}
+        for fix in sorted(fixes, key=lambda fix: fix['timestamp']):
+            batches.setdefault(self.shard(fix['bus_id']), []).append(fix)
+        for shard, batch in batches.items():
+            self._put(shard, ('fixes', batch), len(batch))
+        return None
+
+    def invalidate(self, bus_id=None):
+        """Have the workers drop cached stops/alerts of a bus (or all buses)"""
+        if not self.workers:
+            return
+        shards = range(self.workers) if bus_id is None else (self.shard(bus_id),)
+        for shard in shards:
+            self._put(shard, ('invalidate', bus_id), 0)
+
+    def _put(self, shard, message, fix_count):
+        with self._lock:
+            if not self._processes[shard].is_alive():
+                # Caches are rebuilt from the database, so a fresh worker loses nothing
+                self._processes[shard] = self._start(shard)
+                self.stats['restarts'] += 1
+        try:
+            self._inboxes[shard].put(message, timeout=self.put_timeout_ms / 1000)
+        except queue.Full:
+            self.stats['dropped'] += fix_count
+            return
+        if fix_count:
+            self.stats['batches'] += 1
+            self.stats['fixes'] += fix_count
+
+    # ========== RESULTS ==========
+
+    def _collect(self):
+        from live_state import live_state
+        from eta_engine import eta_engine
+
+        while True:
+            result = self._outbox.get()
+            self.stats['results'] += 1
+            if 'error' in result:
+                self.stats['errors'] += 1
+                continue
+            self.stats['fired'] += result['fired']
+            self.stats['arrivals'] += len(result['arrivals'])
+
+            for bus_id in result['arrivals']:
+                eta_engine.invalidate(bus_id)
+            # Attach the prediction to the live entry it was computed from
+            updates = []
+            for bus_id, ts, next_stop in result['next_stops']:
+                state = live_state.get(bus_id)
+                if state is not None and state.get('ts') == ts:
+                    updates.append(dict(state, next_stop=next_stop))
+            if updates:
+                live_state.update_many(updates)
+
+    def snapshot(self):
+        stats = dict(self.stats)
+        stats['workers'] = self.workers
+        stats['alive'] = sum(1 for process in self._processes if process.is_alive())
+        stats['queued'] = [_qsize(inbox) for inbox in self._inboxes]
+        return stats
+
+
+def _qsize(inbox):
+    try:
+        return inbox.qsize()
+    except NotImplementedError:
+        return None
+
+
+# Shared pipeline instance (configured by init_app in app.py)
+gps_pipeline = GPSPipeline()
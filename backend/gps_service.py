@@ -1,87 +1,44 @@
-import math
-from datetime import datetime
-from flask import Blueprint, request, jsonify
-from flask_sqlalchemy import SQLAlchemy
-from app import db, app
-import json
+import time
+from datetime import datetime, timedelta
+from flask import Blueprint, request, jsonify, Response
+from database import db, Bus, GPSTracker, RouteStop
+from gps_ingest import ingest_fixes, sync_device, parse_timestamp, MAX_BATCH_SIZE
+from gps_buffer import gps_write_buffer
+from gps_filter import gps_filter
+from gps_udp import gps_udp_listener
+from gps_pipeline import gps_pipeline
+from database_operations import GPSOperations, BookingOperations, RetentionOperations
+from live_state import live_state, state_from_fix
+from gps_stream import position_broker, Subscription, format_sse
+from geo_utils import calculate_distance, haversine_one_to_many
+from spatial_index import bus_spatial_index
+from track_encoding import encode_track, decode_polyline, zoom_to_tolerance
+from gps_archive import gps_archive
+from eta_engine import eta_engine, segment_key
+from stop_index import stop_index
+from map_matching import route_matcher
+from arrival_detector import arrival_detector
 
 # GPS Service Blueprint
 gps_bp = Blueprint('gps', __name__, url_prefix='/api/gps')
+# Stop lookups called directly by the dashboard (/api/next-stop)
+stops_bp = Blueprint('stops', __name__, url_prefix='/api')
 
-# In-memory storage for real-time GPS data (use Redis in production)
-active_buses_gps = {}
-
-class GPSTracker(db.Model):
-    __tablename__ = 'gps_trackers'
-    id = db.Column(db.Integer, primary_key=True)
-    bus_id = db.Column(db.Integer, db.ForeignKey('buses.id'), nullable=False)
-    latitude = db.Column(db.Float, nullable=False)
-    longitude = db.Column(db.Float, nullable=False)
-    speed = db.Column(db.Float, default=0)
-    heading = db.Column(db.Float, default=0)
-    accuracy = db.Column(db.Float, default=0)
-    altitude = db.Column(db.Float, default=0)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
-    is_active = db.Column(db.Boolean, default=True)
-    
-    bus = db.relationship('Bus', backref='gps_trackers')
-
-
-class RouteStop(db.Model):
-    __tablename__ = 'route_stops'
-    id = db.Column(db.Integer, primary_key=True)
-    bus_id = db.Column(db.Integer, db.ForeignKey('buses.id'), nullable=False)
-    stop_order = db.Column(db.Integer, nullable=False)
-    stop_name = db.Column(db.String(200), nullable=False)
-    latitude = db.Column(db.Float, nullable=False)
-    longitude = db.Column(db.Float, nullable=False)
-    estimated_arrival = db.Column(db.DateTime, nullable=True)
-    actual_arrival = db.Column(db.DateTime, nullable=True)
-    is_completed = db.Column(db.Boolean, default=False)
-    
-    bus = db.relationship('Bus', backref='route_stops')
-
+# Keys of a live-state entry returned by the location endpoints
+LOCATION_FIELDS = ('bus_id', 'latitude', 'longitude', 'speed', 'heading', 'accuracy', 'altitude', 'timestamp')
+FLEET_FIELDS = ('bus_id', 'bus_number', 'driver_name', 'route', 'latitude', 'longitude', 'speed', 'heading', 'timestamp')
 
-# ========== UTILITY FUNCTIONS ==========
-
-def calculate_distance(lat1, lon1, lat2, lon2):
-    """Calculate distance between two coordinates using Haversine formula (in km)"""
-    R = 6371  # Earth's radius in kilometers
-    
-    lat1_rad = math.radians(lat1)
-    lat2_rad = math.radians(lat2)
-    delta_lat = math.radians(lat2 - lat1)
-    delta_lon = math.radians(lon2 - lon1)
-    
-    a = math.sin(delta_lat/2) ** 2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lon/2) ** 2
-    c = 2 * math.asin(math.sqrt(a))
-    
-    return R * c
+# Seconds between keep-alive comments on idle position streams
+STREAM_HEARTBEAT_SECONDS = 15
 
+# Upper bound on fixes returned by one history request (a day at 1 Hz)
+HISTORY_MAX_POINTS = 86400
 
-def calculate_bearing(lat1, lon1, lat2, lon2):
-    """Calculate bearing between two coordinates"""
-    lat1_rad = math.radians(lat1)
-    lat2_rad = math.radians(lat2)
-    delta_lon = math.radians(lon2 - lon1)
-    
-    y = math.sin(delta_lon) * math.cos(lat2_rad)
-    x = math.cos(lat1_rad) * math.sin(lat2_rad) - math.sin(lat1_rad) * math.cos(lat2_rad) * math.cos(delta_lon)
-    
-    bearing = math.degrees(math.atan2(y, x))
-    return (bearing + 360) % 360
+# A next-stop query this close to a bus's latest fix reuses that fix's map match
+SAME_FIX_KM = 0.02
 
-
-def estimate_arrival_time(current_lat, current_lng, stop_lat, stop_lng, speed_kmh=40):
-    """Estimate arrival time based on current position and distance"""
-    if speed_kmh == 0:
-        return None
-    
-    distance_km = calculate_distance(current_lat, current_lng, stop_lat, stop_lng)
-    hours = distance_km / speed_kmh
-    minutes = hours * 60
-    
-    return minutes
+# Epoch seconds at which this process last loaded the database snapshot into the live state
+_live_state_loaded_at = None
 
 
 # ========== GPS ROUTES ==========
@@ -90,23 +47,16 @@ def estimate_arrival_time(current_lat, current_lng, stop_lat, stop_lng, speed_km
 def get_bus_location(bus_id):
     """Get current location of a bus"""
     try:
-        tracker = GPSTracker.query.filter_by(bus_id=bus_id, is_active=True).order_by(
-            GPSTracker.timestamp.desc()
-        ).first()
+        state = _current_position(bus_id)
         
-        if not tracker:
+        if not state or 'timestamp' not in state:
             return jsonify({'message': 'No GPS data available'}), 404
         
-        return jsonify({
-            'bus_id': bus_id,
-            'latitude': tracker.latitude,
-            'longitude': tracker.longitude,
-            'speed': tracker.speed,
-            'heading': tracker.heading,
-            'accuracy': tracker.accuracy,
-            'altitude': tracker.altitude,
-            'timestamp': tracker.timestamp.isoformat()
-        }), 200
+        location = {key: state.get(key) for key in LOCATION_FIELDS}
+        if 'next_stop' in state:
+            # Computed by the pipeline workers for this fix
+            location['next_stop'] = state['next_stop']
+        return jsonify(location), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -115,40 +65,21 @@ def get_bus_location(bus_id):
 def update_bus_location(bus_id):
     """Update bus location (called by GPS device/driver app)"""
     try:
-        from app import Bus
-        
         data = request.json
-        bus = Bus.query.get(bus_id)
         
-        if not bus:
-            return jsonify({'message': 'Bus not found'}), 404
+        report, error = ingest_fixes([data], bus_id=bus_id)
+        if error:
+            return jsonify({'error': error}), 500
         
-        # Create GPS tracker entry
-        tracker = GPSTracker(
-            bus_id=bus_id,
-            latitude=data['latitude'],
-            longitude=data['longitude'],
-            speed=data.get('speed', 0),
-            heading=data.get('heading', 0),
-            accuracy=data.get('accuracy', 0),
-            altitude=data.get('altitude', 0)
-        )
-        
-        # Update bus location
-        bus.current_lat = data['latitude']
-        bus.current_lng = data['longitude']
-        
-        db.session.add(tracker)
-        db.session.commit()
-        
-        # Update in-memory cache
-        active_buses_gps[bus_id] = {
-            'latitude': data['latitude'],
-            'longitude': data['longitude'],
-            'speed': data.get('speed', 0),
-            'heading': data.get('heading', 0),
-            'timestamp': datetime.utcnow().isoformat()
-        }
+        result = report['results'][0]
+        if result['status'] == 'rejected':
+            if result['error'] == 'Bus not found':
+                status_code = 404
+            elif gps_write_buffer.enabled and result['error'].startswith('GPS buffer full'):
+                status_code = 503
+            else:
+                status_code = 400
+            return jsonify({'message': result['error']}), status_code
         
         return jsonify({'message': 'Location updated'}), 200
     except Exception as e:
@@ -156,38 +87,285 @@ def update_bus_location(bus_id):
         return jsonify({'error': str(e)}), 500
 
 
+@gps_bp.route('/locations/batch', methods=['POST'])
+def update_bus_locations_batch():
+    """Ingest many fixes for many buses in one request
+    
+    Body: {"fixes": [{"bus_id": 1, "latitude": .., "longitude": .., "timestamp": ..}, ...]}
+    """
+    return _ingest_batch(request.json)
+
+
+@gps_bp.route('/buses/<int:bus_id>/locations/batch', methods=['POST'])
+def update_bus_location_batch(bus_id):
+    """Ingest many fixes for one bus in one request"""
+    return _ingest_batch(request.json, bus_id=bus_id)
+
+
+def _ingest_batch(data, bus_id=None):
+    """Shared handler for the batch ingest endpoints"""
+    try:
+        fixes = (data or {}).get('fixes')
+        if not isinstance(fixes, list) or not fixes:
+            return jsonify({'message': 'fixes must be a non-empty list'}), 400
+        if len(fixes) > MAX_BATCH_SIZE:
+            return jsonify({'message': f'At most {MAX_BATCH_SIZE} fixes per batch'}), 413
+        
+        report, error = ingest_fixes(fixes, bus_id=bus_id)
+        if error:
+            return jsonify({'error': error}), 500
+        
+        status_code = 200 if report['accepted'] else 400
+        return jsonify({
+            'accepted': report['accepted'],
+            'rejected': report['rejected'],
+            'stored': report['stored'],
+            'results': report['results']
+        }), status_code
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@gps_bp.route('/devices/<string:device_id>/sync', methods=['POST'])
+def sync_device_fixes(device_id):
+    """Replay fixes buffered by a device while offline (idempotent)
+    
+    Body: {"bus_id": 1, "first_seq": 101, "last_seq": 350,
+           "payload": "<base64 of gzipped JSON array of fixes>"}
+    The response's acked_seq is the highest contiguous sequence stored.
+    """
+    try:
+        report, error = sync_device(device_id, request.get_json(silent=True))
+        if error:
+            status_code = 404 if error == 'Bus not found' else 400
+            if error.startswith(f'Device {device_id} is registered'):
+                status_code = 409
+            return jsonify({'message': error}), status_code
+        return jsonify(report), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@gps_bp.route('/devices/<string:device_id>/sync', methods=['GET'])
+def get_device_sync_state(device_id):
+    """Where a device should resume: its acknowledged sequence and stored gaps"""
+    try:
+        state = GPSOperations.get_device_sync_state(device_id)
+        if not state:
+            return jsonify({'device_id': device_id, 'acked_seq': 0, 'received_seqs': []}), 200
+        return jsonify({
+            'device_id': state.device_id,
+            'bus_id': state.bus_id,
+            'acked_seq': state.acked_seq,
+            'received_seqs': state.received_seqs,
+            'last_sync_at': state.last_sync_at.isoformat() if state.last_sync_at else None
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@gps_bp.route('/udp/stats', methods=['GET'])
+def get_udp_stats():
+    """Counters of the binary UDP listener in this process"""
+    try:
+        stats = dict(gps_udp_listener.stats)
+        stats['enabled'] = gps_udp_listener.enabled
+        stats['port'] = gps_udp_listener.port
+        return jsonify(stats), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@gps_bp.route('/pipeline/stats', methods=['GET'])
+def get_pipeline_stats():
+    """Counters of the post-ingest worker pool in this process"""
+    try:
+        return jsonify(gps_pipeline.snapshot()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@gps_bp.route('/filter/stats', methods=['GET'])
+def get_filter_stats():
+    """Counters of the ingest jitter filter in this process (writes saved so far)"""
+    try:
+        return jsonify(gps_filter.snapshot()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def _time_arg(name):
+    """Optional query parameter holding an ISO timestamp or epoch seconds"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        value = float(value)
+    except ValueError:
+        pass
+    return parse_timestamp(value)
+
+
+def _warm_live_state():
+    """Load the database snapshot into the live state
+    
+    A shared (SQLite) store is loaded once per process. The in-process store
+    only sees this worker's fixes, so it re-reads bus_latest_positions once
+    its copy is older than GPS_LIVE_STATE_MAX_AGE_S; newer fixes and status
+    changes found there are stored and published like ingested ones."""
+    global _live_state_loaded_at
+    now = time.time()
+    if _live_state_loaded_at is not None and (
+        live_state.shared or now - _live_state_loaded_at < live_state.max_age_s
+    ):
+        return
+    _live_state_loaded_at = now
+    
+    current = live_state.get_all()
+    states = []
+    for fix, bus in GPSOperations.get_latest_positions_with_buses():
+        state = state_from_fix(fix, bus)
+        held = current.get(state['bus_id'])
+        if held is None or state['ts'] > held['ts'] or (
+            state['ts'] == held['ts'] and state.get('status') != held.get('status')
+        ):
+            states.append(state)
+    
+    changed = set(live_state.update_many(states))
+    position_broker.publish([state for state in states if state['bus_id'] in changed])
+
+
+def _ensure_spatial_index():
+    """Load the spatial index from the live state on first use in this process"""
+    _warm_live_state()
+    if not bus_spatial_index.loaded:
+        bus_spatial_index.load(live_state.get_all().values())
+
+
+def _current_position(bus_id):
+    """Current position of a bus: live state (refreshed from the latest-position table), then bus row"""
+    _warm_live_state()
+    state = live_state.get(bus_id)
+    if state:
+        return state
+    
+    bus = Bus.query.get(bus_id)
+    if bus and bus.current_lat is not None and bus.current_lng is not None:
+        return {'bus_id': bus_id, 'latitude': bus.current_lat, 'longitude': bus.current_lng, 'speed': 0}
+    return None
+
+
 @gps_bp.route('/buses/active/locations', methods=['GET'])
 def get_all_active_buses():
-    """Get locations of all active buses"""
+    """Get locations of all active buses (served from the live state)"""
     try:
-        from app import Bus
+        _warm_live_state()
         
-        buses = Bus.query.filter_by(status='active').all()
-        result = []
-        
-        for bus in buses:
-            tracker = GPSTracker.query.filter_by(bus_id=bus.id, is_active=True).order_by(
-                GPSTracker.timestamp.desc()
-            ).first()
-            
-            if tracker:
-                result.append({
-                    'bus_id': bus.id,
-                    'bus_number': bus.bus_number,
-                    'driver_name': bus.driver_name,
-                    'route': bus.route,
-                    'latitude': tracker.latitude,
-                    'longitude': tracker.longitude,
-                    'speed': tracker.speed,
-                    'heading': tracker.heading,
-                    'timestamp': tracker.timestamp.isoformat()
-                })
+        result = [
+            {key: state.get(key) for key in FLEET_FIELDS}
+            for state in live_state.get_all().values()
+            if state.get('status') == 'active'
+        ]
+        result.sort(key=lambda item: item['bus_id'])
         
         return jsonify(result), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@gps_bp.route('/buses/nearby', methods=['GET'])
+def get_nearby_buses():
+    """Get buses within radius_km of a point, nearest first
+    
+    Query params: lat, lng, radius_km (default 2), limit (optional)
+    """
+    try:
+        latitude = request.args.get('lat', type=float)
+        longitude = request.args.get('lng', type=float)
+        radius_km = request.args.get('radius_km', 2, type=float)
+        limit = request.args.get('limit', type=int)
+        
+        if latitude is None or longitude is None or radius_km is None or radius_km <= 0:
+            return jsonify({'message': 'lat, lng and a positive radius_km are required'}), 400
+        
+        _ensure_spatial_index()
+        matches = bus_spatial_index.within_radius(latitude, longitude, radius_km, limit=limit)
+        
+        return jsonify([
+            dict({key: state.get(key) for key in FLEET_FIELDS}, distance_km=round(distance_km, 3))
+            for distance_km, state in matches
+        ]), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@gps_bp.route('/buses/within', methods=['GET'])
+def get_buses_in_bbox():
+    """Get buses inside a bounding box (bbox=min_lat,min_lng,max_lat,max_lng)"""
+    try:
+        try:
+            min_lat, min_lng, max_lat, max_lng = (float(value) for value in request.args['bbox'].split(','))
+        except (KeyError, ValueError):
+            return jsonify({'message': 'bbox must be min_lat,min_lng,max_lat,max_lng'}), 400
+        
+        _ensure_spatial_index()
+        matches = bus_spatial_index.within_bbox(min_lat, min_lng, max_lat, max_lng)
+        
+        return jsonify([{key: state.get(key) for key in FLEET_FIELDS} for state in matches]), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@gps_bp.route('/stream', methods=['GET'])
+def stream_positions():
+    """Server-Sent Events stream of live bus positions
+    
+    Query params (combinable, none = whole fleet):
+        bus_id: repeatable bus id
+        route: repeatable route name
+        bbox: min_lat,min_lng,max_lat,max_lng
+    """
+    try:
+        bus_ids = request.args.getlist('bus_id', type=int)
+        routes = request.args.getlist('route')
+        bbox = None
+        if request.args.get('bbox'):
+            bbox = tuple(float(value) for value in request.args['bbox'].split(','))
+            if len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+                return jsonify({'message': 'bbox must be min_lat,min_lng,max_lat,max_lng'}), 400
+    except ValueError:
+        return jsonify({'message': 'Invalid stream filter'}), 400
+    
+    subscription = Subscription(bus_ids=bus_ids, routes=routes, bbox=bbox)
+    if not position_broker.subscribe(subscription):
+        return jsonify({'message': 'Too many stream subscribers, retry later'}), 503
+    
+    _warm_live_state()
+    snapshot = [state for state in live_state.get_all().values() if subscription.matches(state)]
+    
+    def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            for state in sorted(snapshot, key=lambda item: item['ts']):
+                yield format_sse(state)
+            while True:
+                states = subscription.drain(STREAM_HEARTBEAT_SECONDS)
+                if not states:
+                    yield ': keep-alive\n\n'
+                    continue
+                for state in states:
+                    yield format_sse(state)
+        finally:
+            position_broker.unsubscribe(subscription)
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
 @gps_bp.route('/buses/<int:bus_id>/route-stops', methods=['GET'])
 def get_route_stops(bus_id):
     """Get all stops for a bus route"""
@@ -204,6 +382,7 @@ def get_route_stops(bus_id):
                 'longitude': stop.longitude,
                 'estimated_arrival': stop.estimated_arrival.isoformat() if stop.estimated_arrival else None,
                 'actual_arrival': stop.actual_arrival.isoformat() if stop.actual_arrival else None,
+                'actual_departure': stop.actual_departure.isoformat() if stop.actual_departure else None,
                 'is_completed': stop.is_completed
             })
         
@@ -216,8 +395,6 @@ def get_route_stops(bus_id):
 def create_route_stops(bus_id):
     """Create route stops for a bus"""
     try:
-        from app import Bus
-        
         bus = Bus.query.get(bus_id)
         if not bus:
             return jsonify({'message': 'Bus not found'}), 404
@@ -239,6 +416,11 @@ def create_route_stops(bus_id):
             db.session.add(route_stop)
         
         db.session.commit()
+        eta_engine.invalidate(bus_id)
+        stop_index.invalidate(bus_id)
+        route_matcher.invalidate(bus_id)
+        arrival_detector.invalidate(bus_id)
+        gps_pipeline.invalidate(bus_id)
         
         return jsonify({
             'message': f'{len(stops_data)} stops created',
@@ -249,42 +431,196 @@ def create_route_stops(bus_id):
         return jsonify({'error': str(e)}), 500
 
 
-@gps_bp.route('/buses/<int:bus_id>/calculate-eta', methods=['GET'])
-def calculate_eta(bus_id):
-    """Calculate ETA to next stops"""
+@gps_bp.route('/buses/<int:bus_id>/route-shape', methods=['GET'])
+def get_route_shape(bus_id):
+    """Get the uploaded road geometry of a bus route"""
+    try:
+        points, error = GPSOperations.get_route_shape(bus_id)
+        if error:
+            return jsonify({'error': error}), 500
+        if points is None:
+            return jsonify({'message': 'No route shape uploaded'}), 404
+        return jsonify({'bus_id': bus_id, 'points': [list(point) for point in points]}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@gps_bp.route('/buses/<int:bus_id>/route-shape', methods=['POST'])
+def upload_route_shape(bus_id):
+    """Upload road geometry for map matching
+    
+    Body: points ([[lat, lng], ...] in travel order) or polyline (encoded)
+    """
     try:
-        from app import Bus
-        
         bus = Bus.query.get(bus_id)
-        if not bus or not bus.current_lat or not bus.current_lng:
+        if not bus:
+            return jsonify({'message': 'Bus not found'}), 404
+        
+        data = request.json or {}
+        try:
+            if data.get('polyline'):
+                points = decode_polyline(data['polyline'])
+            else:
+                points = [(float(lat), float(lng)) for lat, lng in data.get('points') or []]
+        except (TypeError, ValueError, IndexError):
+            return jsonify({'message': 'points must be [[lat, lng], ...] or polyline an encoded polyline'}), 400
+        if len(points) < 2:
+            return jsonify({'message': 'A route shape needs at least 2 points'}), 400
+        
+        _, error = GPSOperations.save_route_shape(bus_id, points)
+        if error:
+            return jsonify({'error': error}), 500
+        route_matcher.invalidate(bus_id)
+        
+        return jsonify({'message': 'Route shape saved', 'points_count': len(points)}), 201
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@gps_bp.route('/buses/<int:bus_id>/progress', methods=['GET'])
+def get_route_progress(bus_id):
+    """Get a bus's progress along its route from its map-matched position"""
+    try:
+        position = _current_position(bus_id)
+        if not position:
             return jsonify({'message': 'Bus not found or GPS data unavailable'}), 404
         
-        stops = RouteStop.query.filter_by(bus_id=bus_id, is_completed=False).order_by(
-            RouteStop.stop_order
-        ).all()
+        geometry = route_matcher.geometry(bus_id)
+        if geometry is None:
+            return jsonify({'message': 'Bus has no route'}), 404
         
-        result = []
-        for stop in stops:
-            distance_km = calculate_distance(
-                bus.current_lat, bus.current_lng,
-                stop.latitude, stop.longitude
-            )
+        distance_km = position.get('distance_along_route')
+        if distance_km is None:
+            distance_km = route_matcher.match(bus_id, position['latitude'], position['longitude'])
+        if distance_km is None:
+            return jsonify({'bus_id': bus_id, 'on_route': False}), 200
+        
+        next_index = geometry.next_stop(distance_km)
+        stops = [] if next_index is None else [{
+            'stop_id': stop.id,
+            'stop_name': stop.stop_name,
+            'stop_order': stop.stop_order,
+            'distance_km': round(geometry.distance_to_stop(distance_km, index), 3)
+        } for index, stop in enumerate(geometry.stops[next_index:], next_index)]
+        
+        return jsonify({
+            'bus_id': bus_id,
+            'on_route': True,
+            'distance_along_route_km': round(distance_km, 3),
+            'route_length_km': round(geometry.length_km, 3),
+            'next_stop': stops[0] if stops else None,
+            'remaining_stops': stops
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def _matched_next_stop(bus_id, latitude, longitude):
+    """Next stop from a position's map-matched distance along the bus's route
+    
+    The distance stored with the bus's latest fix is used when the position
+    is that fix's, so loops and overlapping legs resolve as they did at ingest.
+    
+    Returns:
+        tuple: (stop, distance_km, previous_stop, segment_km, fraction_left)
+        with previous_stop None before the first stop, or None when the
+        position is off the route or past its last stop"""
+    geometry = route_matcher.geometry(bus_id)
+    if geometry is None:
+        return None
+    
+    distance_km = None
+    state = live_state.get(bus_id)
+    if state and state.get('distance_along_route') is not None and calculate_distance(
+        latitude, longitude, state['latitude'], state['longitude']
+    ) <= SAME_FIX_KM:
+        distance_km = state['distance_along_route']
+    if distance_km is None:
+        distance_km = route_matcher.match(bus_id, latitude, longitude)
+    if distance_km is None:
+        return None
+    
+    index = geometry.next_stop(distance_km)
+    if index is None:
+        return None
+    remaining_km = max(0.0, geometry.distance_to_stop(distance_km, index))
+    stop = geometry.stops[index]
+    if index == 0:
+        return stop, remaining_km, None, None, None
+    segment_km = geometry.stop_offsets_km[index] - geometry.stop_offsets_km[index - 1]
+    fraction_left = min(1.0, remaining_km / segment_km) if segment_km > 0 else 0.0
+    return stop, remaining_km, geometry.stops[index - 1], segment_km, fraction_left
+
+
+@stops_bp.route('/next-stop', methods=['POST'])
+def get_next_stop():
+    """Next stop for a position, answered from the in-memory stop index
+    
+    Body: latitude, longitude, busId (optional: nearest route is used),
+    heading (optional: taken from the bus's live state when moving)
+    """
+    try:
+        data = request.json or {}
+        try:
+            latitude = float(data['latitude'])
+            longitude = float(data['longitude'])
+            bus_id = int(data['busId']) if data.get('busId') is not None else None
+            heading = float(data['heading']) if data.get('heading') is not None else None
+        except (KeyError, TypeError, ValueError):
+            return jsonify({'message': 'latitude and longitude are required'}), 400
+        
+        matched = _matched_next_stop(bus_id, latitude, longitude) if bus_id is not None else None
+        if matched is not None:
+            stop, distance_km, previous, segment_km, fraction_left = matched
+        else:
+            if heading is None and bus_id is not None:
+                state = live_state.get(bus_id)
+                if state and (state.get('speed') or 0) > 3:
+                    heading = state.get('heading')
+            if bus_id is None:
+                bus_id = stop_index.nearest_route(latitude, longitude, heading)
             
-            # Assume average speed of 40 km/h if not available
-            speed = 40
-            eta_minutes = estimate_arrival_time(
-                bus.current_lat, bus.current_lng,
-                stop.latitude, stop.longitude,
-                speed
-            )
+            route = stop_index.route(bus_id) if bus_id is not None else None
+            if route is None or not route.stops:
+                return jsonify({'message': 'No route stops near this position', 'nextStop': None}), 404
             
-            result.append({
-                'stop_id': stop.id,
-                'stop_name': stop.stop_name,
-                'stop_order': stop.stop_order,
-                'distance_km': round(distance_km, 2),
-                'eta_minutes': round(eta_minutes) if eta_minutes else None
-            })
+            stop_position, distance_km, segment, fraction_left = route.next_stop(latitude, longitude, heading)
+            stop = route.stops[stop_position]
+            previous = route.stops[segment] if segment is not None else None
+            segment_km = route.lengths_km[segment] if segment is not None else None
+        
+        if previous is not None:
+            seconds, _ = eta_engine.segment_seconds(segment_key(previous, stop), segment_km)
+            seconds *= fraction_left
+        else:
+            seconds = distance_km / eta_engine.fallback_speed_kmh * 3600
+        
+        return jsonify({
+            'nextStop': {
+                'id': stop.id,
+                'busId': bus_id,
+                'name': stop.stop_name,
+                'stopOrder': stop.stop_order,
+                'latitude': stop.latitude,
+                'longitude': stop.longitude,
+                'distance': round(distance_km, 3),
+                'estimatedTime': round(seconds / 60)
+            }
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@gps_bp.route('/buses/<int:bus_id>/calculate-eta', methods=['GET'])
+def calculate_eta(bus_id):
+    """Calculate ETA to next stops"""
+    try:
+        position = _current_position(bus_id)
+        if not position:
+            return jsonify({'message': 'Bus not found or GPS data unavailable'}), 404
+        
+        # Remaining stops, timed with learned segment travel times (cached per fix)
+        result = eta_engine.predict(bus_id, position)
         
         return jsonify(result), 200
     except Exception as e:
@@ -293,22 +629,68 @@ def calculate_eta(bus_id):
 
 @gps_bp.route('/buses/<int:bus_id>/history', methods=['GET'])
 def get_gps_history(bus_id):
-    """Get GPS history for a bus"""
+    """Get GPS history for a bus
+    
+    Query params: limit, since, until (ISO or epoch seconds),
+    format=polyline for a compact encoded track, simplified with
+    tolerance (metres) or zoom (map zoom level). Ranges no longer in
+    gps_trackers are served from the cold archive, then from the
+    downsampled tracks the retention job left behind.
+    """
     try:
-        limit = request.args.get('limit', 100, type=int)
-        
-        trackers = GPSTracker.query.filter_by(bus_id=bus_id).order_by(
-            GPSTracker.timestamp.desc()
-        ).limit(limit).all()
+        compact = request.args.get('format') == 'polyline'
+        limit = request.args.get('limit', HISTORY_MAX_POINTS if compact else 100, type=int)
+        limit = max(1, min(limit, HISTORY_MAX_POINTS))
+        
+        try:
+            since = _time_arg('since')
+            until = _time_arg('until')
+        except (TypeError, ValueError, OverflowError, OSError):
+            return jsonify({'message': 'since and until must be ISO timestamps or epoch seconds'}), 400
+        
+        query = db.session.query(
+            GPSTracker.latitude, GPSTracker.longitude, GPSTracker.timestamp,
+            GPSTracker.speed, GPSTracker.heading
+        ).filter(GPSTracker.bus_id == bus_id)
+        if since is not None:
+            query = query.filter(GPSTracker.timestamp >= since)
+        if until is not None:
+            query = query.filter(GPSTracker.timestamp <= until)
+        rows = query.order_by(GPSTracker.timestamp.desc()).limit(limit).all()
+        rows.reverse()  # Chronological order
+        
+        # Older fixes may have moved to the cold archive: fill up from there
+        if len(rows) < limit:
+            if rows:
+                archive_until = rows[0].timestamp
+            else:
+                archive_until = until + timedelta(milliseconds=1) if until is not None else None
+            rows = gps_archive.read_range(bus_id, since, archive_until, limit=limit - len(rows)) + rows
+        
+        # Past the raw retention window only downsampled samples remain
+        if len(rows) < limit:
+            if rows:
+                samples_until = rows[0].timestamp
+            else:
+                samples_until = until + timedelta(milliseconds=1) if until is not None else None
+            rows = RetentionOperations.get_samples(bus_id, since, samples_until, limit=limit - len(rows)) + rows
+        
+        if compact:
+            tolerance_m = request.args.get('tolerance', type=float)
+            zoom = request.args.get('zoom', type=float)
+            if tolerance_m is None and zoom is not None and rows:
+                tolerance_m = zoom_to_tolerance(zoom, latitude=rows[0].latitude)
+            track = encode_track([(row.latitude, row.longitude, row.timestamp) for row in rows], tolerance_m or 0)
+            return jsonify(dict(track, bus_id=bus_id, tolerance_m=tolerance_m or 0)), 200
         
         result = []
-        for tracker in reversed(trackers):  # Reverse to get chronological order
+        for row in rows:
             result.append({
-                'latitude': tracker.latitude,
-                'longitude': tracker.longitude,
-                'speed': tracker.speed,
-                'heading': tracker.heading,
-                'timestamp': tracker.timestamp.isoformat()
+                'latitude': row.latitude,
+                'longitude': row.longitude,
+                'speed': row.speed,
+                'heading': row.heading,
+                'timestamp': row.timestamp.isoformat()
             })
         
         return jsonify(result), 200
@@ -328,6 +710,8 @@ def mark_stop_arrival(bus_id, stop_id):
         stop.actual_arrival = datetime.utcnow()
         stop.is_completed = True
         db.session.commit()
+        eta_engine.invalidate(bus_id)
+        gps_pipeline.invalidate(bus_id)
         
         return jsonify({'message': 'Stop arrival recorded'}), 200
     except Exception as e:
@@ -339,32 +723,34 @@ def mark_stop_arrival(bus_id, stop_id):
 def get_nearby_passengers(bus_id):
     """Get passengers near the bus (for pickup)"""
     try:
-        from app import Bus, User, Seat
-        
-        bus = Bus.query.get(bus_id)
-        if not bus or not bus.current_lat or not bus.current_lng:
+        position = _current_position(bus_id)
+        if not position:
             return jsonify({'message': 'Bus not found or GPS data unavailable'}), 404
+        current_lat, current_lng = position['latitude'], position['longitude']
+        
+        # Passengers booked on today's trip, with a known location
+        passengers = [
+            (seat_number, user)
+            for seat_number, user in BookingOperations.get_travelling_passengers(bus_id, datetime.utcnow())
+            if user.latitude is not None and user.longitude is not None
+        ]
         
-        # Get reserved passengers
-        reserved_seats = Seat.query.filter_by(bus_id=bus_id, is_reserved=True).all()
+        distances_km = haversine_one_to_many(
+            current_lat, current_lng,
+            [user.latitude for _, user in passengers],
+            [user.longitude for _, user in passengers]
+        ).tolist()
         
         result = []
-        for seat in reserved_seats:
-            if seat.user:
-                distance_km = calculate_distance(
-                    bus.current_lat, bus.current_lng,
-                    seat.user.latitude if hasattr(seat.user, 'latitude') else 0,
-                    seat.user.longitude if hasattr(seat.user, 'longitude') else 0
-                )
-                
-                if distance_km < 1:  # Within 1 km
-                    result.append({
-                        'user_id': seat.user.id,
-                        'name': seat.user.name,
-                        'phone': seat.user.phone,
-                        'seat_number': seat.seat_number,
-                        'distance_km': round(distance_km, 2)
-                    })
+        for (seat_number, user), distance_km in zip(passengers, distances_km):
+            if distance_km < 1:  # Within 1 km
+                result.append({
+                    'user_id': user.id,
+                    'name': user.name,
+                    'phone': user.phone,
+                    'seat_number': seat_number,
+                    'distance_km': round(distance_km, 2)
+                })
         
         return jsonify(result), 200
     except Exception as e:
@@ -0,0 +1,225 @@
+"""
+GPS Position Stream
+Fans out live bus positions to Server-Sent Events subscribers
+"""
+
+import json
+import math
+import threading
+import time
+
+# Bounding-box subscriptions are indexed on a grid of this many degrees
+BBOX_CELL_DEG = 1.0
+# Boxes covering more cells than this are checked linearly instead
+BBOX_MAX_CELLS = 64
+
+
+class Subscription:
+    """One stream client: a filter plus a coalescing mailbox
+
+    The mailbox keeps only the newest state per bus. A slow consumer
+    therefore skips intermediate fixes instead of growing an unbounded queue.
+    """
+
+    def __init__(self, bus_ids=None, routes=None, bbox=None):
+        self.bus_ids = set(bus_ids or ())
+        self.routes = set(routes or ())
+        self.bbox = bbox  # (min_lat, min_lng, max_lat, max_lng)
+        self.dropped = 0
+        self._mailbox = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+
+    @property
+    def is_firehose(self):
+        return not self.bus_ids and not self.routes and self.bbox is None
+
+    def in_bbox(self, state):
+        min_lat, min_lng, max_lat, max_lng = self.bbox
+        return min_lat <= state['latitude'] <= max_lat and min_lng <= state['longitude'] <= max_lng
+
+    def matches(self, state):
+        """Full filter check (used for the initial snapshot)"""
+        if self.is_firehose:
+            return True
+        if state['bus_id'] in self.bus_ids or state.get('route') in self.routes:
+            return True
+        return self.bbox is not None and self.in_bbox(state)
+
+    def push(self, state):
+        with self._lock:
+            if state['bus_id'] in self._mailbox:
+                self.dropped += 1
+            self._mailbox[state['bus_id']] = state
+        self._ready.set()
+
+    def drain(self, timeout):
+        """Wait up to timeout for updates and return them (oldest fix first)"""
+        if not self._ready.wait(timeout):
+            return []
+        with self._lock:
+            states = list(self._mailbox.values())
+            self._mailbox = {}
+            self._ready.clear()
+        states.sort(key=lambda state: state['ts'])
+        return states
+
+
+class PositionBroker:
+    """Routes published positions to matching subscriptions
+
+    Subscriptions are indexed by bus id, route and bbox grid cell. Publishing
+    a fix therefore only touches the subscribers that can match it, however
+    many idle subscribers are connected.
+    """
+
+    def __init__(self, max_subscribers=5000):
+        self.max_subscribers = max_subscribers
+        self._by_bus = {}
+        self._by_route = {}
+        self._by_cell = {}
+        self._wide_bbox = set()
+        self._firehose = set()
+        self._count = 0
+        self._lock = threading.Lock()
+        self._poller = None
+        self._last_ts = {}  # bus_id -> (fix time, received_at) of the newest state published
+        self._listeners = []
+
+    # ========== SUBSCRIPTIONS ==========
+
+    def subscribe(self, subscription):
+        """Register a subscription; returns False when the broker is full"""
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                return False
+            self._count += 1
+            if subscription.is_firehose:
+                self._firehose.add(subscription)
+            for bus_id in subscription.bus_ids:
+                self._by_bus.setdefault(bus_id, set()).add(subscription)
+            for route in subscription.routes:
+                self._by_route.setdefault(route, set()).add(subscription)
+            if subscription.bbox is not None:
+                cells = _bbox_cells(subscription.bbox)
+                if cells is None:
+                    self._wide_bbox.add(subscription)
+                else:
+                    for cell in cells:
+                        self._by_cell.setdefault(cell, set()).add(subscription)
+            return True
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._count -= 1
+            self._firehose.discard(subscription)
+            for bus_id in subscription.bus_ids:
+                _discard(self._by_bus, bus_id, subscription)
+            for route in subscription.routes:
+                _discard(self._by_route, route, subscription)
+            if subscription.bbox is not None:
+                self._wide_bbox.discard(subscription)
+                for cell in _bbox_cells(subscription.bbox) or ():
+                    _discard(self._by_cell, cell, subscription)
+
+    def subscriber_count(self):
+        return self._count
+
+    def add_listener(self, listener):
+        """Register a callable fed every published batch of states (e.g. the spatial index)"""
+        self._listeners.append(listener)
+
+    # ========== PUBLISHING ==========
+
+    def publish(self, states):
+        """Deliver live states to every matching subscription
+
+        States not newer than what was already published for their bus are
+        skipped, so a fix relayed back from the shared store is sent once. A
+        state re-stamped with a later received_at (e.g. a status change) for
+        the same fix counts as newer."""
+        fresh = []
+        with self._lock:
+            for state in states:
+                version = (state['ts'], state.get('received_at', 0))
+                if version > self._last_ts.get(state['bus_id'], (float('-inf'), 0)):
+                    self._last_ts[state['bus_id']] = version
+                    fresh.append(state)
+
+        for listener in self._listeners:
+            listener(fresh)
+
+        for state in fresh:
+            with self._lock:
+                targets = set(self._firehose)
+                targets.update(self._by_bus.get(state['bus_id'], ()))
+                if state.get('route') is not None:
+                    targets.update(self._by_route.get(state['route'], ()))
+                cell = _cell(state['latitude'], state['longitude'])
+                candidates = list(self._by_cell.get(cell, ())) + list(self._wide_bbox)
+
+            for subscription in candidates:
+                if subscription.in_bbox(state):
+                    targets.add(subscription)
+
+            for subscription in targets:
+                subscription.push(state)
+
+    # ========== CROSS-WORKER RELAY ==========
+
+    def init_app(self, app, live_state):
+        """Relay positions ingested by other workers when the live state is shared
+         Args:
+            app: Flask app providing GPS_STREAM_* settings
+            live_state: live-state facade; only a backend exposing
+                changed_since() (the SQLite one) is polled"""
+        self.max_subscribers = app.config.get('GPS_STREAM_MAX_SUBSCRIBERS', self.max_subscribers)
+        poll_ms = app.config.get('GPS_STREAM_POLL_MS', 500)
+        backend = live_state.backend
+        if poll_ms and hasattr(backend, 'changed_since') and self._poller is None:
+            self._poller = threading.Thread(
+                target=self._poll, args=(backend, poll_ms / 1000), name='gps-stream-relay', daemon=True
+            )
+            self._poller.start()
+
+    def _poll(self, backend, interval):
+        since = time.time()
+        while True:
+            time.sleep(interval)
+            try:
+                states, since = backend.changed_since(since)
+            except Exception:
+                continue
+            if states and (self._count or self._listeners):
+                self.publish(states)
+
+
+def format_sse(state, event='position'):
+    """Encode one live state as a Server-Sent Events message"""
+    return f"event: {event}\nid: {state['ts']}\ndata: {json.dumps(state)}\n\n"
+
+
+def _cell(latitude, longitude):
+    return (math.floor(latitude / BBOX_CELL_DEG), math.floor(longitude / BBOX_CELL_DEG))
+
+
+def _bbox_cells(bbox):
+    """Grid cells overlapped by a bbox, or None if it spans too many"""
+    min_lat, min_lng, max_lat, max_lng = bbox
+    lat_cells = range(math.floor(min_lat / BBOX_CELL_DEG), math.floor(max_lat / BBOX_CELL_DEG) + 1)
+    lng_cells = range(math.floor(min_lng / BBOX_CELL_DEG), math.floor(max_lng / BBOX_CELL_DEG) + 1)
+    if len(lat_cells) * len(lng_cells) > BBOX_MAX_CELLS:
+        return None
+    return [(lat, lng) for lat in lat_cells for lng in lng_cells]
+
+
+def _discard(index, key, subscription):
+    members = index.get(key)
+    if members is not None:
+        members.discard(subscription)
+        if not members:
+            del index[key]
+
+
+# Shared broker instance (configured by init_app in app.py)
+position_broker = PositionBroker()
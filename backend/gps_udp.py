@@ -0,0 +1,149 @@
+"""
+GPS UDP Listener
+Receives fixed-size binary GPS records over UDP and feeds them to the ingest pipeline
+"""
+
+import socket
+import struct
+import threading
+import time
+
+# One record, network byte order (20 bytes):
+#   bus_id      uint32
+#   latitude    int32   micro-degrees
+#   longitude   int32   micro-degrees
+#   speed       uint16  0.1 km/h
+#   heading     uint16  0.01 degrees
+#   timestamp   uint32  epoch seconds (UTC)
+# A datagram carries one or more records back to back.
+RECORD = struct.Struct('!IiiHHI')
+
+
+def encode_record(bus_id, latitude, longitude, speed, heading, timestamp):
+    """Pack one fix (speed in km/h, heading in degrees, epoch seconds)"""
+    return RECORD.pack(
+        bus_id,
+        round(latitude * 1e6),
+        round(longitude * 1e6),
+        min(0xFFFF, round(speed * 10)),
+        round(heading * 100) % 36000,
+        int(timestamp)
+    )
+
+
+def decode_datagram(data):
+    """Fix objects in a datagram, or None if its length is not a whole number of records"""
+    if not data or len(data) % RECORD.size:
+        return None
+    return [{
+        'bus_id': bus_id,
+        'latitude': latitude / 1e6,
+        'longitude': longitude / 1e6,
+        'speed': speed / 10,
+        'heading': heading / 100,
+        'timestamp': timestamp
+    } for bus_id, latitude, longitude, speed, heading, timestamp in RECORD.iter_unpack(data)]
+
+
+class GPSUDPListener:
+    """Background thread turning datagrams into batched ingest calls
+
+    Records are collected for up to `batch_ms` (or MAX_BATCH_SIZE records)
+    and ingested with one ingest_fixes call, the same pipeline as the HTTP
+    location endpoints. The socket uses SO_REUSEPORT where available, so
+    every worker process can bind the port and the kernel spreads
+    datagrams across them.
+    """
+
+    def __init__(self, host='0.0.0.0', port=5055, batch_ms=200, recv_buffer_bytes=4 * 1024 * 1024):
+        self.host = host
+        self.port = port
+        self.batch_ms = batch_ms
+        self.recv_buffer_bytes = recv_buffer_bytes
+
+        self.enabled = False
+        self._app = None
+        self._socket = None
+        self._thread = None
+        self._stopping = False
+        self.stats = {'packets': 0, 'records': 0, 'malformed': 0, 'batches': 0, 'rejected': 0, 'errors': 0}
+
+    def init_app(self, app):
+        """Read the GPS_UDP_* settings and start listening when enabled"""
+        self._app = app
+        self.enabled = app.config.get('GPS_UDP_ENABLED', False)
+        self.host = app.config.get('GPS_UDP_HOST', self.host)
+        self.port = app.config.get('GPS_UDP_PORT', self.port)
+        self.batch_ms = app.config.get('GPS_UDP_BATCH_MS', self.batch_ms)
+
+        if self.enabled and self._thread is None:
+            self._socket = self._bind()
+            self._thread = threading.Thread(target=self._run, name='gps-udp', daemon=True)
+            self._thread.start()
+
+    def _bind(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if hasattr(socket, 'SO_REUSEPORT'):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.recv_buffer_bytes)
+        sock.bind((self.host, self.port))
+        return sock
+
+    def _run(self):
+        from gps_ingest import MAX_BATCH_SIZE
+        pending = []
+        deadline = None
+        max_datagram = RECORD.size * (65507 // RECORD.size)
+        while not self._stopping:
+            # Wake up at least once a second to notice close()
+            timeout = 1.0 if deadline is None else max(0.0, deadline - time.monotonic())
+            self._socket.settimeout(timeout)
+            try:
+                data, _ = self._socket.recvfrom(max_datagram)
+            except socket.timeout:
+                data = None
+            except OSError:
+                return
+
+            if data is not None:
+                self.stats['packets'] += 1
+                fixes = decode_datagram(data)
+                if fixes is None:
+                    self.stats['malformed'] += 1
+                else:
+                    self.stats['records'] += len(fixes)
+                    pending.extend(fixes)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.batch_ms / 1000
+
+            if pending and (len(pending) >= MAX_BATCH_SIZE or time.monotonic() >= deadline or self._stopping):
+                self._ingest(pending[:MAX_BATCH_SIZE])
+                pending = pending[MAX_BATCH_SIZE:]
+                deadline = time.monotonic() + self.batch_ms / 1000 if pending else None
+
+    def _ingest(self, fixes):
+        from gps_ingest import ingest_fixes
+        self.stats['batches'] += 1
+        try:
+            with self._app.app_context():
+                report, error = ingest_fixes(fixes)
+            if error:
+                self.stats['errors'] += 1
+            else:
+                self.stats['rejected'] += report['rejected']
+        except Exception:
+            self.stats['errors'] += 1
+
+    def close(self):
+        """Stop listening; records already received are ingested first"""
+        self._stopping = True
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+
+# Shared listener instance (configured by init_app in app.py)
+gps_udp_listener = GPSUDPListener()
@@ -0,0 +1,212 @@
+"""
+Live Fleet State
+Pluggable store for the current position of every bus, shared by all GPS read endpoints
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+# Fix timestamps are naive UTC; seconds since this epoch make them sortable
+EPOCH = datetime(1970, 1, 1)
+
+
+class InProcessLiveState:
+    """Per-process store: a dict of immutable per-bus snapshots
+
+    Readers never lock: each update swaps in a fresh dict for the bus, which
+    is a single atomic assignment. Writers only take one of a small set of
+    striped locks, so updates to different buses do not contend.
+    """
+
+    LOCK_STRIPES = 64
+
+    def __init__(self):
+        self._states = {}
+        self._locks = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+
+    def update(self, bus_id, state):
+        """Store a bus's state unless a newer one is already held
+
+        Returns:
+            bool: True if the state was stored"""
+        with self._locks[bus_id % self.LOCK_STRIPES]:
+            current = self._states.get(bus_id)
+            if current is not None and current['ts'] > state['ts']:
+                return False
+            self._states[bus_id] = dict(state)
+            return True
+
+    def update_many(self, states):
+        """Store several bus states; returns the bus ids that changed"""
+        return [state['bus_id'] for state in states if self.update(state['bus_id'], state)]
+
+    def get(self, bus_id):
+        """Current state of one bus, or None"""
+        return self._states.get(bus_id)
+
+    def get_all(self):
+        """Snapshot of every bus's state keyed by bus id"""
+        return self._states.copy()
+
+    def remove(self, bus_id):
+        """Forget a bus (e.g. taken out of service)"""
+        self._states.pop(bus_id, None)
+
+
+class SQLiteLiveState:
+    """Cross-process store backed by a small WAL-mode SQLite file
+
+    Every worker opens the same file, so all of them see the same fleet.
+    WAL lets readers run alongside the single writer, and each update is a
+    tiny one-row upsert keyed by bus id.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS live_positions ('
+            ' bus_id INTEGER PRIMARY KEY,'
+            ' ts REAL NOT NULL,'
+            ' updated_at REAL NOT NULL,'
+            ' state TEXT NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_live_positions_updated_at ON live_positions (updated_at)')
+
+    def _connection(self):
+        """One connection per thread (sqlite3 connections are not thread-safe)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def update(self, bus_id, state):
+        """Store a bus's state unless a newer one is already held"""
+        return bool(self.update_many([dict(state, bus_id=bus_id)]))
+
+    def update_many(self, states):
+        """Upsert several bus states in one transaction; returns changed bus ids"""
+        if not states:
+            return []
+        conn = self._connection()
+        changed = []
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for state in states:
+                cursor = conn.execute(
+                    'INSERT INTO live_positions (bus_id, ts, updated_at, state) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT(bus_id) DO UPDATE SET ts = excluded.ts, '
+                    'updated_at = excluded.updated_at, state = excluded.state '
+                    'WHERE excluded.ts >= live_positions.ts',
+                    (state['bus_id'], state['ts'], state.get('received_at', time.time()), json.dumps(state))
+                )
+                if cursor.rowcount:
+                    changed.append(state['bus_id'])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return changed
+
+    def get(self, bus_id):
+        """Current state of one bus, or None"""
+        row = self._connection().execute(
+            'SELECT state FROM live_positions WHERE bus_id = ?', (bus_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_all(self):
+        """Snapshot of every bus's state keyed by bus id"""
+        rows = self._connection().execute('SELECT bus_id, state FROM live_positions').fetchall()
+        return {bus_id: json.loads(state) for bus_id, state in rows}
+
+    def remove(self, bus_id):
+        """Forget a bus (e.g. taken out of service)"""
+        self._connection().execute('DELETE FROM live_positions WHERE bus_id = ?', (bus_id,))
+
+    def changed_since(self, since):
+        """States written after `since` (epoch seconds), for cross-worker relays
+
+        Returns:
+            tuple: (states, newest_updated_at)"""
+        rows = self._connection().execute(
+            'SELECT updated_at, state FROM live_positions WHERE updated_at > ? ORDER BY updated_at',
+            (since,)
+        ).fetchall()
+        if not rows:
+            return [], since
+        return [json.loads(state) for _, state in rows], rows[-1][0]
+
+
+class LiveState:
+    """Facade over the configured backend ('memory' or 'sqlite')"""
+
+    def __init__(self):
+        self.backend = InProcessLiveState()
+        self.max_age_s = 5
+
+    def init_app(self, app):
+        """Pick the backend from GPS_LIVE_STATE_BACKEND / GPS_LIVE_STATE_PATH"""
+        self.max_age_s = app.config.get('GPS_LIVE_STATE_MAX_AGE_S', self.max_age_s)
+        backend = app.config.get('GPS_LIVE_STATE_BACKEND', 'memory')
+        if backend == 'sqlite':
+            self.backend = SQLiteLiveState(app.config.get('GPS_LIVE_STATE_PATH', 'live_state.db'))
+        elif backend == 'memory':
+            self.backend = InProcessLiveState()
+        else:
+            raise ValueError(f'Unknown GPS_LIVE_STATE_BACKEND: {backend}')
+
+    @property
+    def shared(self):
+        """True when every worker reads and writes the same store"""
+        return hasattr(self.backend, 'changed_since')
+
+    def update_many(self, states):
+        return self.backend.update_many(states)
+
+    def get(self, bus_id):
+        return self.backend.get(bus_id)
+
+    def get_all(self):
+        return self.backend.get_all()
+
+    def remove(self, bus_id):
+        self.backend.remove(bus_id)
+
+
+def state_from_fix(fix, bus=None):
+    """Build the JSON-safe live state for a bus from a normalised fix
+     Args:
+        fix: fix dict as produced by gps_ingest.parse_fix
+        bus: optional dict with bus_number, driver_name, route and status"""
+    state = {
+        'bus_id': fix['bus_id'],
+        'latitude': fix['latitude'],
+        'longitude': fix['longitude'],
+        'speed': fix.get('speed', 0),
+        'heading': fix.get('heading', 0),
+        'accuracy': fix.get('accuracy', 0),
+        'altitude': fix.get('altitude', 0),
+        'timestamp': fix['timestamp'].isoformat(),
+        'ts': (fix['timestamp'] - EPOCH).total_seconds(),
+        'received_at': time.time()
+    }
+    if fix.get('distance_along_route') is not None:
+        state['distance_along_route'] = fix['distance_along_route']
+    if bus:
+        state.update(bus)
+    return state
+
+
+# Shared live-state instance (configured by init_app in app.py)
+live_state = LiveState()
@@ -0,0 +1,151 @@
+"""
+Map Matching
+Snaps GPS fixes onto each bus's route polyline and reports distance along the route
+"""
+
+import threading
+from bisect import bisect_right
+import numpy as np
+from geo_utils import haversine_pairwise, PolylineProjector
+
+# A bus within this many metres of a stop counts as being at it, not before it
+AT_STOP_KM = 0.02
+
+
+class RouteGeometry:
+    """Route polyline with cumulative distances and the stops' positions along it
+
+    Fixes are projected onto a run of segments with a PolylineProjector.
+    Distances along the route use the segments' haversine lengths.
+    """
+
+    def __init__(self, points, stops):
+        self.points = points
+        self.stops = stops
+        lats = np.array([point[0] for point in points], dtype=np.float64)
+        lngs = np.array([point[1] for point in points], dtype=np.float64)
+        self._projector = PolylineProjector(lats, lngs)
+        self.lengths_km = haversine_pairwise(lats[:-1], lngs[:-1], lats[1:], lngs[1:])
+        self.cumulative_km = np.concatenate([[0.0], np.cumsum(self.lengths_km)])
+        self.length_km = float(self.cumulative_km[-1])
+
+        # Stop positions along the route, forced non-decreasing for bisection
+        offsets = []
+        for stop in stops:
+            located = self.project(stop.latitude, stop.longitude, 0, self.segment_count)
+            offsets.append(self.distance_at(located[0], located[1]) if located else 0.0)
+        self.stop_offsets_km = np.maximum.accumulate(offsets).tolist() if offsets else []
+
+    @property
+    def segment_count(self):
+        return self._projector.segment_count
+
+    def project(self, latitude, longitude, lo, hi):
+        """Closest point on segments [lo, hi): (segment, t, offset_km) or None"""
+        lo, hi = max(0, lo), min(self.segment_count, hi)
+        if hi <= lo:
+            return None
+        t, offsets = self._projector.project(latitude, longitude, slice(lo, hi))
+        best = int(np.argmin(offsets))
+        return lo + best, min(1.0, max(0.0, float(t[best]))), float(offsets[best])
+
+    def distance_at(self, segment, t):
+        """Distance along the route (km) of a point t of the way along a segment"""
+        return float(self.cumulative_km[segment] + t * self.lengths_km[segment])
+
+    def next_stop(self, distance_km):
+        """Index of the first stop ahead of a distance along the route, or None past the last"""
+        index = bisect_right(self.stop_offsets_km, distance_km + AT_STOP_KM)
+        return index if index < len(self.stops) else None
+
+    def distance_to_stop(self, distance_km, stop_index):
+        """Distance along the route (km) from a position to a stop (negative once passed)"""
+        return self.stop_offsets_km[stop_index] - distance_km
+
+
+class RouteMatcher:
+    """Per-bus incremental matcher
+
+    Each bus remembers the segment of its previous match. A new fix is
+    first projected onto a short window of segments from there, so the
+    per-fix cost stays constant however long the route is. Only when the
+    fix is off that window (a detour, a GPS jump or a new trip) is the
+    whole route searched.
+    """
+
+    def __init__(self, max_offset_km=0.15, window=8):
+        self.max_offset_km = max_offset_km
+        self.window = window
+        self._geometries = {}   # bus_id -> RouteGeometry, or None when it has no route
+        self._hints = {}        # bus_id -> (segment, fix timestamp)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Read MAP_MATCH_MAX_OFFSET_M / MAP_MATCH_WINDOW"""
+        self.max_offset_km = app.config.get('MAP_MATCH_MAX_OFFSET_M', 150) / 1000
+        self.window = app.config.get('MAP_MATCH_WINDOW', self.window)
+
+    def invalidate(self, bus_id=None):
+        """Forget a bus's geometry (or all), e.g. after its stops or shape changed"""
+        with self._lock:
+            if bus_id is None:
+                self._geometries = {}
+                self._hints = {}
+            else:
+                self._geometries.pop(bus_id, None)
+                self._hints.pop(bus_id, None)
+
+    def geometry(self, bus_id):
+        """Route geometry of a bus: its uploaded shape if any, else its stops in order"""
+        if bus_id in self._geometries:
+            return self._geometries[bus_id]
+
+        from database_operations import ETAOperations, GPSOperations
+        from eta_engine import CachedStop
+        rows, error = ETAOperations.get_route_stops(bus_id)
+        if error:
+            return None
+        stops = [
+            CachedStop(row.id, row.stop_order, row.stop_name, row.latitude, row.longitude, bool(row.is_completed))
+            for row in rows
+        ]
+        shape, error = GPSOperations.get_route_shape(bus_id)
+        if error:
+            return None
+        points = shape or [(stop.latitude, stop.longitude) for stop in stops]
+        geometry = RouteGeometry(points, stops) if len(points) >= 2 else None
+        with self._lock:
+            self._geometries[bus_id] = geometry
+        return geometry
+
+    def match(self, bus_id, latitude, longitude, timestamp=None):
+        """Distance along the route (km) of one position, or None if it is off the route"""
+        geometry = self.geometry(bus_id)
+        if geometry is None:
+            return None
+
+        hint = self._hints.get(bus_id)
+        located = None
+        if hint is not None:
+            located = geometry.project(latitude, longitude, hint[0] - 1, hint[0] + self.window)
+            if located is not None and located[2] > self.max_offset_km:
+                located = None
+        if located is None:
+            located = geometry.project(latitude, longitude, 0, geometry.segment_count)
+            if located is None or located[2] > self.max_offset_km:
+                return None
+
+        segment, t, _ = located
+        if timestamp is not None and (hint is None or timestamp >= hint[1]):
+            self._hints[bus_id] = (segment, timestamp)
+        return geometry.distance_at(segment, t)
+
+    def match_fixes(self, fixes):
+        """Set distance_along_route on each fix (None when unmatched), oldest first per bus"""
+        for fix in sorted(fixes, key=lambda fix: fix['timestamp']):
+            distance_km = self.match(fix['bus_id'], fix['latitude'], fix['longitude'], fix['timestamp'])
+            fix['distance_along_route'] = round(distance_km, 4) if distance_km is not None else None
+
+
+# Shared matcher instance (configured by init_app in app.py)
+route_matcher = RouteMatcher()
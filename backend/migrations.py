@@ -14,6 +14,8 @@ def create_all_tables(app):
 
 def seed_sample_data(app):
     """Seed database with sample data"""
+    from database_operations import InventoryOperations
+    
     with app.app_context():
         # Check if data already exists
         if User.query.first() is not None:
@@ -187,6 +189,7 @@ def seed_sample_data(app):
         )
         
         db.session.add(booking1)
+        InventoryOperations.reserve(bus1.id, booking1.travel_date, [1])
         db.session.commit()
         print("✅ Created sample booking")
         
@@ -259,13 +262,85 @@ def cleanup_expired_data(app):
         # Delete expired promo codes
         PromoCode.query.filter(PromoCode.valid_until < datetime.utcnow()).delete()
         
-        # Delete old GPS data (older than 30 days)
-        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-        GPSTracker.query.filter(GPSTracker.timestamp < thirty_days_ago).delete()
-        
         db.session.commit()
+        
+        # Move closed days into the cold archive first, so raw fixes leave
+        # gps_trackers at full resolution before retention downsamples them
+        if app.config.get('GPS_ARCHIVE_ENABLED'):
+            from gps_archive import archive_closed_days
+            
+            summary, error = archive_closed_days(app.config)
+            if error:
+                print(f"❌ GPS archive failed: {error}")
+            else:
+                print(f"   gps_trackers: archived {summary['fixes']} fixes ({summary['bus_days']} bus-days)")
+        
+        # Roll old GPS fixes into downsampled tracks (bounded batches, see retention.py)
+        from retention import run_gps_retention
+        
+        for step in run_gps_retention(app.config):
+            if step['error']:
+                print(f"❌ {step['table']} {step['action']} failed: {step['error']}")
+            else:
+                print(f"   {step['table']}: {step['action']}, {step['rows']} rows in {step['batches']} batches")
         print("✅ Expired data cleaned up")
 
+def backfill_latest_positions(app):
+    """Populate bus_latest_positions from existing GPS history"""
+    from database_operations import GPSOperations
+    
+    with app.app_context():
+        db.create_all()
+        count, error = GPSOperations.rebuild_latest_positions()
+        if error:
+            print(f"❌ Backfill failed: {error}")
+        else:
+            print(f"✅ Latest positions rebuilt for {count} buses")
+
+def add_missing_columns(app):
+    """Add nullable columns introduced after a table was created (SQLite has no auto-migrate)"""
+    from sqlalchemy import inspect, text
+    
+    with app.app_context():
+        db.create_all()
+        inspector = inspect(db.engine)
+        added = 0
+        for table in db.metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                with db.engine.begin() as conn:
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                print(f"   + {table.name}.{column.name} ({column_type})")
+                added += 1
+        print(f"✅ Added {added} missing columns")
+
+def refresh_eta_model(app):
+    """Fold recent GPS history and stop arrivals into the ETA segment model"""
+    from eta_engine import eta_engine
+    
+    with app.app_context():
+        db.create_all()
+        count, error = eta_engine.refresh()
+        if error:
+            print(f"❌ ETA refresh failed: {error}")
+        else:
+            print(f"✅ ETA model updated with {count} segment samples")
+
+def build_seat_inventory(app):
+    """Rebuild per-date seat inventory from pending and confirmed bookings"""
+    from database_operations import InventoryOperations
+    
+    with app.app_context():
+        db.create_all()
+        count, error = InventoryOperations.rebuild_from_bookings()
+        if error:
+            print(f"❌ Seat inventory rebuild failed: {error}")
+        else:
+            print(f"✅ Seat inventory rebuilt for {count} bus travel dates")
+
 if __name__ == '__main__':
     from app import app
     
@@ -277,8 +352,12 @@ if __name__ == '__main__':
     print("3. Reset database (drop + create + seed)")
     print("4. Get database info")
     print("5. Cleanup expired data")
+    print("6. Backfill latest bus positions")
+    print("7. Refresh ETA segment model")
+    print("8. Add missing columns to existing tables")
+    print("9. Build seat inventory from bookings")
     
-    choice = input("\nEnter your choice (1-5): ")
+    choice = input("\nEnter your choice (1-9): ")
     
     if choice == '1':
         create_all_tables(app)
@@ -292,5 +371,13 @@ if __name__ == '__main__':
         get_database_info(app)
     elif choice == '5':
         cleanup_expired_data(app)
+    elif choice == '6':
+        backfill_latest_positions(app)
+    elif choice == '7':
+        refresh_eta_model(app)
+    elif choice == '8':
+        add_missing_columns(app)
+    elif choice == '9':
+        build_seat_inventory(app)
     else:
         print("Invalid choice!")
@@ -1,7 +1,8 @@
 from flask import Blueprint, request, jsonify
-from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-from app import db, app
+from database import db, User, Bus, Seat, Booking, Payment, Refund, Wallet, WalletTransaction
+from database_operations import BookingOperations
+from seat_holds import seat_holds
 import uuid
 import hmac
 import hashlib
@@ -9,123 +10,102 @@ import hashlib
 # Payment Service Blueprint
 payment_bp = Blueprint('payment', __name__, url_prefix='/api/payments')
 
-class Payment(db.Model):
-    __tablename__ = 'payments'
-    id = db.Column(db.Integer, primary_key=True)
-    transaction_id = db.Column(db.String(100), unique=True, nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    booking_id = db.Column(db.Integer, nullable=True)
-    amount = db.Column(db.Float, nullable=False)
-    currency = db.Column(db.String(10), default='INR')
-    payment_method = db.Column(db.String(50), nullable=False)  # card, upi, wallet
-    payment_status = db.Column(db.String(20), default='pending')  # pending, completed, failed, refunded
-    payment_gateway = db.Column(db.String(50), default='razorpay')  # razorpay, stripe, paypal
-    gateway_transaction_id = db.Column(db.String(100), nullable=True)
-    payment_details = db.Column(db.JSON, nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    completed_at = db.Column(db.DateTime, nullable=True)
-    
-    user = db.relationship('User', backref='payments')
-
-
-class Booking(db.Model):
-    __tablename__ = 'bookings'
-    id = db.Column(db.Integer, primary_key=True)
-    booking_id = db.Column(db.String(50), unique=True, nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    seat_id = db.Column(db.Integer, db.ForeignKey('seats.id'), nullable=False)
-    bus_id = db.Column(db.Integer, db.ForeignKey('buses.id'), nullable=False)
-    price = db.Column(db.Float, nullable=False)
-    status = db.Column(db.String(20), default='pending')  # pending, confirmed, cancelled
-    booking_date = db.Column(db.DateTime, default=datetime.utcnow)
-    travel_date = db.Column(db.DateTime, nullable=False)
-    
-    user = db.relationship('User', backref='bookings')
-    seat = db.relationship('Seat', backref='bookings')
-    bus = db.relationship('Bus', backref='bookings')
-    payments = db.relationship('Payment', backref='booking_ref', foreign_keys='Payment.booking_id')
-
-
-class Refund(db.Model):
-    __tablename__ = 'refunds'
-    id = db.Column(db.Integer, primary_key=True)
-    payment_id = db.Column(db.Integer, db.ForeignKey('payments.id'), nullable=False)
-    refund_amount = db.Column(db.Float, nullable=False)
-    refund_reason = db.Column(db.String(500), nullable=False)
-    refund_status = db.Column(db.String(20), default='pending')  # pending, completed, failed
-    gateway_refund_id = db.Column(db.String(100), nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    completed_at = db.Column(db.DateTime, nullable=True)
-    
-    payment = db.relationship('Payment', backref='refunds')
-
-
-class Wallet(db.Model):
-    __tablename__ = 'wallets'
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), unique=True, nullable=False)
-    balance = db.Column(db.Float, default=0)
-    last_updated = db.Column(db.DateTime, default=datetime.utcnow)
-    
-    user = db.relationship('User', backref='wallet', uselist=False)
-
-
-class WalletTransaction(db.Model):
-    __tablename__ = 'wallet_transactions'
-    id = db.Column(db.Integer, primary_key=True)
-    wallet_id = db.Column(db.Integer, db.ForeignKey('wallets.id'), nullable=False)
-    transaction_type = db.Column(db.String(20), nullable=False)  # credit, debit
-    amount = db.Column(db.Float, nullable=False)
-    description = db.Column(db.String(200), nullable=False)
-    balance_before = db.Column(db.Float, nullable=False)
-    balance_after = db.Column(db.Float, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    
-    wallet = db.relationship('Wallet', backref='transactions')
-
+# Largest number of seats one group booking may reserve
+MAX_GROUP_SEATS = 10
 
 # ========== PAYMENT ROUTES ==========
 
 @payment_bp.route('/bookings', methods=['POST'])
 def create_booking():
-    """Create a booking (reserve seat and initiate payment)"""
+    """Create a booking (hold seat and initiate payment)"""
     try:
-        from app import Seat, Bus
-        
         data = request.json
         user_id = data['user_id']
         seat_id = data['seat_id']
         bus_id = data['bus_id']
         
+        user = User.query.get(user_id)
         seat = Seat.query.get(seat_id)
         bus = Bus.query.get(bus_id)
         
-        if not seat or not bus:
-            return jsonify({'message': 'Seat or Bus not found'}), 404
-        
-        if seat.is_reserved:
-            return jsonify({'message': 'Seat already reserved'}), 400
+        if not user or not seat or not bus:
+            return jsonify({'message': 'User, Seat or Bus not found'}), 404
         
-        # Create booking
+        # Holds the seat on the travel date until the payment is verified
         booking_id = f"BK{uuid.uuid4().hex[:10].upper()}"
-        booking = Booking(
-            booking_id=booking_id,
-            user_id=user_id,
-            seat_id=seat_id,
-            bus_id=bus_id,
+        booking, error = BookingOperations.create_booking(
+            user_id=user.id,
+            bus_id=bus.id,
+            seat_id=seat.id,
+            travel_date=datetime.fromisoformat(data.get('travel_date', datetime.utcnow().isoformat())),
             price=data.get('price', 200.0),
-            travel_date=datetime.fromisoformat(data.get('travel_date', datetime.utcnow().isoformat()))
+            booking_id=booking_id,
+            allow_women_seat=(user.gender == 'female')
         )
-        
-        db.session.add(booking)
-        db.session.commit()
+        if error:
+            return jsonify({'message': error}), 400
         
         return jsonify({
             'message': 'Booking created',
             'booking_id': booking.id,
             'booking_ref': booking_id,
             'amount': booking.price,
-            'currency': 'INR'
+            'currency': 'INR',
+            'hold_expires_at': booking.hold_expires_at.isoformat()
+        }), 201
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@payment_bp.route('/group-bookings', methods=['POST'])
+def create_group_booking():
+    """Book several seats at once (a seat list, or N adjacent seats) with one payment intent"""
+    try:
+        data = request.json
+        user = User.query.get(data['user_id'])
+        if not user:
+            return jsonify({'message': 'User not found'}), 404
+        
+        seat_ids = data.get('seat_ids')
+        count = data.get('count')
+        if not seat_ids and not count:
+            return jsonify({'message': 'seat_ids or count is required'}), 400
+        requested = len(seat_ids) if seat_ids else int(count)
+        if requested < 1 or requested > MAX_GROUP_SEATS:
+            return jsonify({'message': f'A group booking takes 1 to {MAX_GROUP_SEATS} seats'}), 400
+        
+        result, error = BookingOperations.create_group_booking(
+            user_id=user.id,
+            bus_id=data['bus_id'],
+            travel_date=datetime.fromisoformat(data.get('travel_date', datetime.utcnow().isoformat())),
+            price=data.get('price', 200.0),
+            seat_ids=seat_ids,
+            count=count,
+            allow_women_seat=(user.gender == 'female'),
+            payment_method=data.get('payment_method', 'card')
+        )
+        if error:
+            status = 404 if error == 'Bus not found' else 409
+            return jsonify({'message': error}), status
+        
+        payment = result['payment']
+        return jsonify({
+            'message': 'Group booking created',
+            'group_ref': result['group_ref'],
+            'bookings': [booking.to_dict() for booking in result['bookings']],
+            'payment_id': payment.id,
+            'transaction_id': payment.transaction_id,
+            'razorpay_order': {
+                'amount': int(payment.amount * 100),  # Convert to paise
+                'currency': 'INR',
+                'receipt': payment.transaction_id,
+                'description': f"Bus Tickets - {result['group_ref']}",
+                'customer_notify': 1
+            },
+            'amount': payment.amount,
+            'currency': 'INR',
+            'hold_expires_at': result['hold_expires_at'].isoformat()
         }), 201
     except Exception as e:
         db.session.rollback()
@@ -162,7 +142,7 @@ def initiate_payment():
             'amount': int(booking.price * 100),  # Convert to paise
             'currency': 'INR',
             'receipt': transaction_id,
-            'description': f'Bus Ticket - {booking.booking_ref}',
+            'description': f'Bus Ticket - {booking.booking_id}',
             'customer_notify': 1
         }
         
@@ -194,33 +174,41 @@ def verify_payment():
         if not payment:
             return jsonify({'message': 'Payment not found'}), 404
         
+        if payment.payment_status != 'pending':
+            return jsonify({'message': f'Payment is already {payment.payment_status}'}), 409
+        
         # Verify signature (Razorpay/Stripe verification)
         # In production, verify with actual gateway
         payment_valid = True
         
         if payment_valid:
+            # Claim the held seat(s) first; if a hold lapsed and its seat was taken, nothing is confirmed
+            booking = Booking.query.get(payment.booking_id) if payment.booking_id else None
+            details = payment.payment_details or {}
+            group = []
+            if details.get('booking_ids'):
+                group = Booking.query.filter(Booking.id.in_(details['booking_ids'])).all()
+            
+            claimed_bookings = ([booking] if booking else []) + group
+            for claimed in claimed_bookings:
+                error = BookingOperations.claim(
+                    claimed, allow_women_seat=(claimed.user is not None and claimed.user.gender == 'female')
+                )
+                if error:
+                    db.session.rollback()
+                    return jsonify({'message': error}), 409
+            
             payment.payment_status = 'completed'
             payment.gateway_transaction_id = gateway_transaction_id
             payment.completed_at = datetime.utcnow()
             
-            # Confirm booking
-            booking = Booking.query.get(payment.booking_id)
-            if booking:
-                booking.status = 'confirmed'
-                
-                # Reserve the seat
-                seat = Seat.query.get(booking.seat_id)
-                if seat:
-                    seat.is_reserved = True
-                    seat.reserved_by_user_id = booking.user_id
-                    seat.reserved_at = datetime.utcnow()
-            
             db.session.commit()
+            seat_holds.forget([claimed.id for claimed in claimed_bookings], confirmed=True)
             
             return jsonify({
                 'message': 'Payment verified and confirmed',
                 'payment_status': 'completed',
-                'booking_ref': booking.booking_ref if booking else None
+                'booking_ref': booking.booking_id if booking else details.get('group_ref')
             }), 200
         else:
             payment.payment_status = 'failed'
@@ -247,6 +235,7 @@ def initiate_refund(payment_id):
         
         # Create refund record
         refund = Refund(
+            refund_id=f"RF{uuid.uuid4().hex[:12].upper()}",
             payment_id=payment_id,
             refund_amount=payment.amount,
             refund_reason=data.get('reason', 'User requested refund')
@@ -255,17 +244,22 @@ def initiate_refund(payment_id):
         db.session.add(refund)
         payment.payment_status = 'refunded'
         
-        # Cancel booking and free up seat
-        booking = Booking.query.get(payment.booking_id)
-        if booking:
-            booking.status = 'cancelled'
-            seat = Seat.query.get(booking.seat_id)
-            if seat:
-                seat.is_reserved = False
-                seat.reserved_by_user_id = None
-                seat.reserved_at = None
+        # Cancel the booking(s) and free up their seats
+        details = payment.payment_details or {}
+        if details.get('booking_ids'):
+            bookings = Booking.query.filter(Booking.id.in_(details['booking_ids'])).all()
+        else:
+            bookings = [Booking.query.get(payment.booking_id)] if payment.booking_id else []
+        
+        bookings = [booking for booking in bookings if booking]
+        for booking in bookings:
+            _, error = BookingOperations.release_booking(booking, refund.refund_reason)
+            if error:
+                db.session.rollback()
+                return jsonify({'message': error}), 409
         
         db.session.commit()
+        seat_holds.forget([booking.id for booking in bookings])
         
         return jsonify({
             'message': 'Refund initiated',
@@ -382,6 +376,9 @@ def pay_with_wallet():
         if not booking:
             return jsonify({'message': 'Booking not found'}), 404
         
+        if booking.status == 'confirmed':
+            return jsonify({'message': 'Booking is already paid'}), 409
+        
         wallet = Wallet.query.filter_by(user_id=user_id).first()
         if not wallet:
             return jsonify({'message': 'Wallet not found'}), 404
@@ -389,12 +386,20 @@ def pay_with_wallet():
         if wallet.balance < booking.price:
             return jsonify({'message': 'Insufficient wallet balance'}), 400
         
+        # Claim the held seat before touching the wallet
+        error = BookingOperations.claim(
+            booking, allow_women_seat=(wallet.user is not None and wallet.user.gender == 'female')
+        )
+        if error:
+            db.session.rollback()
+            return jsonify({'message': error}), 409
+        
         # Debit wallet
         transaction = WalletTransaction(
             wallet_id=wallet.id,
             transaction_type='debit',
             amount=booking.price,
-            description=f'Booking payment - {booking.booking_ref}',
+            description=f'Booking payment - {booking.booking_id}',
             balance_before=wallet.balance,
             balance_after=wallet.balance - booking.price
         )
@@ -412,24 +417,23 @@ def pay_with_wallet():
             completed_at=datetime.utcnow()
         )
         
-        # Confirm booking
-        booking.status = 'confirmed'
-        seat = Seat.query.get(booking.seat_id)
-        if seat:
-            seat.is_reserved = True
-            seat.reserved_by_user_id = user_id
-            seat.reserved_at = datetime.utcnow()
-        
         db.session.add(transaction)
         db.session.add(payment)
         db.session.commit()
+        seat_holds.forget([booking.id], confirmed=True)
         
         return jsonify({
             'message': 'Payment successful',
-            'booking_ref': booking.booking_ref,
+            'booking_ref': booking.booking_id,
             'amount': booking.price,
             'new_wallet_balance': wallet.balance
         }), 200
     except Exception as e:
         db.session.rollback()
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
+
+
+@payment_bp.route('/holds/stats', methods=['GET'])
+def get_hold_stats():
+    """Seat hold and reaper counters of this process"""
+    return jsonify(seat_holds.snapshot()), 200
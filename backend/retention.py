@@ -0,0 +1,89 @@
+"""
+GPS Retention
+Tiered retention: raw fixes roll into downsampled tracks, which age out in bounded batches
+"""
+
+import time
+from datetime import datetime, timedelta
+from database_operations import RetentionOperations
+
+
+def parse_tiers(spec):
+    """Parse 'resolution_seconds:max_age_days,...' into (resolution, max_age_days) tuples
+
+    Tiers must be finest first, with growing resolutions and ages; a max
+    age of 0 keeps the tier forever and is only allowed on the last tier."""
+    tiers = []
+    for item in (spec or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        resolution, max_age_days = (int(part) for part in item.split(':'))
+        if resolution <= 0 or max_age_days < 0:
+            raise ValueError(f'Invalid retention tier: {item}')
+        if tiers:
+            previous_resolution, previous_age = tiers[-1]
+            if resolution <= previous_resolution or previous_age == 0 or (max_age_days and max_age_days <= previous_age):
+                raise ValueError(f'Retention tiers must grow in resolution and age: {spec}')
+        tiers.append((resolution, max_age_days))
+    return tiers
+
+
+def _drain(step, batch_size, pause, max_batches):
+    """Call a batch operation until it runs dry; returns (rows, batches, error)"""
+    total = batches = 0
+    while max_batches is None or batches < max_batches:
+        count, error = step()
+        if error:
+            return total, batches, error
+        total += count
+        batches += 1
+        if count < batch_size:
+            break
+        time.sleep(pause)
+    return total, batches, None
+
+
+def run_gps_retention(config, now=None, max_batches=None):
+    """Apply the configured retention tiers to GPS history
+     Args:
+        config: mapping with the GPS_RAW_RETENTION_DAYS / GPS_RETENTION_* keys
+        now: reference time (naive UTC), defaults to utcnow
+        max_batches: per-step cap on batches for this run (None = until done)
+
+    Returns:
+        list: one summary dict per step (table, action, rows, batches, error)"""
+    now = now or datetime.utcnow()
+    raw_days = config.get('GPS_RAW_RETENTION_DAYS', 7)
+    tiers = parse_tiers(config.get('GPS_RETENTION_TIERS', ''))
+    batch_size = config.get('GPS_RETENTION_BATCH_SIZE', 2000)
+    pause = config.get('GPS_RETENTION_BATCH_PAUSE_MS', 50) / 1000
+
+    # Each step moves data one tier down: (source resolution, max age days, target resolution)
+    steps = [(None, raw_days, tiers[0][0] if tiers else None)]
+    for index, (resolution, max_age_days) in enumerate(tiers):
+        if max_age_days:
+            target = tiers[index + 1][0] if index + 1 < len(tiers) else None
+            steps.append((resolution, max_age_days, target))
+
+    summary = []
+    for source, max_age_days, target in steps:
+        cutoff = now - timedelta(days=max_age_days)
+        if target is None:
+            def step(source=source, cutoff=cutoff):
+                return RetentionOperations.purge_batch(cutoff, batch_size, source_resolution=source)
+        else:
+            def step(source=source, cutoff=cutoff, target=target):
+                return RetentionOperations.rollup_batch(cutoff, target, batch_size, source_resolution=source)
+
+        rows, batches, error = _drain(step, batch_size, pause, max_batches)
+        summary.append({
+            'table': 'gps_trackers' if source is None else f'gps_track_samples ({source}s)',
+            'action': 'purge' if target is None else f'rollup to {target}s',
+            'rows': rows,
+            'batches': batches,
+            'error': error
+        })
+        if error:
+            break
+    return summary
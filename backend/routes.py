@@ -1,7 +1,9 @@
 import random
-from datetime import datetime
+from datetime import datetime, date, timedelta
 from flask import Blueprint, request, jsonify
-from database import db, User, Bus, Seat, Wallet
+from database import db, User, Bus, Seat, Booking, Wallet
+from database_operations import SeatOperations, InventoryOperations
+from seat_map import seat_maps
 
 # 1. INITIALIZE BLUEPRINT FIRST (Fixes the NameError)
 api = Blueprint('api', __name__)
@@ -78,21 +80,101 @@ def login():
 
 # ==================== BUSES & SEATS ====================
 
+# Longest range served by one availability request
+MAX_CALENDAR_DAYS = 90
+
+
+def _date_arg(name):
+    """Optional query parameter holding an ISO date (default: today, UTC)"""
+    value = request.args.get(name)
+    return date.fromisoformat(value) if value else datetime.utcnow().date()
+
+
 @api.route('/buses', methods=['GET'])
 def get_buses():
+    """Active buses with their free seats on ?date= (default today)"""
     try:
+        try:
+            travel_date = _date_arg('date')
+        except ValueError:
+            return jsonify({'message': 'date must be YYYY-MM-DD'}), 400
+        
         buses = Bus.query.filter_by(status='active').all()
+        maps = seat_maps.get_for_buses(buses)
+        masks = InventoryOperations.get_day_masks([b.id for b in buses], travel_date) if buses else {}
         return jsonify({
+            'travel_date': travel_date.isoformat(),
             'buses': [{
                 'id': b.id,
                 'bus_number': b.bus_number,
                 'route': b.route,
-                'available_seats': sum(1 for s in b.seats if not s.is_reserved)
+                'available_seats': maps[b.id].count_available(taken=masks.get(b.id, 0))
             } for b in buses]
         }), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@api.route('/buses/<int:bus_id>/seats', methods=['GET'])
+def get_seat_map(bus_id):
+    """A bus's seats with those taken on ?date= (default today) marked reserved"""
+    try:
+        bus = Bus.query.get(bus_id)
+        if not bus:
+            return jsonify({'error': 'Bus not found'}), 404
+        
+        try:
+            travel_date = _date_arg('date')
+        except ValueError:
+            return jsonify({'message': 'date must be YYYY-MM-DD'}), 400
+        
+        seat_map = seat_maps.get(bus.id, bus.seat_version or 0)
+        taken = InventoryOperations.get_day_masks([bus.id], travel_date).get(bus.id, 0)
+        return jsonify({
+            'bus_id': bus.id,
+            'travel_date': travel_date.isoformat(),
+            'total_seats': seat_map.total_count,
+            'available_seats': seat_map.count_available(taken),
+            'seats': seat_map.seats(taken)
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/buses/<int:bus_id>/availability', methods=['GET'])
+def get_availability(bus_id):
+    """Free and reserved seat counts per travel date, from ?from= (default today) for ?days= (default 30)"""
+    try:
+        bus = Bus.query.get(bus_id)
+        if not bus:
+            return jsonify({'error': 'Bus not found'}), 404
+        
+        try:
+            start = _date_arg('from')
+        except ValueError:
+            return jsonify({'message': 'from must be YYYY-MM-DD'}), 400
+        days = max(1, min(request.args.get('days', 30, type=int), MAX_CALENDAR_DAYS))
+        end = start + timedelta(days=days - 1)
+        
+        # One range read on (bus_id, travel_date) for the whole calendar
+        seat_map = seat_maps.get(bus.id, bus.seat_version or 0)
+        masks = InventoryOperations.get_masks(bus.id, start, end)
+        calendar = []
+        for offset in range(days):
+            day = start + timedelta(days=offset)
+            taken = masks.get(day, 0)
+            calendar.append({
+                'date': day.isoformat(),
+                'available_seats': seat_map.count_available(taken),
+                'reserved_seats': seat_map.count_reserved(taken)
+            })
+        
+        return jsonify({
+            'bus_id': bus.id,
+            'total_seats': seat_map.total_count,
+            'days': calendar
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @api.route('/seats/<int:seat_id>/reserve', methods=['POST'])
 def reserve_seat(seat_id):
     try:
@@ -102,14 +184,14 @@ def reserve_seat(seat_id):
         
         if not user or not seat:
             return jsonify({'message': 'Not found'}), 404
-        if seat.is_reserved:
-            return jsonify({'message': 'Already reserved'}), 400
-        if seat.is_women_seat and user.gender != 'female':
-            return jsonify({'message': 'Women-only seat'}), 400
         
-        seat.is_reserved = True
-        seat.reserved_by_user_id = user.id
+        # Checked and set by one conditional UPDATE; concurrent requests cannot both win
+        change, error = SeatOperations.reserve(seat, user.id, allow_women_seat=(user.gender == 'female'))
+        if error:
+            db.session.rollback()
+            return jsonify({'message': error}), 400
         db.session.commit()
+        seat_maps.apply(*change)
         return jsonify({'message': 'Reserved successfully'}), 200
     except Exception as e:
         db.session.rollback()
@@ -129,10 +211,13 @@ def get_wallet(user_id):
 
 @api.route('/statistics/dashboard', methods=['GET'])
 def get_statistics():
-    confirmed = Seat.query.filter_by(is_reserved=True).count()
+    confirmed = db.session.query(
+        db.func.count(Booking.id),
+        db.func.coalesce(db.func.sum(Booking.final_price), 0)
+    ).filter(Booking.status == 'confirmed').one()
     return jsonify({
         'total_users': User.query.count(),
         'total_buses': Bus.query.count(),
-        'total_bookings': confirmed,
-        'total_revenue': confirmed * 250
+        'total_bookings': confirmed[0],
+        'total_revenue': confirmed[1]
     }), 200
@@ -0,0 +1,201 @@
+"""
+Seat Holds
+Short-lived seat leases for unpaid bookings, expired in batches by a timer-wheel reaper
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+
+class SeatHoldManager:
+    """Seat holds of this process: a conflict map plus a timer wheel of expiries
+
+    A hold is a pending booking whose seat is taken in the travel date's
+    inventory, mirrored in the database as bookings.hold_expires_at.
+    Verifying the payment clears the expiry and the booking keeps the seat.
+
+    In memory, `_seats` maps (bus_id, travel_date, seat_number) ->
+    (user_id, expires_at) so a conflicting hold is rejected with one dict
+    lookup, and the wheel has one bucket of booking ids per tick covering
+    the TTL. Each tick the reaper empties the buckets that came due and
+    releases the still-expired bookings and their seats in one batch.
+    Holds this process does not know about (other workers, or before a
+    restart) are released by a sweep of the bookings table every `sweep_s`.
+
+    `clock` returns epoch seconds (default time.time). Hold expiries, the
+    wheel and the releases asked of the database all follow it.
+    """
+
+    # Most bookings released in one transaction
+    BATCH_SIZE = 500
+
+    def __init__(self, ttl_s=600, tick_s=1, sweep_s=60, clock=time.time):
+        self.ttl_s = ttl_s
+        self.tick_s = tick_s
+        self.sweep_s = sweep_s
+        self.clock = clock
+
+        self._app = None
+        self._holds = {}
+        self._seats = {}
+        self._wheel = []
+        self._cursor = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.stats = {'held': 0, 'confirmed': 0, 'released': 0, 'expired': 0, 'conflicts': 0, 'sweeps': 0, 'errors': 0}
+
+    def init_app(self, app, start=True):
+        """Read SEAT_HOLD_* and start the reaper (unless start is False)"""
+        self._app = app
+        self.ttl_s = app.config.get('SEAT_HOLD_TTL_S', self.ttl_s)
+        self.tick_s = app.config.get('SEAT_HOLD_TICK_S', self.tick_s)
+        self.sweep_s = app.config.get('SEAT_HOLD_SWEEP_S', self.sweep_s)
+
+        # One revolution spans the TTL, so a new hold never lands in a bucket that is due sooner
+        self._wheel = [{} for _ in range(int(self.ttl_s / self.tick_s) + 2)]
+        self._cursor = self._tick(self.clock())
+        if start and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='seat-hold-reaper', daemon=True)
+            self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    # ========== HOLDS ==========
+
+    def now(self):
+        """Current time by this manager's clock, as naive UTC"""
+        return datetime.utcfromtimestamp(self.clock())
+
+    def expires_at(self):
+        """Expiry for a hold taken now"""
+        return self.now() + timedelta(seconds=self.ttl_s)
+
+    def conflicts(self, seat_key, user_id):
+        """True if another user holds the seat (bus_id, travel_date, seat_number) in this process"""
+        hold = self._seats.get(seat_key)
+        if hold is not None and hold[0] != user_id and hold[1] > self.now():
+            self.stats['conflicts'] += 1
+            return True
+        return False
+
+    def track(self, holds, expires_at):
+        """Remember committed holds, given as (booking_id, user_id, seat_key), so the reaper releases them on time"""
+        if not self._wheel:
+            return
+        due = expires_at.timestamp() if expires_at.tzinfo else (expires_at - datetime(1970, 1, 1)).total_seconds()
+        with self._lock:
+            bucket = self._wheel[self._slot(max(self._tick(due), self._cursor))]
+            for booking_id, user_id, seat_key in holds:
+                self._holds[booking_id] = (seat_key, expires_at)
+                self._seats[seat_key] = (user_id, expires_at)
+                bucket[booking_id] = expires_at
+        self.stats['held'] += len(holds)
+
+    def forget(self, booking_ids, confirmed=False):
+        """Drop holds that were paid for or released"""
+        with self._lock:
+            for booking_id in booking_ids:
+                hold = self._holds.pop(booking_id, None)
+                if hold is not None:
+                    self._seats.pop(hold[0], None)
+        if confirmed:
+            self.stats['confirmed'] += len(booking_ids)
+
+    def clear(self):
+        """Forget every hold and restart the wheel at the clock's current time"""
+        with self._lock:
+            self._holds.clear()
+            self._seats.clear()
+            for bucket in self._wheel:
+                bucket.clear()
+            self._cursor = self._tick(self.clock())
+
+    def snapshot(self):
+        stats = dict(self.stats)
+        stats['active'] = len(self._holds)
+        stats['ttl_s'] = self.ttl_s
+        return stats
+
+    # ========== REAPER ==========
+
+    def reap(self):
+        """Release the holds on the wheel that have expired; returns how many bookings were released"""
+        due = self._due()
+        return sum(self._release(due[start:start + self.BATCH_SIZE]) for start in range(0, len(due), self.BATCH_SIZE))
+
+    def sweep(self):
+        """Release expired holds found in the bookings table; returns how many bookings were released"""
+        self.stats['sweeps'] += 1
+        released = batch = self._release(None)
+        while batch == self.BATCH_SIZE:
+            batch = self._release(None)
+            released += batch
+        return released
+
+    def _tick(self, ts):
+        return int(ts // self.tick_s) + 1
+
+    def _slot(self, tick):
+        return tick % len(self._wheel)
+
+    def _due(self):
+        """Booking ids from every bucket up to now whose holds have expired"""
+        now_tick = self._tick(self.clock())
+        now = self.now()
+        due = []
+        with self._lock:
+            # After a stall, one revolution already covers every bucket
+            self._cursor = max(self._cursor, now_tick - len(self._wheel) + 1)
+            while self._cursor <= now_tick:
+                bucket = self._wheel[self._slot(self._cursor)]
+                self._cursor += 1
+                for booking_id, expires_at in list(bucket.items()):
+                    del bucket[booking_id]
+                    if booking_id not in self._holds:
+                        continue  # paid or released since
+                    if expires_at <= now:
+                        due.append(booking_id)
+                    else:
+                        self._wheel[self._slot(now_tick + 1)][booking_id] = expires_at
+        return due
+
+    def _run(self):
+        next_sweep = 0.0
+        while not self._stop.wait(self.tick_s):
+            self.reap()
+            if time.monotonic() >= next_sweep:
+                self.sweep()
+                next_sweep = time.monotonic() + self.sweep_s
+
+    def _release(self, booking_ids):
+        """Release expired holds (the given bookings, or any in the table); returns how many"""
+        from database_operations import BookingOperations
+        try:
+            with self._app.app_context():
+                result, error = BookingOperations.release_expired_holds(
+                    booking_ids, limit=self.BATCH_SIZE, now=self.now()
+                )
+        except Exception:
+            error = True
+        if error:
+            self.stats['errors'] += 1
+            return 0
+
+        if booking_ids is not None:
+            # Whatever was not released here was paid for or already gone
+            self.forget(booking_ids)
+        else:
+            self.forget(result['booking_ids'])
+        self.stats['released'] += result['seats']
+        self.stats['expired'] += len(result['booking_ids'])
+        return len(result['booking_ids'])
+
+
+# Shared hold manager instance (configured by init_app in app.py)
+seat_holds = SeatHoldManager()
@@ -0,0 +1,178 @@
+"""
+Seat Maps
+Per-bus seat state held in memory as bitsets, so availability and seat maps need no Seat rows
+"""
+
+import threading
+
+
+def _popcount(mask):
+    return bin(mask).count('1')
+
+
+def mask_to_bytes(mask):
+    """Bitset as little-endian bytes (seat 1 is the lowest bit of the first byte)"""
+    return mask.to_bytes((mask.bit_length() + 7) // 8, 'little')
+
+
+def mask_from_bytes(data):
+    return int.from_bytes(data or b'', 'little')
+
+
+class SeatMap:
+    """Seat state of one bus as bitsets over seat numbers (bit n - 1 is seat n)
+
+    `present` marks the seat numbers that exist; `reserved`, `women` and
+    `accessible` mark the seats with that flag. `version` is the bus's
+    seat_version the map reflects. Methods taking `taken` also treat the
+    seats of a travel date's inventory bitset as reserved.
+    """
+
+    __slots__ = ('bus_id', 'version', 'seat_ids', 'present', 'reserved', 'women', 'accessible')
+
+    def __init__(self, bus_id, version, rows):
+        """rows: (seat_id, seat_number, is_reserved, is_women_seat, is_accessible)"""
+        self.bus_id = bus_id
+        self.version = version
+        self.seat_ids = {}
+        self.present = self.reserved = self.women = self.accessible = 0
+        for seat_id, seat_number, is_reserved, is_women_seat, is_accessible in rows:
+            bit = 1 << (seat_number - 1)
+            self.seat_ids[seat_number] = seat_id
+            self.present |= bit
+            if is_reserved:
+                self.reserved |= bit
+            if is_women_seat:
+                self.women |= bit
+            if is_accessible:
+                self.accessible |= bit
+
+    @property
+    def total_count(self):
+        return _popcount(self.present)
+
+    @property
+    def reserved_count(self):
+        return self.count_reserved()
+
+    @property
+    def available_count(self):
+        return self.count_available()
+
+    def count_reserved(self, taken=0):
+        return _popcount((self.reserved | taken) & self.present)
+
+    def count_available(self, taken=0):
+        return _popcount(self.present & ~(self.reserved | taken))
+
+    def mask_of(self, seat_numbers):
+        """Bitset of the given seat numbers"""
+        mask = 0
+        for number in seat_numbers:
+            mask |= 1 << (number - 1)
+        return mask
+
+    def available_mask(self, women_allowed=True, taken=0):
+        """Bitset of free seats, leaving out women-only seats unless allowed"""
+        mask = self.present & ~(self.reserved | taken)
+        return mask if women_allowed else mask & ~self.women
+
+    def find_adjacent(self, count, women_allowed=True, taken=0):
+        """Seat numbers of the first run of `count` consecutive free seats, or None"""
+        if count < 1:
+            return None
+        free = self.available_mask(women_allowed, taken)
+        # Bit n survives only if seats n + 1 .. n + count are all free
+        run = free
+        for shift in range(1, count):
+            run &= free >> shift
+        if not run:
+            return None
+        first = (run & -run).bit_length()
+        return list(range(first, first + count))
+
+    def is_reserved(self, seat_number):
+        return bool(self.reserved >> (seat_number - 1) & 1)
+
+    def seats(self, taken=0):
+        """Seat map in seat-number order"""
+        reserved = self.reserved | taken
+        return [{
+            'seat_id': self.seat_ids[number],
+            'seat_number': number,
+            'is_reserved': bool(reserved >> (number - 1) & 1),
+            'is_women_seat': bool(self.women >> (number - 1) & 1),
+            'is_accessible': bool(self.accessible >> (number - 1) & 1)
+        } for number in sorted(self.seat_ids)]
+
+
+class SeatMapStore:
+    """Seat maps of all buses, validated against each bus's seat_version
+
+    Every change to a bus's seats bumps buses.seat_version in the same
+    transaction. A cached map is used only while its version matches the
+    bus row the caller already loaded, so maps stay correct across worker
+    processes without extra queries. Changes made by this process are
+    applied in place after their commit instead of reloading.
+    """
+
+    def __init__(self):
+        self._maps = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self, bus_id=None):
+        with self._lock:
+            if bus_id is None:
+                self._maps = {}
+            else:
+                self._maps.pop(bus_id, None)
+
+    def get(self, bus_id, version=None):
+        """Seat map of a bus, reloaded when it does not match `version` (None: any cached map)"""
+        return self.get_many({bus_id: version})[bus_id]
+
+    def get_many(self, versions):
+        """Seat maps for {bus_id: seat_version}, loading every stale one with a single query"""
+        maps = {}
+        stale = []
+        for bus_id, version in versions.items():
+            current = self._maps.get(bus_id)
+            if current is not None and (version is None or current.version == (version or 0)):
+                maps[bus_id] = current
+            else:
+                stale.append(bus_id)
+        if stale:
+            maps.update(self._load(stale, versions))
+        return maps
+
+    def get_for_buses(self, buses):
+        """Seat maps keyed by bus id for already-loaded Bus rows"""
+        return self.get_many({bus.id: bus.seat_version or 0 for bus in buses})
+
+    def _load(self, bus_ids, versions):
+        from database_operations import BusOperations
+        rows, loaded_versions = BusOperations.get_seat_states(bus_ids)
+        by_bus = {bus_id: [] for bus_id in bus_ids}
+        for row in rows:
+            by_bus[row[0]].append(row[1:])
+
+        maps = {}
+        with self._lock:
+            for bus_id, seat_rows in by_bus.items():
+                version = loaded_versions.get(bus_id, versions.get(bus_id) or 0)
+                maps[bus_id] = self._maps[bus_id] = SeatMap(bus_id, version, seat_rows)
+        return maps
+
+    def apply(self, bus_id, seat_number, reserved):
+        """Record a committed reservation change made by this process"""
+        with self._lock:
+            current = self._maps.get(bus_id)
+            if current is None or seat_number not in current.seat_ids:
+                return
+            bit = 1 << (seat_number - 1)
+            current.reserved = current.reserved | bit if reserved else current.reserved & ~bit
+            current.version += 1
+
+
+# Shared store instance
+seat_maps = SeatMapStore()
@@ -0,0 +1,130 @@
+"""
+Bus Spatial Index
+Uniform lat/lng grid over current bus positions for radius and bounding-box queries
+"""
+
+import math
+import threading
+from geo_utils import haversine_one_to_many, radius_to_bbox
+
+
+class BusSpatialIndex:
+    """Grid index: cell -> set of bus ids, plus each bus's latest state
+
+    Updates move a bus between at most two cells, so maintaining the index
+    from the ingest path is O(1) per fix. Queries only visit the cells that
+    overlap the search area. With 0.05 degree cells (~5.5 km) a 1-2 km
+    radius query touches a handful of cells even for a 10k+ bus fleet.
+    """
+
+    def __init__(self, cell_deg=0.05):
+        self.cell_deg = cell_deg
+        self._cells = {}      # (row, col) -> set of bus ids
+        self._states = {}     # bus_id -> live state
+        self._bus_cell = {}   # bus_id -> (row, col)
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def init_app(self, app, broker):
+        """Read GPS_SPATIAL_CELL_DEG and follow every position the broker publishes"""
+        self.cell_deg = app.config.get('GPS_SPATIAL_CELL_DEG', self.cell_deg)
+        broker.add_listener(self.update_many)
+
+    def _cell(self, latitude, longitude):
+        return (math.floor(latitude / self.cell_deg), math.floor(longitude / self.cell_deg))
+
+    # ========== MAINTENANCE ==========
+
+    def update(self, state):
+        """Insert or move a bus using its live state"""
+        bus_id = state['bus_id']
+        cell = self._cell(state['latitude'], state['longitude'])
+        with self._lock:
+            current = self._states.get(bus_id)
+            if current is not None and current.get('ts', 0) > state.get('ts', 0):
+                return
+            old_cell = self._bus_cell.get(bus_id)
+            if old_cell != cell:
+                if old_cell is not None:
+                    members = self._cells[old_cell]
+                    members.discard(bus_id)
+                    if not members:
+                        del self._cells[old_cell]
+                self._cells.setdefault(cell, set()).add(bus_id)
+                self._bus_cell[bus_id] = cell
+            self._states[bus_id] = state
+
+    def update_many(self, states):
+        for state in states:
+            self.update(state)
+
+    def remove(self, bus_id):
+        with self._lock:
+            cell = self._bus_cell.pop(bus_id, None)
+            self._states.pop(bus_id, None)
+            if cell is not None:
+                members = self._cells.get(cell)
+                if members is not None:
+                    members.discard(bus_id)
+                    if not members:
+                        del self._cells[cell]
+
+    def load(self, states):
+        """Bulk-load from a live-state snapshot (first use in a process)"""
+        self.update_many(states)
+        self.loaded = True
+
+    def __len__(self):
+        return len(self._states)
+
+    # ========== QUERIES ==========
+
+    def _candidates(self, min_lat, min_lng, max_lat, max_lng):
+        """States of buses in the cells overlapping a bbox"""
+        min_row, min_col = self._cell(min_lat, min_lng)
+        max_row, max_col = self._cell(max_lat, max_lng)
+        with self._lock:
+            if (max_row - min_row + 1) * (max_col - min_col + 1) > len(self._cells):
+                # Box covers more cells than are occupied: scan occupied cells
+                bus_ids = [
+                    bus_id for (row, col), members in self._cells.items()
+                    if min_row <= row <= max_row and min_col <= col <= max_col
+                    for bus_id in members
+                ]
+            else:
+                bus_ids = [
+                    bus_id
+                    for row in range(min_row, max_row + 1)
+                    for col in range(min_col, max_col + 1)
+                    for bus_id in self._cells.get((row, col), ())
+                ]
+            return [self._states[bus_id] for bus_id in bus_ids]
+
+    def within_bbox(self, min_lat, min_lng, max_lat, max_lng):
+        """Buses whose position lies inside the bbox"""
+        return [
+            state for state in self._candidates(min_lat, min_lng, max_lat, max_lng)
+            if min_lat <= state['latitude'] <= max_lat and min_lng <= state['longitude'] <= max_lng
+        ]
+
+    def within_radius(self, latitude, longitude, radius_km, limit=None):
+        """Buses within radius_km of a point, nearest first
+
+        Returns:
+            list: (distance_km, state) pairs"""
+        candidates = self._candidates(*radius_to_bbox(latitude, longitude, radius_km))
+        distances_km = haversine_one_to_many(
+            latitude, longitude,
+            [state['latitude'] for state in candidates],
+            [state['longitude'] for state in candidates]
+        ).tolist()
+        results = [
+            (distance_km, state) for distance_km, state in zip(distances_km, candidates)
+            if distance_km <= radius_km
+        ]
+        results.sort(key=lambda item: item[0])
+        return results[:limit] if limit else results
+
+
+# Shared index instance (fed by the position broker, see app.py)
+bus_spatial_index = BusSpatialIndex()
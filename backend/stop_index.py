@@ -0,0 +1,189 @@
+"""
+Next-Stop Index
+Per-bus route polylines through the stops, gridded for constant-time next-stop lookups
+"""
+
+import math
+import threading
+import numpy as np
+from geo_utils import calculate_distance, bearing_pairwise, haversine_pairwise, haversine_one_to_many, PolylineProjector
+
+# A segment whose direction differs from the heading by more than this is
+# being travelled the other way (or is another leg of a looping route)
+MAX_HEADING_DIFF_DEG = 100
+
+
+class RouteIndex:
+    """Polyline through one bus's stops with a grid of the segments near each cell
+
+    Every segment is registered in the cells along it and their neighbours,
+    so the cell containing a position lists the segments within about one
+    cell of it. A lookup projects the position onto those few segments only.
+    """
+
+    def __init__(self, bus_id, stops, cell_deg=0.01):
+        self.bus_id = bus_id
+        self.stops = stops
+        self.cell_deg = cell_deg
+        lats = [stop.latitude for stop in stops]
+        lngs = [stop.longitude for stop in stops]
+        self.lengths_km = haversine_pairwise(lats[:-1], lngs[:-1], lats[1:], lngs[1:]).tolist()
+        self.bearings = bearing_pairwise(lats[:-1], lngs[:-1], lats[1:], lngs[1:]).tolist()
+        self._projector = PolylineProjector(lats, lngs)
+        self.cells = {}
+        for index, (a, b) in enumerate(zip(stops, stops[1:])):
+            for cell in self._segment_cells(a, b):
+                self.cells.setdefault(cell, []).append(index)
+
+    def _cell(self, latitude, longitude):
+        return (math.floor(latitude / self.cell_deg), math.floor(longitude / self.cell_deg))
+
+    def _segment_cells(self, a, b):
+        """Cells along a segment (sampled every half cell) plus their neighbours"""
+        steps = max(1, int(max(abs(b.latitude - a.latitude), abs(b.longitude - a.longitude)) / (self.cell_deg / 2)))
+        cells = set()
+        for step in range(steps + 1):
+            row, col = self._cell(
+                a.latitude + (b.latitude - a.latitude) * step / steps,
+                a.longitude + (b.longitude - a.longitude) * step / steps
+            )
+            cells.update((row + dr, col + dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1))
+        return cells
+
+    def candidates(self, latitude, longitude):
+        return self.cells.get(self._cell(latitude, longitude), ())
+
+    def project(self, index, latitude, longitude):
+        """Position along segment `index` (0..1, unclamped) and distance off it in km"""
+        t, offsets = self._projector.project(latitude, longitude, slice(index, index + 1))
+        return float(t[0]), float(offsets[0])
+
+    def locate(self, latitude, longitude, heading=None):
+        """Best segment for a position: (index, t, offset_km) or None off the route"""
+        indexes = [
+            index for index in self.candidates(latitude, longitude)
+            if heading is None or _angle_diff(heading, self.bearings[index]) <= MAX_HEADING_DIFF_DEG
+        ]
+        if not indexes:
+            return None
+        t, offsets = self._projector.project(latitude, longitude, np.array(indexes))
+        best = int(np.argmin(offsets))
+        return indexes[best], float(t[best]), float(offsets[best])
+
+    def next_stop(self, latitude, longitude, heading=None):
+        """Next stop along the route from a position
+
+        Returns:
+            tuple: (stop_index, distance_km, segment_index, fraction_left) where
+            segment_index is None when the stop is not reached along a segment"""
+        if not self.stops:
+            return None
+        located = self.locate(latitude, longitude, heading)
+        if located is None and heading is not None:
+            located = self.locate(latitude, longitude)
+        if located is None:
+            # Off the gridded corridor: fall back to the nearest stop
+            distances = haversine_one_to_many(
+                latitude, longitude,
+                [stop.latitude for stop in self.stops], [stop.longitude for stop in self.stops]
+            ).tolist()
+            nearest = min(range(len(distances)), key=distances.__getitem__)
+            return nearest, distances[nearest], None, None
+
+        index, t, _ = located
+        if index == 0 and t < 0:
+            # Not yet at the first stop
+            stop = self.stops[0]
+            return 0, calculate_distance(latitude, longitude, stop.latitude, stop.longitude), None, None
+        fraction_left = 1.0 - min(1.0, max(0.0, t))
+        return index + 1, self.lengths_km[index] * fraction_left, index, fraction_left
+
+
+class StopIndex:
+    """Route indexes for every bus, built once and kept until a route changes
+
+    Lookups run entirely in memory. The database is read only to build an
+    index, i.e. on first use of a bus and after invalidate().
+    """
+
+    def __init__(self, cell_deg=0.01):
+        self.cell_deg = cell_deg
+        self._routes = {}        # bus_id -> RouteIndex
+        self._global = None      # cell -> [(bus_id, segment index)] over all routes
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.cell_deg = app.config.get('STOP_INDEX_CELL_DEG', self.cell_deg)
+
+    def invalidate(self, bus_id=None):
+        """Forget a bus's route (or all routes), e.g. after its stops were rewritten"""
+        with self._lock:
+            if bus_id is None:
+                self._routes = {}
+            else:
+                self._routes.pop(bus_id, None)
+            self._global = None
+
+    def _build(self, bus_id, rows):
+        from eta_engine import CachedStop
+        stops = [
+            CachedStop(row.id, row.stop_order, row.stop_name, row.latitude, row.longitude, bool(row.is_completed))
+            for row in rows
+        ]
+        return RouteIndex(bus_id, stops, self.cell_deg)
+
+    def route(self, bus_id):
+        """Route index of a bus, built from its stops on first use"""
+        route = self._routes.get(bus_id)
+        if route is None:
+            from database_operations import ETAOperations
+            rows, error = ETAOperations.get_route_stops(bus_id)
+            if error:
+                return None
+            route = self._build(bus_id, rows)
+            with self._lock:
+                self._routes[bus_id] = route
+        return route
+
+    def _global_cells(self):
+        """Segments of all routes by cell, for lookups without a bus id"""
+        cells = self._global
+        if cells is None:
+            from database_operations import ETAOperations
+            stops_by_bus, error = ETAOperations.get_all_route_stops()
+            if error:
+                return {}
+            cells = {}
+            for bus_id, rows in stops_by_bus.items():
+                route = self._routes.get(bus_id) or self._build(bus_id, rows)
+                with self._lock:
+                    self._routes.setdefault(bus_id, route)
+                for cell, indexes in route.cells.items():
+                    cells.setdefault(cell, []).extend((bus_id, index) for index in indexes)
+            self._global = cells
+        return cells
+
+    def nearest_route(self, latitude, longitude, heading=None):
+        """Bus whose route passes closest to a position (heading-compatible if given)"""
+        cells = self._global_cells()
+        row = math.floor(latitude / self.cell_deg)
+        col = math.floor(longitude / self.cell_deg)
+        best = None
+        for bus_id, index in cells.get((row, col), ()):
+            route = self._routes.get(bus_id)
+            if route is None:
+                continue
+            if heading is not None and _angle_diff(heading, route.bearings[index]) > MAX_HEADING_DIFF_DEG:
+                continue
+            _, offset_km = route.project(index, latitude, longitude)
+            if best is None or offset_km < best[0]:
+                best = (offset_km, bus_id)
+        return best[1] if best else None
+
+
+def _angle_diff(a, b):
+    return abs((a - b + 180) % 360 - 180)
+
+
+# Shared index instance (configured by init_app in app.py)
+stop_index = StopIndex()
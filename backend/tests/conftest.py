@@ -0,0 +1,127 @@
+"""
+Test fixtures: the Flask app on a throwaway SQLite database, reset before each test
+
+Usage (from backend/): python -m pytest -q tests
+"""
+
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Must be set before app.py loads .env and reads its config
+_DB_DIR = tempfile.mkdtemp(prefix='smart-bus-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_DB_DIR, 'test.db')
+os.environ['GPS_UDP_ENABLED'] = 'False'
+os.environ['GPS_PIPELINE_WORKERS'] = '0'
+os.environ['GPS_ARCHIVE_ENABLED'] = 'False'
+
+from app import app as flask_app  # noqa: E402
+from database import db, User, Wallet, Seat  # noqa: E402
+from database_operations import BusOperations  # noqa: E402
+from seat_map import seat_maps  # noqa: E402
+from seat_holds import seat_holds  # noqa: E402
+from live_state import live_state  # noqa: E402
+from gps_filter import gps_filter  # noqa: E402
+from map_matching import route_matcher  # noqa: E402
+from stop_index import stop_index  # noqa: E402
+from eta_engine import eta_engine  # noqa: E402
+from geofence import geofence_engine  # noqa: E402
+from arrival_detector import arrival_detector  # noqa: E402
+
+# Tests drive expiry themselves; a background reaper would race them
+seat_holds.close()
+
+# A travel date every booking test uses unless it needs another one
+TRAVEL_DATE = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=7)
+
+
+@pytest.fixture
+def app():
+    with flask_app.app_context():
+        db.drop_all()
+        db.create_all()
+        seat_maps.invalidate()
+        live_state.init_app(flask_app)
+        # Bus ids restart at 1 with every database: drop per-bus caches
+        gps_filter.reset()
+        for cache in (route_matcher, stop_index, eta_engine, geofence_engine, arrival_detector):
+            cache.invalidate()
+        eta_engine.reload()
+        seat_holds.clear()
+        yield flask_app
+        db.session.remove()
+
+
+class FakeClock:
+    """Stand-in for time.time that a test moves forward by hand"""
+
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(app, monkeypatch):
+    """Drive the shared seat hold manager's clock by hand"""
+    fake = FakeClock()
+    monkeypatch.setattr(seat_holds, 'clock', fake)
+    seat_holds.clear()
+    return fake
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(app):
+    """Create a user with a wallet; returns its id"""
+    counter = iter(range(1, 1000))
+
+    def make(gender='male', balance=1000):
+        number = next(counter)
+        user = User(
+            name=f'User {number}',
+            email=f'user{number}@example.com',
+            phone=f'90000000{number:02d}',
+            gender=gender,
+            password='password123',
+            account_type='passenger'
+        )
+        db.session.add(user)
+        db.session.commit()
+        db.session.add(Wallet(user_id=user.id, balance=balance))
+        db.session.commit()
+        return user.id
+    return make
+
+
+@pytest.fixture
+def bus(app):
+    """A 10-seat bus (seats 1-2 women-only); returns its id"""
+    created, error = BusOperations.create_bus(
+        'DL01TEST', 'Test Driver', '9999999999', 'Delhi - Jaipur',
+        total_seats=10, start_point='Delhi', end_point='Jaipur'
+    )
+    assert error is None
+    return created.id
+
+
+@pytest.fixture
+def seat_id(app):
+    """Seat id of a bus's seat number"""
+    def lookup(bus_id, seat_number):
+        return Seat.query.filter_by(bus_id=bus_id, seat_number=seat_number).one().id
+    return lookup
@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta
+
+from arrival_detector import ArrivalDetector
+from database import db, RouteStop
+
+STOPS = [('S1', 28.6, 77.20), ('S2', 28.6, 77.21), ('S3', 28.6, 77.22)]
+START = datetime(2026, 1, 5, 8, 0, 0)
+BETWEEN = 77.205
+
+
+def _add_stops(client, bus):
+    client.post(f'/api/gps/buses/{bus}/route-stops', json={'stops': [
+        {'stop_name': name, 'latitude': lat, 'longitude': lng} for name, lat, lng in STOPS
+    ]})
+
+
+def _fixes(bus, track, start=START):
+    return [{'bus_id': bus, 'latitude': 28.6, 'longitude': lng, 'timestamp': start + timedelta(seconds=seconds)}
+            for seconds, lng in track]
+
+
+def _stops(bus):
+    db.session.expire_all()
+    return [(stop.actual_arrival, stop.actual_departure, stop.is_completed)
+            for stop in RouteStop.query.filter_by(bus_id=bus).order_by(RouteStop.stop_order)]
+
+
+def _at(seconds, start=START):
+    return start + timedelta(seconds=seconds)
+
+
+def test_dwell_and_drive_through(client, bus):
+    _add_stops(client, bus)
+    detector = ArrivalDetector(radius_km=0.05, dwell_seconds=20)
+    # Dwell at S1, drive through S2 in one fix, dwell at S3
+    track = [(0, 77.20), (10, 77.20), (25, 77.20), (40, BETWEEN), (60, 77.21), (70, 77.215), (100, 77.22), (130, 77.22)]
+
+    events = detector.process(_fixes(bus, track))
+    assert [(event['type'], event['stop_order'], event['at'], event['starts_trip']) for event in events] == [
+        ('arrival', 1, _at(0), True), ('departure', 1, _at(25), False),
+        ('arrival', 2, _at(60), False), ('departure', 2, _at(60), False),
+        ('arrival', 3, _at(100), False)
+    ]
+    assert _stops(bus) == [(_at(0), _at(25), True), (_at(60), _at(60), True), (_at(100), None, True)]
+
+
+def test_a_short_stop_inside_the_radius_is_not_an_arrival_until_exit(client, bus):
+    _add_stops(client, bus)
+    detector = ArrivalDetector(radius_km=0.05, dwell_seconds=20)
+    assert detector.process(_fixes(bus, [(0, 77.21), (10, 77.21)])) == []
+    assert [event['type'] for event in detector.process(_fixes(bus, [(30, BETWEEN)]))] == ['arrival', 'departure']
+
+
+def test_new_trip_reopens_stops_and_replays_do_not_rewind(client, bus):
+    _add_stops(client, bus)
+    first_trip = [(0, 77.20), (25, 77.20), (40, BETWEEN), (60, 77.21), (90, 77.21), (100, 77.215)]
+    ArrivalDetector().process(_fixes(bus, first_trip))
+
+    second_start = START + timedelta(hours=1)
+    ArrivalDetector().process(_fixes(bus, [(0, 77.20), (25, 77.20)], start=second_start))
+    assert _stops(bus) == [(_at(0, second_start), None, True), (_at(60), _at(90), False), (None, None, False)]
+
+    # The first trip's events replayed (e.g. by another worker) leave the new trip alone
+    ArrivalDetector().process(_fixes(bus, first_trip))
+    assert _stops(bus)[0] == (_at(0, second_start), None, True)
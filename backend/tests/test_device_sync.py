@@ -0,0 +1,85 @@
+import base64
+import gzip
+import json
+from datetime import datetime, timedelta
+
+from database import GPSTracker
+from database_operations import BusOperations
+from live_state import live_state
+
+START = datetime.utcnow().replace(microsecond=0) - timedelta(hours=1)
+
+
+def _fixes(count, start_second=0, latitude=28.6):
+    return [{'latitude': latitude + 0.001 * i, 'longitude': 77.2,
+             'timestamp': (START + timedelta(seconds=start_second + i)).isoformat()} for i in range(count)]
+
+
+def _payload(fixes):
+    return base64.b64encode(gzip.compress(json.dumps(fixes).encode())).decode()
+
+
+def _sync(client, bus, first_seq, fixes, device='dev-1', **body):
+    body = dict({'bus_id': bus, 'first_seq': first_seq, 'last_seq': first_seq + len(fixes) - 1,
+                 'payload': _payload(fixes)}, **body)
+    return client.post(f'/api/gps/devices/{device}/sync', json=body)
+
+
+def test_replayed_upload_is_stored_once(client, bus):
+    fixes = _fixes(3)
+    report = _sync(client, bus, 1, fixes).json
+    assert (report['acked_seq'], report['inserted'], report['duplicates']) == (3, 3, 0)
+
+    # The ack was lost: the device sends the same batch plus one new fix
+    report = _sync(client, bus, 1, fixes + _fixes(1, start_second=3)).json
+    assert (report['acked_seq'], report['inserted'], report['duplicates']) == (4, 1, 3)
+    assert GPSTracker.query.filter_by(bus_id=bus).count() == 4
+
+
+def test_ack_waits_for_the_gap_to_fill(client, bus):
+    _sync(client, bus, 1, _fixes(2))
+    report = _sync(client, bus, 5, _fixes(2, start_second=4)).json
+    assert (report['acked_seq'], report['inserted']) == (2, 2)
+    state = client.get('/api/gps/devices/dev-1/sync').json
+    assert (state['acked_seq'], state['received_seqs'], state['bus_id']) == (2, [5, 6], bus)
+
+    report = _sync(client, bus, 3, _fixes(2, start_second=2)).json
+    assert report['acked_seq'] == 6
+    assert client.get('/api/gps/devices/dev-1/sync').json['received_seqs'] == []
+    assert client.get('/api/gps/devices/new-device/sync').json['acked_seq'] == 0
+
+
+def test_invalid_fixes_are_acknowledged_not_stored(client, bus):
+    fixes = _fixes(2)
+    fixes.insert(1, {'latitude': 95, 'longitude': 77.2, 'timestamp': START.isoformat()})
+    report = _sync(client, bus, 1, fixes).json
+    assert (report['acked_seq'], report['inserted']) == (3, 2)
+    assert [rejection['seq'] for rejection in report['rejected']] == [2]
+
+    # Inline fixes with their own sequence numbers
+    report = client.post('/api/gps/devices/dev-1/sync', json={
+        'bus_id': bus, 'first_seq': 4, 'last_seq': 10, 'fixes': [dict(_fixes(1, start_second=9)[0], seq=10)]
+    }).json
+    assert (report['acked_seq'], report['inserted']) == (3, 1)
+
+
+def test_sync_rejections(client, bus):
+    other, _ = BusOperations.create_bus(
+        'DL02TEST', 'Other Driver', '9999999998', 'Delhi - Agra',
+        total_seats=10, start_point='Delhi', end_point='Agra'
+    )
+    _sync(client, bus, 1, _fixes(1))
+
+    assert _sync(client, other.id, 2, _fixes(1)).status_code == 409
+    assert _sync(client, 9999, 1, _fixes(1), device='dev-2').status_code == 404
+    assert _sync(client, bus, 1, _fixes(1), payload='not base64!').status_code == 400
+    assert _sync(client, bus, 1, _fixes(2), last_seq=1).status_code == 400
+    assert _sync(client, bus, 0, _fixes(1)).status_code == 400
+
+
+def test_backlog_does_not_rewind_the_live_position(client, bus):
+    client.post(f'/api/gps/buses/{bus}/location', json={
+        'latitude': 28.9, 'longitude': 77.2, 'timestamp': datetime.utcnow().isoformat()
+    })
+    _sync(client, bus, 1, _fixes(3))
+    assert live_state.get(bus)['latitude'] == 28.9
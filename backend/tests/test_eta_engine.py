@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import db, RouteStop, SegmentTravelTime
+from database_operations import GPSOperations
+from eta_engine import CachedStop, ETAEngine, detect_stop_visits, segment_key
+from live_state import EPOCH
+
+# Three stops about 1.95 km apart along one street
+STOPS = [('S1', 28.6, 77.20), ('S2', 28.6, 77.22), ('S3', 28.6, 77.24)]
+TRIP = datetime(2026, 1, 5, 8, 0, 0)
+
+
+def _add_stops(client, bus):
+    client.post(f'/api/gps/buses/{bus}/route-stops', json={'stops': [
+        {'stop_name': name, 'latitude': lat, 'longitude': lng} for name, lat, lng in STOPS
+    ]})
+
+
+def _drive(bus, start, minutes):
+    """Fixes every minute from S1 to S2 at a steady speed"""
+    GPSOperations.log_gps_batch([
+        {'bus_id': bus, 'latitude': 28.6, 'longitude': 77.20 + 0.02 * step / minutes,
+         'timestamp': start + timedelta(minutes=step)}
+        for step in range(minutes + 1)
+    ])
+
+
+def test_detect_stop_visits_collapses_repeats():
+    stops = [CachedStop(order, order, name, lat, lng, False) for order, (name, lat, lng) in enumerate(STOPS, 1)]
+    fixes = [(TRIP, 28.6, 77.20), (TRIP + timedelta(seconds=10), 28.6, 77.2001),
+             (TRIP + timedelta(minutes=2), 28.6, 77.21), (TRIP + timedelta(minutes=4), 28.6, 77.22)]
+    assert detect_stop_visits(stops, fixes, radius_km=0.075) == [(0, TRIP), (1, TRIP + timedelta(minutes=4))]
+    assert detect_stop_visits(stops, [], radius_km=0.075) == []
+
+
+def test_refresh_learns_segment_times_once(client, bus):
+    _add_stops(client, bus)
+    _drive(bus, TRIP, 4)
+    engine = ETAEngine()
+    key = segment_key(*(CachedStop(0, 0, name, lat, lng, False) for name, lat, lng in STOPS[:2]))
+
+    assert engine.refresh(now=TRIP + timedelta(hours=1)) == (1, None)
+    assert engine.segment_seconds(key, 1.95, at=TRIP) == (240, 'historical')
+    # The watermark keeps the same trip from being counted again
+    assert engine.refresh(now=TRIP + timedelta(hours=1)) == (0, None)
+
+    # A second, slower trip the next day is averaged in
+    _drive(bus, TRIP + timedelta(days=1), 6)
+    assert engine.refresh(now=TRIP + timedelta(days=1, hours=1)) == (1, None)
+    row = SegmentTravelTime.query.filter_by(segment_key=key, hour=8).one()
+    assert (row.mean_seconds, row.samples) == (300, 2)
+    assert engine.segment_seconds(key, 1.95, at=TRIP.replace(hour=9))[1] == 'fallback'
+
+
+def test_predict_scales_the_current_segment(client, bus):
+    _add_stops(client, bus)
+    _drive(bus, TRIP, 4)
+    RouteStop.query.filter_by(bus_id=bus, stop_order=1).one().is_completed = True
+    db.session.commit()
+    engine = ETAEngine(fallback_speed_kmh=60)
+    engine.refresh(now=TRIP + timedelta(hours=1))
+
+    # Halfway to S2 at 08:00: half the learned 4 minutes, then S3 at the fallback speed
+    position = {'latitude': 28.6, 'longitude': 77.21, 'ts': (TRIP - EPOCH).total_seconds()}
+    predictions = engine.predict(bus, position)
+    assert [(p['stop_name'], p['eta_minutes'], p['source']) for p in predictions] == [
+        ('S2', 2, 'historical'), ('S3', 4, 'fallback')
+    ]
+    assert predictions[1]['distance_km'] == pytest.approx(2.93, abs=0.01)
+    # Cached until a newer fix arrives
+    assert engine.predict(bus, position) is predictions
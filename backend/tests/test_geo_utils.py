@@ -0,0 +1,25 @@
+import pytest
+
+from geo_utils import (
+    calculate_distance, calculate_bearing, bearing_one_to_many, bearing_pairwise, estimate_arrival_times
+)
+
+ORIGIN = (28.6139, 77.2090)
+LATS = [28.70, 28.50, 28.61, 28.62]
+LNGS = [77.10, 77.30, 77.40, 77.20]
+
+
+def test_bearing_kernels_match_the_scalar_helper():
+    expected = [calculate_bearing(*ORIGIN, lat, lng) for lat, lng in zip(LATS, LNGS)]
+    assert bearing_one_to_many(*ORIGIN, LATS, LNGS).tolist() == pytest.approx(expected)
+
+    pairwise = [calculate_bearing(LATS[i], LNGS[i], LATS[i + 1], LNGS[i + 1]) for i in range(3)]
+    assert bearing_pairwise(LATS[:-1], LNGS[:-1], LATS[1:], LNGS[1:]).tolist() == pytest.approx(pairwise)
+
+
+def test_arrival_times_are_distance_over_speed():
+    distances, minutes = estimate_arrival_times(*ORIGIN, LATS, LNGS, speed_kmh=30)
+    expected = [calculate_distance(*ORIGIN, lat, lng) for lat, lng in zip(LATS, LNGS)]
+    assert distances.tolist() == pytest.approx(expected)
+    assert minutes.tolist() == pytest.approx([km / 30 * 60 for km in expected])
+    assert estimate_arrival_times(*ORIGIN, LATS, LNGS, speed_kmh=0)[1] is None
@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta
+
+from database import db, Announcement, Notification, WakeUpAlert
+from geofence import GeofenceEngine
+
+STOP = (28.6, 77.2)
+START = datetime(2026, 1, 5, 8, 0, 0)
+
+
+def _fences(bus, user):
+    alert = WakeUpAlert(user_id=user, bus_id=bus, stop_name='Sarai', stop_lat=STOP[0], stop_lng=STOP[1],
+                        alert_before_time=120)
+    announcement = Announcement(bus_id=bus, stop_name='Sarai', stop_lat=STOP[0], stop_lng=STOP[1],
+                                announcement_text='Next stop Sarai', time_before_arrival=120)
+    db.session.add_all([alert, announcement])
+    db.session.commit()
+    return alert.id, announcement.id
+
+
+def _fix(bus, index, latitude, longitude=STOP[1], speed=30):
+    return {'bus_id': bus, 'latitude': latitude, 'longitude': longitude, 'speed': speed,
+            'timestamp': START + timedelta(seconds=30 * index)}
+
+
+def _stages(fired):
+    return [(transition['kind'], transition['stage']) for transition in fired]
+
+
+def test_before_and_after_fire_once_each(bus, make_user):
+    user = make_user()
+    alert_id, announcement_id = _fences(bus, user)
+    engine = GeofenceEngine()
+
+    # Southbound at 30 km/h: 3.3 km, 1.3 km (160 s), 0.9 km (107 s), 0.4 km, at the stop, past it
+    fired = [_stages(engine.process([_fix(bus, index, STOP[0] - offset)]))
+             for index, offset in enumerate((0.03, 0.012, 0.008, 0.004, 0.0005, -0.003))]
+    assert fired == [[], [], [('wakeup', 'before'), ('announcement', 'before')], [],
+                     [('wakeup', 'after'), ('announcement', 'after')], []]
+
+    db.session.expire_all()
+    alert = db.session.get(WakeUpAlert, alert_id)
+    assert (alert.alert_sent_before, alert.alert_sent_after, alert.is_active) == (True, True, False)
+    assert db.session.get(Announcement, announcement_id).status == 'completed'
+    assert [n.message for n in Notification.query.filter_by(user_id=user).order_by(Notification.id)] == [
+        'Your bus is about 2 min from Sarai', 'Your bus has reached Sarai'
+    ]
+
+    # A fresh engine finds nothing left to fire
+    assert GeofenceEngine().process([_fix(bus, 7, *STOP)]) == []
+
+
+def test_after_fires_when_the_bus_passes_close_by(bus, make_user):
+    _fences(bus, make_user())
+    engine = GeofenceEngine()
+    # Along a street 200 m north of the stop: never within the 100 m radius
+    track = [(28.6018, 77.19), (28.6018, 77.2), (28.6018, 77.204)]
+    fired = [_stages(engine.process([_fix(bus, index, lat, lng, speed=40)])) for index, (lat, lng) in enumerate(track)]
+    assert fired == [[('wakeup', 'before'), ('announcement', 'before')], [],
+                     [('wakeup', 'after'), ('announcement', 'after')]]
+
+
+def test_two_workers_record_each_transition_once(bus, make_user):
+    user = make_user()
+    _fences(bus, user)
+    first, second = GeofenceEngine(), GeofenceEngine()
+    for engine in (first, second):
+        engine.process([_fix(bus, 0, STOP[0] - 0.012)])
+
+    # Both saw the fences pending; only one write applies
+    assert len(first.process([_fix(bus, 1, STOP[0] - 0.008)])) == 2
+    assert second.process([_fix(bus, 1, STOP[0] - 0.008)]) == []
+    assert Notification.query.filter_by(user_id=user).count() == 1
+
+
+def test_ingest_fires_wakeup_alerts(client, bus, make_user):
+    user = make_user()
+    _fences(bus, user)
+    # Past timestamps: the shared spatial index ignores fixes older than one it holds
+    start = datetime.utcnow() - timedelta(minutes=1)
+    for index, offset in enumerate((0.008, 0.0)):
+        client.post(f'/api/gps/buses/{bus}/location', json={
+            'latitude': STOP[0] - offset, 'longitude': STOP[1], 'speed': 30,
+            'timestamp': (start + timedelta(seconds=30 * index)).isoformat()
+        })
+    assert Notification.query.filter_by(user_id=user).count() == 2
@@ -0,0 +1,66 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from database import GPSTracker
+from database_operations import GPSOperations
+from gps_archive import GPSArchive, archive_closed_days, gps_archive
+
+DAY = datetime(2026, 1, 10)
+
+
+@pytest.fixture
+def archive(tmp_path):
+    return GPSArchive(root=str(tmp_path))
+
+
+def _rows(*seconds):
+    return [(28.6 + offset / 1e5, 77.2, DAY + timedelta(seconds=offset), 30, 90) for offset in seconds]
+
+
+def test_write_day_merges_and_drops_duplicates(archive):
+    assert archive.write_day(1, DAY.date(), _rows(10, 20)) == 2
+    # A late batch overlapping the archived day
+    assert archive.write_day(1, DAY.date(), _rows(5, 20, 30)) == 4
+    assert archive.days(1) == [DAY.date()] and archive.days(2) == []
+
+    fixes = archive.read_range(1)
+    assert [fix.timestamp for fix in fixes] == [DAY + timedelta(seconds=s) for s in (5, 10, 20, 30)]
+    assert (fixes[0].speed, fixes[0].heading) == (30, 90)
+    assert fixes[0].latitude == pytest.approx(28.60005)
+
+
+def test_read_range_bounds_and_limit_across_days(archive):
+    next_day = DAY + timedelta(days=1)
+    archive.write_day(1, DAY.date(), _rows(0, 3600, 7200))
+    archive.write_day(1, next_day.date(), [(28.7, 77.3, next_day + timedelta(seconds=s), 0, 0) for s in (0, 60)])
+
+    def times(**kwargs):
+        return [fix.timestamp for fix in archive.read_range(1, **kwargs)]
+
+    # since is inclusive, until exclusive
+    assert times(since=DAY + timedelta(seconds=3600), until=next_day) == [DAY + timedelta(hours=1), DAY + timedelta(hours=2)]
+    assert times(since=next_day) == [next_day, next_day + timedelta(seconds=60)]
+    assert times(until=DAY + timedelta(seconds=3600)) == [DAY]
+    # The limit keeps the newest fixes, spanning both days
+    assert times(limit=3) == [DAY + timedelta(hours=2), next_day, next_day + timedelta(seconds=60)]
+    assert times(since=next_day + timedelta(days=1)) == []
+
+
+def test_closed_days_move_to_the_archive(monkeypatch, tmp_path, client, bus):
+    monkeypatch.setattr(gps_archive, 'root', str(tmp_path))
+    GPSOperations.log_gps_batch([
+        {'bus_id': bus, 'latitude': 28.6, 'longitude': 77.2, 'timestamp': DAY + timedelta(minutes=minutes)}
+        for minutes in (0, 1)
+    ] + [{'bus_id': bus, 'latitude': 28.6, 'longitude': 77.2, 'timestamp': DAY + timedelta(days=2)}])
+
+    summary, error = archive_closed_days({'GPS_ARCHIVE_AFTER_DAYS': 2}, now=DAY + timedelta(days=3, hours=6))
+    assert error is None and summary == {'days': 1, 'bus_days': 1, 'fixes': 2}
+    assert gps_archive.days(bus) == [date(2026, 1, 10)]
+    assert [fix.timestamp for fix in GPSTracker.query.all()] == [DAY + timedelta(days=2)]
+
+    # History fills up from the archive below the newest table rows
+    history = client.get(f'/api/gps/buses/{bus}/history').json
+    assert [fix['timestamp'] for fix in history] == [
+        (DAY + timedelta(minutes=minutes)).isoformat() for minutes in (0, 1, 2 * 24 * 60)
+    ]
@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta
+
+from database import GPSTracker
+from database_operations import GPSOperations
+from gps_buffer import GPSWriteBuffer
+
+START = datetime(2026, 1, 1, 8, 0, 0)
+
+
+class FakeWriter:
+    """Records written batches; fails any batch holding a fix in `bad`, or all while `down`"""
+
+    def __init__(self, bad=()):
+        self.bad = set(bad)
+        self.down = False
+        self.written = []
+        self.calls = 0
+
+    def __call__(self, fixes):
+        self.calls += 1
+        if self.down or any(fix['seq'] in self.bad for fix in fixes):
+            return 0, 'write failed'
+        self.written.extend(fix['seq'] for fix in fixes)
+        return len(fixes), None
+
+
+def _fix(seq, bus_id=1):
+    return {'bus_id': bus_id, 'seq': seq, 'latitude': 28.6, 'longitude': 77.2,
+            'timestamp': START + timedelta(seconds=seq)}
+
+
+def _buffer(app, writer, probe=None, **settings):
+    buffer = GPSWriteBuffer()
+    buffer.init_app(app, writer=writer, probe=probe)
+    for name, value in settings.items():
+        setattr(buffer, name, value)
+    return buffer
+
+
+def test_full_ring_pushes_back(app):
+    buffer = _buffer(app, FakeWriter(), capacity_per_bus=2, block_timeout_ms=0)
+    assert buffer.append(_fix(1)) == (True, None)
+    assert buffer.append(_fix(2)) == (True, None)
+    assert buffer.append(_fix(3)) == (False, 'GPS buffer full, retry later')
+    # Other buses have their own ring
+    assert buffer.append(_fix(4, bus_id=2)) == (True, None)
+    assert buffer.stats['rejected'] == 1
+
+
+def test_shutdown_flushes_everything_pending(app):
+    writer = FakeWriter()
+    buffer = _buffer(app, writer)
+    for seq in range(5):
+        buffer.append(_fix(seq, bus_id=seq % 2))
+    buffer.shutdown()
+    assert sorted(writer.written) == [0, 1, 2, 3, 4]
+    assert buffer.pending_count() == 0 and buffer.stats['flushed'] == 5
+
+
+def test_bad_row_is_retried_then_set_aside(app):
+    writer = FakeWriter(bad={3})
+    buffer = _buffer(app, writer, probe=lambda: True, max_retries=2)
+    for seq in range(6):
+        buffer.append(_fix(seq))
+
+    assert buffer.flush() == (0, 'write failed')
+    assert [fix['seq'] for fix in buffer.pending(1)] == list(range(6))
+
+    assert buffer.flush() == (5, None)
+    assert sorted(writer.written) == [0, 1, 2, 4, 5]
+    assert [fix['seq'] for fix in buffer.dead_letters] == [3]
+    assert buffer.pending_count() == 0 and buffer.stats['dead_lettered'] == 1
+
+
+def test_outage_keeps_rows_queued(app):
+    writer = FakeWriter()
+    writer.down = True
+    buffer = _buffer(app, writer, probe=lambda: False, max_retries=1)
+    for seq in range(4):
+        buffer.append(_fix(seq))
+
+    assert buffer.flush() == (0, 'write failed')
+    assert not buffer.dead_letters and buffer.pending_count() == 4
+
+    writer.down = False
+    assert buffer.flush() == (4, None)
+
+
+def test_requeue_keeps_the_ring_bound(app):
+    def failing_writer(fixes):
+        # Fixes keep arriving while the write is in flight
+        buffer.append(_fix(10))
+        buffer.append(_fix(11))
+        return 0, 'write failed'
+
+    buffer = _buffer(app, failing_writer, capacity_per_bus=3, max_retries=5)
+    for seq in range(3):
+        buffer.append(_fix(seq))
+
+    buffer.flush()
+    assert [fix['seq'] for fix in buffer.pending(1)] == [2, 10, 11]
+    assert [fix['seq'] for fix in buffer.dead_letters] == [0, 1]
+
+
+def test_bad_row_against_the_database(app, bus):
+    buffer = _buffer(app, GPSOperations.log_gps_batch, GPSOperations.ping, max_retries=1)
+    for seq in range(4):
+        fix = _fix(seq, bus_id=bus)
+        if seq == 2:
+            fix['latitude'] = None
+        buffer.append(fix)
+
+    assert buffer.flush() == (3, None)
+    assert GPSTracker.query.filter_by(bus_id=bus).count() == 3
+    assert len(buffer.dead_letters) == 1
@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from gps_filter import GPSFilter, STORE, SKIP, INACCURATE
+
+START = datetime(2026, 1, 1, 8, 0, 0)
+# About 1.1 m of latitude
+STEP = 0.00001
+
+
+@pytest.fixture
+def gps_filter():
+    jitter_filter = GPSFilter(min_distance_m=10, min_heading_deg=20, max_accuracy_m=100, keepalive_s=60)
+    jitter_filter.enabled = True
+    return jitter_filter
+
+
+def _fix(seconds, latitude=28.6, heading=0, speed=30, accuracy=5, bus_id=1):
+    return {'bus_id': bus_id, 'latitude': latitude, 'longitude': 77.2, 'heading': heading,
+            'speed': speed, 'accuracy': accuracy, 'timestamp': START + timedelta(seconds=seconds)}
+
+
+def test_jitter_is_skipped_and_movement_stored(gps_filter):
+    assert gps_filter.check(_fix(0)) == STORE
+    assert gps_filter.check(_fix(5, 28.6 + 3 * STEP)) == SKIP
+    assert gps_filter.check(_fix(10, 28.6 + 20 * STEP)) == STORE
+    assert gps_filter.check(_fix(11, 28.6 + 20 * STEP)) == SKIP
+    assert gps_filter.snapshot()['writes_saved'] == 2
+
+
+def test_turn_and_keepalive_are_stored(gps_filter):
+    gps_filter.check(_fix(0))
+    assert gps_filter.check(_fix(5, heading=45)) == STORE
+    # A stationary bus's heading is noise
+    assert gps_filter.check(_fix(6, heading=120, speed=0)) == SKIP
+    assert gps_filter.check(_fix(70, heading=45)) == STORE
+    assert gps_filter.stats['keepalive'] == 1
+
+
+def test_inaccurate_and_late_fixes(gps_filter):
+    assert gps_filter.check(_fix(0, accuracy=500)) == INACCURATE
+    gps_filter.check(_fix(10))
+    # Older than the reference: stored, reference unchanged
+    assert gps_filter.check(_fix(5)) == STORE
+    assert gps_filter.check(_fix(15)) == SKIP
+
+
+def test_classify_evaluates_each_bus_oldest_first(gps_filter):
+    fixes = [_fix(5, 28.6 + 3 * STEP), _fix(0), _fix(0, bus_id=2)]
+    assert gps_filter.classify(fixes) == [SKIP, STORE, STORE]
+
+
+def test_disabled_filter_stores_everything():
+    jitter_filter = GPSFilter()
+    assert [jitter_filter.check(_fix(0)), jitter_filter.check(_fix(1))] == [STORE, STORE]
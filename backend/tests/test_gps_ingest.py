@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+from database import db, Bus, GPSTracker
+from database_operations import BusOperations
+from gps_ingest import MAX_BATCH_SIZE
+
+
+def _fix(bus_id, seconds_ago, latitude=28.6, **fields):
+    fix = {'bus_id': bus_id, 'latitude': latitude, 'longitude': 77.2,
+           'timestamp': (datetime.utcnow() - timedelta(seconds=seconds_ago)).isoformat()}
+    fix.update(fields)
+    return fix
+
+
+def test_batch_for_many_buses_reports_each_fix(client, bus):
+    other, _ = BusOperations.create_bus(
+        'DL02TEST', 'Other Driver', '9999999998', 'Delhi - Agra',
+        total_seats=10, start_point='Delhi', end_point='Agra'
+    )
+    fixes = [
+        _fix(bus, 30),
+        _fix(other.id, 20, latitude=28.7),
+        _fix(bus, 10, latitude=28.61),
+        _fix(bus, 5, latitude=95),
+        {'bus_id': bus, 'longitude': 77.2},
+        _fix(9999, 5),
+        _fix(bus, 5, timestamp='yesterday'),
+        _fix(bus, 5, accuracy=500),
+        'not a fix'
+    ]
+    response = client.post('/api/gps/locations/batch', json={'fixes': fixes})
+    assert response.status_code == 200
+    assert (response.json['accepted'], response.json['rejected'], response.json['stored']) == (3, 6, 3)
+    assert [result.get('error') for result in response.json['results']] == [
+        None, None, None,
+        'Coordinates out of range',
+        'latitude and longitude are required',
+        'Bus not found',
+        'Invalid timestamp',
+        'Accuracy worse than 100 m',
+        'Fix must be an object'
+    ]
+
+    assert GPSTracker.query.filter_by(bus_id=bus).count() == 2
+    db.session.expire_all()
+    # The newest fix per bus becomes its position
+    assert db.session.get(Bus, bus).current_lat == 28.61
+    assert client.get(f'/api/gps/buses/{other.id}/location').json['latitude'] == 28.7
+
+
+def test_bus_batch_endpoint_fills_in_the_bus(client, bus):
+    fixes = [{'latitude': latitude, 'longitude': 77.2, 'timestamp': (datetime.utcnow() - timedelta(seconds=seconds)).isoformat()}
+             for seconds, latitude in ((20, 28.6), (10, 28.61))]
+    response = client.post(f'/api/gps/buses/{bus}/locations/batch', json={'fixes': fixes})
+    assert response.status_code == 200 and response.json['accepted'] == 2
+    assert GPSTracker.query.filter_by(bus_id=bus).count() == 2
+
+
+def test_batch_size_limits(client, bus):
+    assert client.post('/api/gps/locations/batch', json={'fixes': []}).status_code == 400
+    too_many = [_fix(bus, 1)] * (MAX_BATCH_SIZE + 1)
+    assert client.post('/api/gps/locations/batch', json={'fixes': too_many}).status_code == 413
@@ -0,0 +1,116 @@
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import db, Notification, WakeUpAlert
+from gps_pipeline import GPSPipeline, process_fixes
+from live_state import live_state, EPOCH
+
+STOPS = [('S1', 28.6, 77.20), ('S2', 28.6, 77.22)]
+START = datetime.utcnow().replace(microsecond=0) - timedelta(minutes=5)
+
+
+class FakeProcess:
+    def __init__(self, alive=True):
+        self.alive = alive
+
+    def is_alive(self):
+        return self.alive
+
+
+@pytest.fixture
+def sharded():
+    """A two-shard pipeline whose workers are stand-ins, with inspectable queues"""
+    pipeline = GPSPipeline(workers=2, put_timeout_ms=10)
+    pipeline._inboxes = [queue.Queue(maxsize=2), queue.Queue(maxsize=2)]
+    pipeline._processes = [FakeProcess(), FakeProcess()]
+    return pipeline
+
+
+def _setup_route(client, bus, user):
+    client.post(f'/api/gps/buses/{bus}/route-stops', json={'stops': [
+        {'stop_name': name, 'latitude': lat, 'longitude': lng} for name, lat, lng in STOPS
+    ]})
+    db.session.add(WakeUpAlert(user_id=user, bus_id=bus, stop_name='S2', stop_lat=28.6, stop_lng=77.22,
+                               alert_before_time=120))
+    db.session.commit()
+
+
+def _fix(bus_id, seconds, longitude=77.21):
+    return {'bus_id': bus_id, 'latitude': 28.6, 'longitude': longitude, 'speed': 40,
+            'timestamp': START + timedelta(seconds=seconds)}
+
+
+def test_inline_processing_fires_alerts_and_predicts(client, bus, make_user):
+    _setup_route(client, bus, make_user())
+    # Dwell at S1, then halfway to S2: out of order within the batch
+    result = process_fixes([_fix(bus, 60, 77.215), _fix(bus, 0, 77.20), _fix(bus, 30, 77.20)], predict_eta=True)
+
+    assert (result['fired'], result['arrivals']) == (1, [bus])
+    [(bus_id, ts, next_stop)] = result['next_stops']
+    assert (bus_id, ts, next_stop['stop_name']) == (bus, (START + timedelta(seconds=60) - EPOCH).total_seconds(), 'S2')
+    assert GPSPipeline().submit([]) is None
+
+
+def test_fixes_are_routed_to_their_bus_shard_in_order(sharded):
+    assert sharded.submit([_fix(3, 20), _fix(2, 5), _fix(1, 10), _fix(3, 0)]) is None
+    assert sharded._inboxes[0].get_nowait() == ('fixes', [_fix(2, 5)])
+    assert sharded._inboxes[1].get_nowait() == ('fixes', [_fix(3, 0), _fix(1, 10), _fix(3, 20)])
+
+    sharded.invalidate(5)
+    sharded.invalidate()
+    assert [sharded._inboxes[1].get_nowait(), sharded._inboxes[1].get_nowait()] == [('invalidate', 5), ('invalidate', None)]
+    assert sharded._inboxes[0].get_nowait() == ('invalidate', None)
+    assert (sharded.stats['batches'], sharded.stats['fixes']) == (2, 4)
+
+
+def test_full_queue_drops_and_dead_worker_restarts(monkeypatch, sharded):
+    for seconds in range(3):
+        sharded.submit([_fix(2, seconds)])
+    assert sharded.stats['dropped'] == 1 and sharded._inboxes[0].qsize() == 2
+
+    monkeypatch.setattr(sharded, '_start', lambda shard: FakeProcess())
+    sharded._processes[1].alive = False
+    sharded.submit([_fix(1, 0)])
+    assert sharded.stats['restarts'] == 1 and sharded._processes[1].is_alive()
+    assert sharded.snapshot()['queued'] == [2, 1]
+
+
+def test_results_attach_to_the_live_entry_they_were_computed_from(sharded):
+    now = time.time()
+    live_state.update_many([{'bus_id': 41, 'ts': now, 'latitude': 28.6, 'longitude': 77.2},
+                            {'bus_id': 42, 'ts': now, 'latitude': 28.6, 'longitude': 77.2}])
+    sharded._outbox = queue.Queue()
+    sharded._outbox.put({'fired': 1, 'arrivals': [], 'shard': 1,
+                         'next_stops': [(41, now, {'stop_name': 'S2'}), (42, now - 1, {'stop_name': 'Stale'})]})
+    sharded._outbox.put({'error': 'database is locked', 'fixes': 3, 'shard': 0})
+    threading.Thread(target=sharded._collect, daemon=True).start()
+
+    deadline = time.monotonic() + 5
+    while sharded.stats['results'] < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert (sharded.stats['fired'], sharded.stats['errors']) == (1, 1)
+    assert live_state.get(41)['next_stop'] == {'stop_name': 'S2'}
+    assert 'next_stop' not in live_state.get(42)
+
+
+def test_forked_worker_processes_a_bus(monkeypatch, app, client, bus, make_user):
+    user = make_user()
+    _setup_route(client, bus, user)
+    monkeypatch.setitem(app.config, 'GPS_PIPELINE_WORKERS', 1)
+    pipeline = GPSPipeline()
+    pipeline.init_app(app)
+    try:
+        pipeline.submit([_fix(bus, 0)])
+        deadline = time.monotonic() + 10
+        while pipeline.stats['results'] < 1 and time.monotonic() < deadline:
+            time.sleep(0.02)
+    finally:
+        pipeline.shutdown()
+
+    assert (pipeline.stats['results'], pipeline.stats['fired'], pipeline.stats['errors']) == (1, 1, 0)
+    db.session.expire_all()
+    assert Notification.query.filter_by(user_id=user).count() == 1
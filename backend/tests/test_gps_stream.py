@@ -0,0 +1,71 @@
+import json
+from datetime import datetime
+
+from gps_stream import PositionBroker, Subscription
+
+
+def _state(bus_id, ts, latitude=28.6, longitude=77.2, route='Delhi - Jaipur'):
+    return {'bus_id': bus_id, 'ts': ts, 'received_at': ts, 'latitude': latitude, 'longitude': longitude, 'route': route}
+
+
+def test_publish_reaches_only_matching_subscriptions():
+    broker = PositionBroker()
+    by_bus, by_route, by_box, firehose = (
+        Subscription(bus_ids=[1]), Subscription(routes=['Mumbai Local']),
+        Subscription(bbox=(19.0, 72.8, 19.2, 73.0)), Subscription()
+    )
+    for subscription in (by_bus, by_route, by_box, firehose):
+        assert broker.subscribe(subscription)
+
+    broker.publish([_state(1, 100), _state(2, 100, 19.1, 72.9, route='Mumbai Local')])
+    assert [state['bus_id'] for state in by_bus.drain(0)] == [1]
+    assert [state['bus_id'] for state in by_route.drain(0)] == [2]
+    assert [state['bus_id'] for state in by_box.drain(0)] == [2]
+    assert sorted(state['bus_id'] for state in firehose.drain(0)) == [1, 2]
+
+    broker.unsubscribe(by_bus)
+    broker.publish([_state(1, 200)])
+    assert by_bus.drain(0) == [] and broker.subscriber_count() == 3
+
+
+def test_slow_subscriber_gets_the_newest_state_per_bus():
+    broker = PositionBroker()
+    subscription = Subscription(bus_ids=[1])
+    broker.subscribe(subscription)
+    for ts in (100, 101, 102):
+        broker.publish([_state(1, ts)])
+
+    assert [state['ts'] for state in subscription.drain(0)] == [102]
+    assert subscription.dropped == 2
+
+
+def test_relayed_state_is_published_once():
+    broker = PositionBroker()
+    subscription = Subscription()
+    broker.subscribe(subscription)
+    broker.publish([_state(1, 100)])
+    subscription.drain(0)
+
+    broker.publish([_state(1, 100), _state(1, 99)])
+    assert subscription.drain(0) == []
+
+
+def test_broker_refuses_subscribers_past_its_limit():
+    broker = PositionBroker(max_subscribers=1)
+    assert broker.subscribe(Subscription())
+    assert not broker.subscribe(Subscription())
+
+
+def test_stream_opens_with_a_snapshot(client, bus):
+    client.post(f'/api/gps/buses/{bus}/location', json={
+        'latitude': 28.6, 'longitude': 77.2, 'timestamp': datetime.utcnow().isoformat()
+    })
+    response = client.get(f'/api/gps/stream?bus_id={bus}', buffered=False)
+    assert response.mimetype == 'text/event-stream'
+    events = iter(response.response)
+    assert next(events) == b'retry: 3000\n\n'
+    event, _, data = next(events).decode().strip().split('\n')
+    assert event == 'event: position' and json.loads(data[len('data: '):])['bus_id'] == bus
+    response.close()
+
+    assert client.get('/api/gps/stream?bbox=1,2,3').status_code == 400
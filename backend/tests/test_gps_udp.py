@@ -0,0 +1,49 @@
+import socket
+import time
+
+from database import db, GPSTracker
+from gps_udp import GPSUDPListener, RECORD, decode_datagram, encode_record
+
+
+def test_records_round_trip():
+    now = int(time.time())
+    data = encode_record(7, 28.613939, -77.209021, 42.35, 359.996, now) + encode_record(8, -33.8688, 151.2093, 9000, 90, now)
+    assert len(data) == 2 * RECORD.size == 40
+
+    first, second = decode_datagram(data)
+    assert first == {'bus_id': 7, 'latitude': 28.613939, 'longitude': -77.209021, 'speed': 42.4, 'heading': 0.0, 'timestamp': now}
+    # Speeds past the field's range are clamped
+    assert (second['latitude'], second['speed'], second['heading']) == (-33.8688, 6553.5, 90.0)
+
+    assert decode_datagram(data[:-1]) is None
+    assert decode_datagram(b'') is None
+
+
+def test_listener_ingests_datagrams(monkeypatch, app, bus):
+    monkeypatch.setitem(app.config, 'GPS_UDP_ENABLED', True)
+    monkeypatch.setitem(app.config, 'GPS_UDP_HOST', '127.0.0.1')
+    monkeypatch.setitem(app.config, 'GPS_UDP_PORT', 0)
+    listener = GPSUDPListener()
+    listener.init_app(app)
+    port = listener._socket.getsockname()[1]
+
+    now = int(time.time())
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sender.sendto(encode_record(bus, 28.6, 77.2, 30, 90, now - 2) + encode_record(bus, 28.601, 77.2, 30, 90, now - 1),
+                      ('127.0.0.1', port))
+        sender.sendto(b'\x00' * 7, ('127.0.0.1', port))
+        sender.sendto(encode_record(9999, 28.6, 77.2, 30, 90, now), ('127.0.0.1', port))
+        deadline = time.monotonic() + 5
+        while listener.stats['packets'] < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        sender.close()
+        # Closing ingests what is still waiting for its batch
+        listener.close()
+
+    assert {key: listener.stats[key] for key in ('packets', 'records', 'malformed', 'rejected', 'errors')} == {
+        'packets': 3, 'records': 3, 'malformed': 1, 'rejected': 1, 'errors': 0
+    }
+    db.session.expire_all()
+    assert sorted(fix.latitude for fix in GPSTracker.query.filter_by(bus_id=bus)) == [28.6, 28.601]
@@ -0,0 +1,49 @@
+from database import db, Booking
+from database_operations import InventoryOperations
+from conftest import TRAVEL_DATE
+
+
+def _group(client, user, bus, **fields):
+    return client.post('/api/payments/group-bookings', json=dict(
+        user_id=user, bus_id=bus, travel_date=TRAVEL_DATE.isoformat(), price=150, **fields
+    ))
+
+
+def _taken(bus):
+    return InventoryOperations.get_day_masks([bus], TRAVEL_DATE).get(bus, 0)
+
+
+def test_count_picks_adjacent_seats_outside_women_rows(client, bus, make_user):
+    response = _group(client, make_user(), bus, count=3)
+    assert response.status_code == 201
+    assert [booking['seat_number'] for booking in response.json['bookings']] == [3, 4, 5]
+    assert response.json['amount'] == 450
+    assert _taken(bus) == 0b11100
+
+
+def test_group_is_all_or_nothing(client, bus, seat_id, make_user):
+    assert _group(client, make_user(), bus, seat_ids=[seat_id(bus, 6)]).status_code == 201
+
+    response = _group(client, make_user(), bus, seat_ids=[seat_id(bus, n) for n in (5, 6, 7)])
+    assert response.status_code == 409
+    assert _taken(bus) == 1 << 5  # Seats 5 and 7 were not taken either
+    assert Booking.query.count() == 1
+
+
+def test_group_size_is_capped(client, bus, make_user):
+    assert _group(client, make_user(), bus, count=11).status_code == 400
+    assert _group(client, make_user(), bus).status_code == 400
+
+
+def test_verify_and_refund_act_on_every_booking(client, bus, make_user):
+    created = _group(client, make_user(), bus, count=2).json
+    payment_id = created['payment_id']
+
+    response = client.post('/api/payments/verify', json={'payment_id': payment_id, 'gateway_transaction_id': 'GW1'})
+    assert response.status_code == 200 and response.json['booking_ref'] == created['group_ref']
+    assert {booking.status for booking in Booking.query.all()} == {'confirmed'}
+
+    assert client.post(f'/api/payments/{payment_id}/refund', json={}).status_code == 201
+    db.session.expire_all()
+    assert {booking.status for booking in Booking.query.all()} == {'cancelled'}
+    assert _taken(bus) == 0
@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta
+
+from database import db, BusLatestPosition
+from database_operations import GPSOperations
+from live_state import live_state
+
+NOW = datetime.utcnow().replace(microsecond=0)
+
+
+def _fix(bus_id, seconds, latitude):
+    return {'bus_id': bus_id, 'latitude': latitude, 'longitude': 77.2, 'timestamp': NOW + timedelta(seconds=seconds)}
+
+
+def test_batch_keeps_the_newest_position_per_bus(bus):
+    assert GPSOperations.log_gps_batch([_fix(bus, 0, 28.60), _fix(bus, 20, 28.62), _fix(bus, 10, 28.61)]) == (3, None)
+    assert db.session.get(BusLatestPosition, bus).latitude == 28.62
+
+    # A late fix older than the stored position leaves it alone
+    GPSOperations.log_gps_batch([_fix(bus, 5, 28.50)])
+    db.session.expire_all()
+    position = db.session.get(BusLatestPosition, bus)
+    assert (position.latitude, position.timestamp) == (28.62, NOW + timedelta(seconds=20))
+
+
+def test_positions_join_their_buses_in_one_query(bus):
+    GPSOperations.log_gps_batch([_fix(bus, 0, 28.60)])
+    [(fix, details)] = GPSOperations.get_latest_positions_with_buses()
+    assert (fix['bus_id'], fix['latitude']) == (bus, 28.60)
+    assert details == {'bus_number': 'DL01TEST', 'driver_name': 'Test Driver', 'route': 'Delhi - Jaipur', 'status': 'active'}
+
+
+def test_active_locations_are_read_from_the_table(monkeypatch, client, bus):
+    GPSOperations.log_gps_batch([_fix(bus, 0, 28.60)])
+    monkeypatch.setattr(live_state, 'max_age_s', 0)
+    [location] = client.get('/api/gps/buses/active/locations').json
+    assert (location['bus_id'], location['bus_number'], location['latitude']) == (bus, 'DL01TEST', 28.60)
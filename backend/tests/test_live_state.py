@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta
+
+from database import db, AdminUser, Bus
+from database_operations import GPSOperations
+from live_state import live_state
+
+
+def _admin(make_user):
+    user = make_user()
+    db.session.add(AdminUser(user_id=user, role='operator'))
+    db.session.commit()
+    return {'X-User-Id': str(user)}
+
+
+def _active_ids(client):
+    return [bus['bus_id'] for bus in client.get('/api/gps/buses/active/locations').json]
+
+
+def test_status_change_reaches_the_live_fleet(client, bus, make_user):
+    headers = _admin(make_user)
+    assert client.post(f'/api/gps/buses/{bus}/location', json={
+        'latitude': 28.6, 'longitude': 77.2, 'timestamp': datetime.utcnow().isoformat()
+    }).status_code == 200
+    assert _active_ids(client) == [bus]
+
+    url = f'/api/admin/buses/{bus}/status'
+    assert client.put(url, json={'status': 'inactive'}, headers=headers).status_code == 200
+    assert _active_ids(client) == []
+
+    assert client.put(url, json={'status': 'active'}, headers=headers).status_code == 200
+    assert _active_ids(client) == [bus]
+
+
+def test_memory_backend_picks_up_other_workers(client, bus, monkeypatch):
+    now = datetime.utcnow()
+    client.post(f'/api/gps/buses/{bus}/location', json={
+        'latitude': 28.6, 'longitude': 77.2, 'timestamp': (now - timedelta(seconds=30)).isoformat()
+    })
+
+    # Another worker stores a newer fix and takes the bus out of service
+    GPSOperations.upsert_latest_positions([{'bus_id': bus, 'latitude': 28.7, 'longitude': 77.3, 'timestamp': now}])
+    db.session.get(Bus, bus).status = 'inactive'
+    db.session.commit()
+
+    monkeypatch.setattr(live_state, 'max_age_s', 0)
+    assert client.get(f'/api/gps/buses/{bus}/location').json['latitude'] == 28.7
+    assert _active_ids(client) == []
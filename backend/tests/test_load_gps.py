@@ -0,0 +1,85 @@
+import random
+import sqlite3
+import threading
+from argparse import Namespace
+
+import pytest
+from werkzeug.serving import make_server
+
+from benchmarks.load_gps import SimulatedBus, _percentile, _requests, db_snapshot, run_load, summarize
+from database import db, GPSTracker
+
+# About 9.8 km due east
+ROUTE = [(28.6, 77.2), (28.6, 77.3)]
+
+
+def _bus(bus_id=1, speed_kmh=36):
+    simulated = SimulatedBus(bus_id, ROUTE, random.Random(1))
+    simulated.speed_kmh, simulated.offset_km = speed_kmh, 0.0
+    return simulated
+
+
+def test_simulated_bus_drives_the_route_and_turns_back():
+    simulated = _bus()
+    outbound = simulated.fix(0)
+    assert (outbound['latitude'], outbound['longitude']) == (pytest.approx(28.6, abs=1e-3), pytest.approx(77.2, abs=1e-3))
+    assert outbound['heading'] == 90.0
+
+    # 10 m/s: one kilometre past the end of the route the bus is heading back
+    inbound = simulated.fix((simulated.length_km + 1) * 100)
+    assert inbound['heading'] == 270.0
+    assert inbound['longitude'] == pytest.approx(77.3 - 0.1 * 1 / simulated.length_km, abs=1e-3)
+
+
+def test_request_shapes_per_mode():
+    fleet = [_bus(1), _bus(2), _bus(1)]
+    assert [(path, count) for path, _, count in _requests('single', fleet, 0, 500)] == [
+        ('/api/gps/buses/1/location', 1), ('/api/gps/buses/2/location', 1), ('/api/gps/buses/1/location', 1)
+    ]
+    assert [(path, count) for path, _, count in _requests('bus-batch', fleet, 0, 500)] == [
+        ('/api/gps/buses/1/locations/batch', 2), ('/api/gps/buses/2/locations/batch', 1)
+    ]
+    assert [(path, count) for path, _, count in _requests('batch', fleet, 0, 2)] == [
+        ('/api/gps/locations/batch', 2), ('/api/gps/locations/batch', 1)
+    ]
+
+
+def test_percentiles_and_db_growth(tmp_path):
+    assert [_percentile(list(range(1, 101)), q) for q in (50, 95, 99, 100)] == [50, 95, 99, 100]
+    assert _percentile([], 50) is None
+
+    path = str(tmp_path / 'bench.db')
+    with sqlite3.connect(path) as conn:
+        conn.execute('CREATE TABLE gps_trackers (id INTEGER PRIMARY KEY, payload TEXT)')
+    before = db_snapshot(path)
+    with sqlite3.connect(path) as conn:
+        conn.executemany('INSERT INTO gps_trackers (payload) VALUES (?)', [('x' * 100,)] * 200)
+    after = db_snapshot(path)
+    assert (before['gps_rows'], after['gps_rows']) == (0, 200)
+    assert db_snapshot(str(tmp_path / 'missing.db')) is None
+
+    args = Namespace(base_url='http://test', mode='single', rate=1.0, batch_size=500, duration=2.0, concurrency=1, db=path)
+    counts = {'requests': 4, 'fixes': 4, 'errors': 0, 'status': {'200': 4}, 'wall_seconds': 2.0}
+    result = summarize(args, [_bus(1), _bus(2)], [0.01, 0.02, 0.03, 0.04], [0.0, 0.001], counts, before, after)
+    assert result['throughput']['fixes_per_s'] == 2.0 and result['latency_ms']['p50'] == 20.0
+    assert result['db']['rows_per_fix'] == 50.0 and result['db']['bytes_per_fix'] > 0
+
+
+def test_run_load_against_a_live_server(app, bus):
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        args = Namespace(base_url=f'http://127.0.0.1:{server.server_port}', mode='bus-batch', rate=4.0,
+                         batch_size=500, duration=0.5, concurrency=2)
+        # Far apart on the route, so the jitter filter stores every fix
+        fleet = [_bus(bus), _bus(bus)]
+        fleet[1].offset_km = 5.0
+        latencies, lags, counts = run_load(args, fleet)
+    finally:
+        server.shutdown()
+
+    assert (counts['requests'], counts['fixes'], counts['errors']) == (2, 4, 0)
+    assert len(latencies) == len(lags) == 2
+    db.session.expire_all()
+    assert GPSTracker.query.filter_by(bus_id=bus).count() == 4
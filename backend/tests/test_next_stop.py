@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from geo_utils import PolylineProjector
+from map_matching import RouteGeometry
+from stop_index import RouteIndex
+from eta_engine import CachedStop
+
+# Out along one street, back along a parallel one about 90 m north
+STOPS = [('S1', 28.6000, 77.200), ('S2', 28.6000, 77.220), ('S3', 28.6008, 77.220), ('S4', 28.6008, 77.200)]
+
+
+def _cached_stops():
+    return [CachedStop(order, order, name, lat, lng, False) for order, (name, lat, lng) in enumerate(STOPS, 1)]
+
+
+def test_route_index_and_geometry_share_the_projection():
+    stops = _cached_stops()
+    geometry = RouteGeometry([(stop.latitude, stop.longitude) for stop in stops], stops)
+    route = RouteIndex(1, stops)
+    projector = PolylineProjector([stop.latitude for stop in stops], [stop.longitude for stop in stops])
+
+    t, offsets = projector.project(28.6003, 77.21)
+    assert offsets.tolist() == pytest.approx([0.0332, 0.9774, 0.0553], abs=1e-3)
+    assert route.locate(28.6003, 77.21)[0] == 0 and route.project(2, 28.6003, 77.21)[1] == pytest.approx(offsets[2])
+    segment, fraction, offset = geometry.project(28.6003, 77.21, 1, 3)
+    assert (segment, offset) == (2, pytest.approx(offsets[2])) and fraction == pytest.approx(t[2])
+
+
+def test_next_stop_uses_the_matched_distance(client, bus):
+    client.post(f'/api/gps/buses/{bus}/route-stops', json={'stops': [
+        {'stop_name': name, 'latitude': lat, 'longitude': lng} for name, lat, lng in STOPS
+    ]})
+    start = datetime.utcnow() - timedelta(minutes=10)
+    track = [(28.6000, 77.200), (28.6000, 77.215), (28.6004, 77.220), (28.6008, 77.218), (28.6003, 77.210)]
+    for seconds, (lat, lng) in enumerate(track):
+        client.post(f'/api/gps/buses/{bus}/location', json={
+            'latitude': lat, 'longitude': lng, 'speed': 0,
+            'timestamp': (start + timedelta(seconds=60 * seconds)).isoformat()
+        })
+
+    # The last fix is nearer the outbound street, but the bus is on its way back
+    response = client.post('/api/next-stop', json={'latitude': 28.6003, 'longitude': 77.21, 'busId': bus})
+    assert response.status_code == 200
+    assert response.json['nextStop']['name'] == 'S4'
+    assert response.json['nextStop']['distance'] == pytest.approx(0.98, abs=0.02)
@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+
+from database import db, Booking, Payment, Wallet
+from database_operations import BookingOperations, InventoryOperations
+from conftest import TRAVEL_DATE
+
+
+def _book(client, user, bus, seat):
+    return client.post('/api/payments/bookings', json={
+        'user_id': user, 'bus_id': bus, 'seat_id': seat, 'price': 200, 'travel_date': TRAVEL_DATE.isoformat()
+    }).json['booking_id']
+
+
+def _balance(user):
+    db.session.expire_all()
+    return Wallet.query.filter_by(user_id=user).one().balance
+
+
+def _pay(client, user, booking_id):
+    return client.post('/api/payments/wallet/pay-booking', json={'user_id': user, 'booking_id': booking_id})
+
+
+def test_wallet_pays_a_booking_once(client, bus, seat_id, make_user):
+    user = make_user(balance=1000)
+    booking_id = _book(client, user, bus, seat_id(bus, 5))
+
+    assert _pay(client, user, booking_id).status_code == 200
+    response = _pay(client, user, booking_id)
+    assert response.status_code == 409 and response.json['message'] == 'Booking is already paid'
+    assert _balance(user) == 800
+    assert Payment.query.count() == 1
+
+
+def test_refunded_payment_cannot_be_verified_again(client, bus, seat_id, make_user):
+    user = make_user()
+    booking_id = _book(client, user, bus, seat_id(bus, 5))
+    payment_id = client.post('/api/payments/initiate', json={
+        'booking_id': booking_id, 'payment_method': 'card'
+    }).json['payment_id']
+    verify = {'payment_id': payment_id, 'gateway_transaction_id': 'GW1'}
+
+    assert client.post('/api/payments/verify', json=verify).status_code == 200
+    assert client.post(f'/api/payments/{payment_id}/refund', json={}).status_code == 201
+    assert client.post('/api/payments/verify', json=verify).status_code == 409
+
+    db.session.expire_all()
+    assert db.session.get(Booking, booking_id).status == 'cancelled'
+    assert InventoryOperations.get_day_masks([bus], TRAVEL_DATE).get(bus, 0) == 0
+
+
+def test_cancelled_booking_cannot_be_paid(client, bus, seat_id, make_user):
+    user = make_user()
+    booking_id = _book(client, user, bus, seat_id(bus, 5))
+    BookingOperations.cancel_booking(booking_id, 'Changed plans')
+
+    assert _pay(client, user, booking_id).status_code == 409
+    assert _balance(user) == 1000
+
+
+def test_lapsed_hold_is_retaken_only_while_the_seat_is_free(client, bus, seat_id, make_user):
+    late, other = make_user(), make_user()
+    booking_id = _book(client, late, bus, seat_id(bus, 5))
+    db.session.get(Booking, booking_id).hold_expires_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    BookingOperations.release_expired_holds()
+
+    # Nobody took the seat since: paying late still gets it
+    assert _pay(client, late, booking_id).status_code == 200
+    assert InventoryOperations.get_day_masks([bus], TRAVEL_DATE)[bus] == 1 << 4
+
+    second = _book(client, other, bus, seat_id(bus, 6))
+    db.session.get(Booking, second).hold_expires_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    BookingOperations.release_expired_holds()
+    _book(client, late, bus, seat_id(bus, 6))
+
+    response = _pay(client, other, second)
+    assert response.status_code == 409 and response.json['message'] == 'Seat already reserved'
+    assert _balance(other) == 1000
+
+
+def test_statistics_count_confirmed_bookings(client, bus, seat_id, make_user):
+    user = make_user()
+    _pay(client, user, _book(client, user, bus, seat_id(bus, 5)))
+    _book(client, user, bus, seat_id(bus, 6))
+
+    stats = client.get('/statistics/dashboard').json
+    assert stats['total_bookings'] == 1 and stats['total_revenue'] == 200
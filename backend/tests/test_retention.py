@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import db, GPSTracker, GPSTrackSample
+from database_operations import GPSOperations, RetentionOperations
+from retention import parse_tiers, run_gps_retention
+
+NOW = datetime(2026, 3, 1, 12, 0, 0)
+CONFIG = {
+    'GPS_RAW_RETENTION_DAYS': 7,
+    'GPS_RETENTION_TIERS': '60:30,3600:0',
+    'GPS_RETENTION_BATCH_SIZE': 2,
+    'GPS_RETENTION_BATCH_PAUSE_MS': 0
+}
+
+
+def _log(bus, *timestamps):
+    GPSOperations.log_gps_batch([
+        {'bus_id': bus, 'latitude': 28.6 + index * 0.001, 'longitude': 77.2, 'timestamp': timestamp}
+        for index, timestamp in enumerate(timestamps)
+    ])
+
+
+def _samples(resolution):
+    db.session.expire_all()
+    return [(sample.timestamp, sample.point_count) for sample in
+            GPSTrackSample.query.filter_by(resolution=resolution).order_by(GPSTrackSample.timestamp)]
+
+
+def test_parse_tiers():
+    assert parse_tiers('60:30, 3600:0') == [(60, 30), (3600, 0)]
+    assert parse_tiers('') == []
+    for spec in ('60:30,60:90', '60:30,3600:10', '60:0,3600:90', '0:30'):
+        with pytest.raises(ValueError):
+            parse_tiers(spec)
+
+
+def test_raw_fixes_roll_up_once_past_the_cutoff(bus):
+    old = NOW - timedelta(days=8)
+    cutoff = NOW - timedelta(days=7)
+    _log(bus, old, old + timedelta(seconds=20), old + timedelta(seconds=40), old + timedelta(seconds=60), cutoff)
+
+    summary = run_gps_retention(CONFIG, now=NOW)
+    assert (summary[0]['action'], summary[0]['rows'], summary[0]['error']) == ('rollup to 60s', 4, None)
+    # The first fix of each minute becomes the sample; a fix at exactly the cutoff stays raw
+    assert _samples(60) == [(old, 3), (old + timedelta(seconds=60), 1)]
+    assert [fix.timestamp for fix in GPSTracker.query.all()] == [cutoff]
+
+    # A second run finds nothing new
+    assert run_gps_retention(CONFIG, now=NOW)[0]['rows'] == 0
+    assert _samples(60) == [(old, 3), (old + timedelta(seconds=60), 1)]
+
+
+def test_old_samples_roll_into_the_next_tier_and_history_reads_them(client, bus):
+    old = NOW - timedelta(days=40)
+    _log(bus, old, old + timedelta(seconds=30), old + timedelta(seconds=120))
+
+    summary = run_gps_retention(CONFIG, now=NOW)
+    assert [(step['table'], step['rows']) for step in summary] == [('gps_trackers', 3), ('gps_track_samples (60s)', 2)]
+    assert _samples(60) == [] and _samples(3600) == [(old, 3)]
+
+    rows = RetentionOperations.get_samples(bus, since=old, until=old + timedelta(seconds=1))
+    assert [row.timestamp for row in rows] == [old]
+    history = client.get(f'/api/gps/buses/{bus}/history?since={old.isoformat()}').json
+    assert [fix['timestamp'] for fix in history] == [old.isoformat()]
+
+
+def test_purge_is_batched_and_respects_the_cutoff(bus):
+    cutoff = NOW - timedelta(days=7)
+    _log(bus, *(cutoff - timedelta(minutes=minutes) for minutes in range(1, 6)), cutoff)
+
+    assert RetentionOperations.purge_batch(cutoff, batch_size=2) == (2, None)
+    config = dict(CONFIG, GPS_RETENTION_TIERS='')
+    summary = run_gps_retention(config, now=NOW, max_batches=1)
+    assert (summary[0]['action'], summary[0]['rows'], summary[0]['batches']) == ('purge', 2, 1)
+    assert run_gps_retention(config, now=NOW)[0]['rows'] == 1
+    assert [fix.timestamp for fix in GPSTracker.query.all()] == [cutoff]
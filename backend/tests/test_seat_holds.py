@@ -0,0 +1,117 @@
+from datetime import timedelta
+
+import pytest
+
+from database import db, Booking
+from database_operations import BookingOperations, InventoryOperations
+from seat_holds import SeatHoldManager, seat_holds
+from conftest import TRAVEL_DATE
+
+
+@pytest.fixture
+def manager(app, clock):
+    """A hold manager on the test clock, without a reaper thread"""
+    hold_manager = SeatHoldManager(clock=clock)
+    hold_manager.init_app(app, start=False)
+    return hold_manager
+
+
+def _book(client, user, bus, seat):
+    response = client.post('/api/payments/bookings', json={
+        'user_id': user, 'bus_id': bus, 'seat_id': seat, 'price': 200, 'travel_date': TRAVEL_DATE.isoformat()
+    })
+    return response
+
+
+def _pay(client, user, booking_id):
+    return client.post('/api/payments/wallet/pay-booking', json={'user_id': user, 'booking_id': booking_id})
+
+
+def _status(booking_id):
+    db.session.expire_all()
+    return db.session.get(Booking, booking_id).status
+
+
+def test_conflicts_only_for_other_users(manager, clock):
+    key = (1, TRAVEL_DATE.date(), 5)
+    manager.track([(10, 1, key)], manager.expires_at())
+    assert manager.conflicts(key, user_id=2)
+    assert not manager.conflicts(key, user_id=1)
+
+    clock.advance(manager.ttl_s + 1)
+    assert not manager.conflicts(key, user_id=2)
+
+    manager.forget([10], confirmed=True)
+    assert manager.snapshot()['active'] == 0 and manager.stats['confirmed'] == 1
+
+
+def test_reaper_releases_only_expired_unpaid_holds(client, clock, bus, seat_id, make_user):
+    user = make_user()
+    unpaid = _book(client, user, bus, seat_id(bus, 5)).json['booking_id']
+    paid = _book(client, user, bus, seat_id(bus, 6)).json['booking_id']
+    assert _pay(client, user, paid).status_code == 200
+
+    clock.advance(seat_holds.ttl_s / 2)
+    fresh = _book(client, user, bus, seat_id(bus, 7)).json['booking_id']
+    assert seat_holds.reap() == 0
+
+    clock.advance(seat_holds.ttl_s / 2 + 1)
+    assert seat_holds.reap() == 1
+    assert [_status(unpaid), _status(paid), _status(fresh)] == ['cancelled', 'confirmed', 'pending']
+    assert seat_holds.snapshot()['active'] == 1
+
+
+def test_hold_blocks_others_until_it_expires(client, clock, bus, seat_id, make_user):
+    holder, other = make_user(), make_user()
+    seat = seat_id(bus, 5)
+    booking = _book(client, holder, bus, seat).json
+    assert booking['hold_expires_at']
+    assert _book(client, other, bus, seat).status_code == 400
+
+    # A hold this process never tracked (another worker, or before a restart) is swept from the table
+    seat_holds.clear()
+    clock.advance(seat_holds.ttl_s + 1)
+    assert seat_holds.sweep() == 1
+    released = db.session.get(Booking, booking['booking_id'])
+    assert released.status == 'cancelled'
+    assert released.cancellation_reason == BookingOperations.HOLD_EXPIRED_REASON
+    assert InventoryOperations.get_day_masks([bus], TRAVEL_DATE) == {bus: 0}
+    assert _book(client, other, bus, seat).status_code == 201
+
+
+def test_paid_booking_is_not_reaped(client, bus, seat_id, make_user):
+    user = make_user()
+    booking = _book(client, user, bus, seat_id(bus, 6)).json
+    assert _pay(client, user, booking['booking_id']).status_code == 200
+
+    result, error = BookingOperations.release_expired_holds()
+    assert error is None and result == {'booking_ids': [], 'seats': 0}
+    assert _status(booking['booking_id']) == 'confirmed'
+
+
+def test_release_expired_holds_skips_bookings_paid_meanwhile(client, bus, seat_id, make_user):
+    user = make_user()
+    first = _book(client, user, bus, seat_id(bus, 7)).json['booking_id']
+    second = _book(client, user, bus, seat_id(bus, 8)).json['booking_id']
+    db.session.get(Booking, second).status = 'confirmed'
+    db.session.commit()
+
+    later = seat_holds.expires_at() + timedelta(seconds=1)
+    result, error = BookingOperations.release_expired_holds([first, second], now=later)
+    assert error is None and result == {'booking_ids': [first], 'seats': 1}
+    assert InventoryOperations.get_day_masks([bus], TRAVEL_DATE) == {bus: 1 << 7}
+
+
+def test_hold_is_kept_when_the_payment_does_not_commit(monkeypatch, client, bus, seat_id, make_user):
+    user = make_user()
+    booking_id = _book(client, user, bus, seat_id(bus, 5)).json['booking_id']
+
+    def failing_commit():
+        raise RuntimeError('database is locked')
+
+    monkeypatch.setattr(db.session, 'commit', failing_commit)
+    assert _pay(client, user, booking_id).status_code == 500
+    monkeypatch.undo()
+
+    assert seat_holds.snapshot()['active'] == 1
+    assert seat_holds.conflicts((bus, TRAVEL_DATE.date(), 5), user_id=user + 1)
@@ -0,0 +1,126 @@
+from datetime import timedelta
+
+from database import db, Booking, Bus, Seat, SeatInventory
+from database_operations import BookingOperations, InventoryOperations, SeatOperations
+from seat_map import mask_to_bytes
+from conftest import TRAVEL_DATE
+
+NEXT_DAY = TRAVEL_DATE + timedelta(days=1)
+
+
+def _taken(bus, day=TRAVEL_DATE):
+    return InventoryOperations.get_day_masks([bus], day).get(bus, 0)
+
+
+def test_seat_is_reserved_per_travel_date(bus):
+    assert InventoryOperations.reserve(bus, TRAVEL_DATE, [4]) == (1 << 3, None)
+    assert InventoryOperations.reserve(bus, NEXT_DAY, [4]) == (1 << 3, None)
+    db.session.commit()
+
+    assert InventoryOperations.reserve(bus, TRAVEL_DATE, [4, 5]) == (None, 'Seat already reserved')
+    db.session.rollback()
+    assert _taken(bus) == 1 << 3
+
+    InventoryOperations.release(bus, TRAVEL_DATE, [4])
+    db.session.commit()
+    assert _taken(bus) == 0 and _taken(bus, NEXT_DAY) == 1 << 3
+
+
+def test_reserve_checks_the_seat_map(bus, seat_id, make_user):
+    assert InventoryOperations.reserve(bus, TRAVEL_DATE, [11]) == (None, 'Seat not found on this bus')
+    assert InventoryOperations.reserve(bus, TRAVEL_DATE, [1], allow_women_seat=False) == (None, 'Women-only seat')
+
+    # An undated reservation blocks the seat on every date
+    SeatOperations.reserve(db.session.get(Seat, seat_id(bus, 6)), make_user())
+    db.session.commit()
+    assert InventoryOperations.reserve(bus, NEXT_DAY, [6]) == (None, 'Seat already reserved')
+
+
+def test_compare_and_set_keeps_a_concurrent_writer(monkeypatch, bus):
+    InventoryOperations.reserve(bus, TRAVEL_DATE, [1])
+    db.session.commit()
+
+    # Another writer takes seat 3 between our read and our write
+    table = SeatInventory.__table__
+    execute = db.session.execute
+    raced = []
+
+    def racing_execute(statement, *args, **kwargs):
+        if not raced and getattr(statement, 'is_update', False) and statement.table is table:
+            raced.append(True)
+            execute(table.update().where(table.c.bus_id == bus).values(
+                reserved_mask=mask_to_bytes(0b101), reserved_count=2, version=table.c.version + 1
+            ))
+        return execute(statement, *args, **kwargs)
+
+    monkeypatch.setattr(db.session, 'execute', racing_execute)
+    assert InventoryOperations.reserve(bus, TRAVEL_DATE, [4]) == (1 << 3, None)
+    db.session.commit()
+    assert raced and _taken(bus) == 0b1101
+
+    raced.clear()
+    assert InventoryOperations.reserve(bus, TRAVEL_DATE, [3]) == (None, 'Seat already reserved')
+
+
+def test_calendar_is_one_range_of_dates(client, bus):
+    InventoryOperations.reserve(bus, TRAVEL_DATE, [3, 4])
+    InventoryOperations.reserve(bus, NEXT_DAY, [5])
+    db.session.commit()
+
+    response = client.get(f'/buses/{bus}/availability?from={TRAVEL_DATE.date().isoformat()}&days=3')
+    assert response.status_code == 200
+    assert [(day['available_seats'], day['reserved_seats']) for day in response.json['days']] == [(8, 2), (9, 1), (10, 0)]
+
+    assert len(client.get(f'/buses/{bus}/availability?days=365').json['days']) == 90
+    assert client.get(f'/buses/{bus}/availability?from=tomorrow').status_code == 400
+
+
+def test_bus_listing_and_seat_map_take_a_date(client, bus):
+    InventoryOperations.reserve(bus, TRAVEL_DATE, [7])
+    db.session.commit()
+    day = TRAVEL_DATE.date().isoformat()
+
+    assert client.get(f'/buses?date={day}').json['buses'][0]['available_seats'] == 9
+    assert client.get('/buses').json['buses'][0]['available_seats'] == 10
+    seats = client.get(f'/buses/{bus}/seats?date={day}').json['seats']
+    assert [seat['seat_number'] for seat in seats if seat['is_reserved']] == [7]
+
+
+def test_rebuild_from_bookings(bus, seat_id, make_user):
+    user = make_user()
+    booking, error = BookingOperations.create_booking(user, bus, seat_id(bus, 5), TRAVEL_DATE, 200)
+    assert error is None
+
+    # A database from before per-date inventory: the booking holds the global flag
+    db.session.execute(SeatInventory.__table__.delete())
+    seats = Seat.__table__
+    db.session.execute(seats.update().where(seats.c.id == seat_id(bus, 5)).values(
+        is_reserved=True, reserved_by_user_id=user
+    ))
+    db.session.commit()
+
+    assert InventoryOperations.rebuild_from_bookings() == (1, None)
+    assert _taken(bus) == 1 << 4
+    assert not db.session.get(Seat, seat_id(bus, 5)).is_reserved
+
+
+def test_cancel_rolls_back_when_the_seat_cannot_be_released(monkeypatch, bus, seat_id, make_user):
+    booking, _ = BookingOperations.create_booking(make_user(), bus, seat_id(bus, 5), TRAVEL_DATE, 200)
+    monkeypatch.setattr(InventoryOperations, 'release', staticmethod(
+        lambda *args: (None, 'Seat inventory is busy, please retry')
+    ))
+
+    assert BookingOperations.cancel_booking(booking.id) == (None, 'Seat inventory is busy, please retry')
+    db.session.expire_all()
+    assert db.session.get(Booking, booking.id).status == 'pending'
+    assert _taken(bus) == 1 << 4
+
+
+def test_bus_summary_takes_the_day_mask(bus):
+    InventoryOperations.reserve(bus, TRAVEL_DATE, [2, 3])
+    db.session.commit()
+    masks = InventoryOperations.get_day_masks([bus], TRAVEL_DATE)
+
+    summary = db.session.get(Bus, bus).to_dict(taken=masks.get(bus, 0))
+    assert summary['available_seats'] == 8
+    assert db.session.get(Bus, bus).to_dict()['available_seats'] == 10
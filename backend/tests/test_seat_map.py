@@ -0,0 +1,54 @@
+from database import db, Bus, Seat
+from database_operations import SeatOperations
+from seat_map import SeatMap, seat_maps, mask_to_bytes, mask_from_bytes
+
+
+def _map(reserved=(), women=(1, 2), total=10):
+    rows = [(100 + n, n, n in reserved, n in women, False) for n in range(1, total + 1)]
+    return SeatMap(1, 0, rows)
+
+
+def test_counts_include_taken_mask():
+    seat_map = _map(reserved=(3,))
+    assert seat_map.total_count == 10
+    assert seat_map.available_count == 9
+    taken = seat_map.mask_of([4, 5])
+    assert seat_map.count_available(taken) == 7
+    assert seat_map.count_reserved(taken) == 3
+
+
+def test_find_adjacent_skips_taken_and_women_seats():
+    seat_map = _map(reserved=(4,))
+    assert seat_map.find_adjacent(3) == [1, 2, 3]
+    assert seat_map.find_adjacent(3, women_allowed=False) == [5, 6, 7]
+    assert seat_map.find_adjacent(3, women_allowed=False, taken=seat_map.mask_of([6])) == [7, 8, 9]
+    assert seat_map.find_adjacent(7, women_allowed=False) is None
+
+
+def test_seats_listing_marks_taken_seats():
+    seat_map = _map()
+    seats = seat_map.seats(taken=seat_map.mask_of([10]))
+    assert [seat['seat_number'] for seat in seats] == list(range(1, 11))
+    assert [seat['seat_number'] for seat in seats if seat['is_reserved']] == [10]
+    assert seats[0]['seat_id'] == 101 and seats[0]['is_women_seat']
+
+
+def test_mask_bytes_round_trip():
+    for mask in (0, 1, 1 << 49, (1 << 50) - 1, 0b1010_0000_0001):
+        assert mask_from_bytes(mask_to_bytes(mask)) == mask
+    assert mask_from_bytes(None) == 0
+
+
+def test_store_reloads_when_seat_version_moves(bus, seat_id):
+    seat_map = seat_maps.get(bus, db.session.get(Bus, bus).seat_version)
+    assert seat_map.available_count == 10
+
+    # A change made by another process only shows up as a version bump
+    seats = Seat.__table__
+    db.session.execute(seats.update().where(seats.c.id == seat_id(bus, 5)).values(is_reserved=True))
+    SeatOperations.bump_version(bus)
+    db.session.commit()
+
+    assert seat_maps.get(bus).available_count == 10  # No version given: cached map
+    fresh = seat_maps.get(bus, db.session.get(Bus, bus).seat_version)
+    assert fresh.available_count == 9 and fresh.is_reserved(5)
@@ -0,0 +1,63 @@
+from database import db, Seat
+from database_operations import SeatOperations
+from seat_map import seat_maps
+from conftest import TRAVEL_DATE
+
+
+def test_reserve_wins_once(bus, seat_id, make_user):
+    first, second = make_user(), make_user()
+    seat = db.session.get(Seat, seat_id(bus, 5))
+
+    change, error = SeatOperations.reserve(seat, first)
+    assert error is None and change == (bus, 5, True)
+    db.session.commit()
+
+    # The loser's conditional UPDATE matches no row
+    change, error = SeatOperations.reserve(seat, second)
+    assert change is None and error == 'Seat already reserved'
+    db.session.rollback()
+    assert db.session.get(Seat, seat.id).reserved_by_user_id == first
+
+
+def test_reserve_refuses_women_seat(bus, seat_id, make_user):
+    seat = db.session.get(Seat, seat_id(bus, 1))
+    _, error = SeatOperations.reserve(seat, make_user(), allow_women_seat=False)
+    assert error == 'Women-only seat'
+    _, error = SeatOperations.reserve(seat, make_user(gender='female'), allow_women_seat=True)
+    assert error is None
+
+
+def test_release_only_by_holder(bus, seat_id, make_user):
+    holder, other = make_user(), make_user()
+    seat = db.session.get(Seat, seat_id(bus, 6))
+    SeatOperations.reserve(seat, holder)
+    db.session.commit()
+
+    assert SeatOperations.release(seat, other) is None
+    assert SeatOperations.release(seat, holder) == (bus, 6, False)
+    db.session.commit()
+    assert not db.session.get(Seat, seat.id).is_reserved
+
+
+def test_reserve_endpoint_blocks_second_user(client, bus, seat_id, make_user):
+    first, second = make_user(), make_user()
+    seat = seat_id(bus, 7)
+
+    assert client.post(f'/seats/{seat}/reserve', json={'user_id': first}).status_code == 200
+    response = client.post(f'/seats/{seat}/reserve', json={'user_id': second})
+    assert response.status_code == 400
+    assert response.json['message'] == 'Seat already reserved'
+    assert seat_maps.get(bus).is_reserved(7)
+
+
+def test_reserve_endpoint_refuses_a_seat_booked_for_a_date(client, bus, seat_id, make_user):
+    booker, other = make_user(), make_user()
+    seat = seat_id(bus, 5)
+    response = client.post('/api/payments/bookings', json={
+        'user_id': booker, 'bus_id': bus, 'seat_id': seat, 'price': 200, 'travel_date': TRAVEL_DATE.isoformat()
+    })
+    assert response.status_code == 201
+
+    response = client.post(f'/seats/{seat}/reserve', json={'user_id': other})
+    assert response.status_code == 400 and response.json['message'] == 'Seat already reserved'
+    assert not db.session.get(Seat, seat).is_reserved
@@ -0,0 +1,51 @@
+from datetime import datetime
+
+from spatial_index import BusSpatialIndex
+
+
+def _state(bus_id, latitude, longitude, ts=100):
+    return {'bus_id': bus_id, 'latitude': latitude, 'longitude': longitude, 'ts': ts}
+
+
+def test_radius_query_is_nearest_first_and_exact():
+    index = BusSpatialIndex(cell_deg=0.05)
+    index.load([_state(1, 28.600, 77.200), _state(2, 28.610, 77.200), _state(3, 28.700, 77.200)])
+
+    matches = index.within_radius(28.6, 77.2, 2)
+    assert [state['bus_id'] for _, state in matches] == [1, 2]
+    assert matches[0][0] == 0 and 1.0 < matches[1][0] < 1.2
+    assert [state['bus_id'] for _, state in index.within_radius(28.6, 77.2, 20, limit=2)] == [1, 2]
+
+
+def test_moves_and_removals_leave_no_stale_cells():
+    index = BusSpatialIndex(cell_deg=0.05)
+    index.update(_state(1, 28.60, 77.20, ts=100))
+    index.update(_state(1, 19.07, 72.87, ts=200))
+    # A late fix does not move the bus back
+    index.update(_state(1, 28.60, 77.20, ts=150))
+
+    assert index.within_bbox(28.5, 77.1, 28.7, 77.3) == []
+    assert [state['bus_id'] for state in index.within_bbox(19.0, 72.8, 19.1, 72.9)] == [1]
+
+    index.remove(1)
+    assert len(index) == 0 and index.within_bbox(19.0, 72.8, 19.1, 72.9) == []
+
+
+def test_bbox_wider_than_the_occupied_cells():
+    index = BusSpatialIndex(cell_deg=0.05)
+    index.load([_state(1, 28.6, 77.2), _state(2, 19.07, 72.87)])
+    assert sorted(state['bus_id'] for state in index.within_bbox(-90, -180, 90, 180)) == [1, 2]
+
+
+def test_nearby_endpoint_follows_ingest(client, bus):
+    client.post(f'/api/gps/buses/{bus}/location', json={
+        'latitude': 12.9716, 'longitude': 77.5946, 'timestamp': datetime.utcnow().isoformat()
+    })
+
+    nearby = client.get('/api/gps/buses/nearby?lat=12.972&lng=77.595&radius_km=1').json
+    assert [(match['bus_id'], match['bus_number']) for match in nearby] == [(bus, 'DL01TEST')]
+    within = client.get('/api/gps/buses/within?bbox=12.9,77.5,13.0,77.6').json
+    assert [match['bus_id'] for match in within] == [bus]
+
+    assert client.get('/api/gps/buses/nearby?lat=12.97').status_code == 400
+    assert client.get('/api/gps/buses/within?bbox=12.9,77.5').status_code == 400
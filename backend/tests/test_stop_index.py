@@ -0,0 +1,57 @@
+import pytest
+
+from eta_engine import CachedStop
+from stop_index import RouteIndex, stop_index
+
+# Out along one street, back along a parallel one about 90 m north
+STOPS = [('S1', 28.6000, 77.200), ('S2', 28.6000, 77.220), ('S3', 28.6008, 77.220), ('S4', 28.6008, 77.200)]
+
+
+@pytest.fixture
+def route():
+    return RouteIndex(1, [CachedStop(order, order, name, lat, lng, False) for order, (name, lat, lng) in enumerate(STOPS, 1)])
+
+
+def _name(route, result):
+    return route.stops[result[0]].stop_name
+
+
+def test_next_stop_along_a_segment(route):
+    stop, distance_km, segment, fraction_left = route.next_stop(28.6000, 77.215)
+    assert (route.stops[stop].stop_name, segment) == ('S2', 0)
+    assert fraction_left == pytest.approx(0.25) and distance_km == pytest.approx(route.lengths_km[0] / 4)
+
+    # Before the first stop the remaining distance is straight to it
+    stop, distance_km, segment, _ = route.next_stop(28.6000, 77.199)
+    assert (route.stops[stop].stop_name, segment) == ('S1', None) and distance_km == pytest.approx(0.098, abs=0.001)
+
+
+def test_heading_picks_the_direction_of_travel(route):
+    # Between the two streets: the heading tells outbound from inbound
+    assert _name(route, route.next_stop(28.6004, 77.21, heading=90)) == 'S2'
+    assert _name(route, route.next_stop(28.6004, 77.21, heading=270)) == 'S4'
+    # No segment runs north: the heading is ignored rather than failing
+    assert _name(route, route.next_stop(28.6001, 77.21, heading=0)) == 'S2'
+
+
+def test_off_the_corridor_falls_back_to_the_nearest_stop(route):
+    stop, distance_km, segment, fraction_left = route.next_stop(28.7, 77.3)
+    assert (route.stops[stop].stop_name, segment, fraction_left) == ('S3', None, None)
+    assert distance_km > 10
+
+
+def test_next_stop_without_a_bus_uses_the_nearest_route(client, bus):
+    client.post(f'/api/gps/buses/{bus}/route-stops', json={'stops': [
+        {'stop_name': name, 'latitude': lat, 'longitude': lng} for name, lat, lng in STOPS
+    ]})
+    response = client.post('/api/next-stop', json={'latitude': 28.6004, 'longitude': 77.21, 'heading': 270})
+    assert (response.status_code, response.json['nextStop']['busId'], response.json['nextStop']['name']) == (200, bus, 'S4')
+
+    # Rewriting the stops rebuilds the index
+    client.post(f'/api/gps/buses/{bus}/route-stops', json={'stops': [
+        {'stop_name': 'Depot', 'latitude': 28.7, 'longitude': 77.3}
+    ]})
+    assert len(stop_index.route(bus).stops) == 1
+    response = client.post('/api/next-stop', json={'latitude': 28.6004, 'longitude': 77.21})
+    assert response.status_code == 404
+    assert client.post('/api/next-stop', json={'longitude': 77.21}).status_code == 400
@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from database_operations import GPSOperations
+from track_encoding import decode_polyline, encode_polyline, encode_track, simplify_track, zoom_to_tolerance
+
+START = datetime(2026, 1, 1, 8, 0, 0)
+
+
+def test_polyline_round_trip():
+    # The reference example from the encoded polyline format's documentation
+    points = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+    assert encode_polyline(points) == '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+    assert decode_polyline(encode_polyline(points)) == points
+
+    fine = [(28.6139391, 77.2090212), (28.6139, 77.209)]
+    assert decode_polyline(encode_polyline(fine, precision=6), precision=6) == [(28.613939, 77.209021), (28.6139, 77.209)]
+
+
+def test_simplify_keeps_only_corners_beyond_tolerance():
+    # An L-shaped track with points every ~110 m and a 5 m wobble on the first leg
+    lats = [28.600, 28.601, 28.602, 28.603, 28.603, 28.603]
+    lngs = [77.200, 77.20005, 77.200, 77.200, 77.201, 77.202]
+    assert simplify_track(lats, lngs, tolerance_m=20) == [0, 3, 5]
+    assert simplify_track(lats, lngs, tolerance_m=1) == [0, 1, 2, 3, 5]
+    assert simplify_track(lats, lngs, tolerance_m=0) == list(range(6))
+    assert simplify_track(lats[:2], lngs[:2], tolerance_m=1000) == [0, 1]
+
+    # A pixel at zoom 0 is ~156 km at the equator and halves per level
+    assert round(zoom_to_tolerance(0)) == 156543
+    assert zoom_to_tolerance(10, latitude=60) == pytest.approx(zoom_to_tolerance(0) / 2 ** 11)
+
+
+def test_encode_track_keeps_times_of_the_kept_points():
+    rows = [(28.600 + 0.001 * i, 77.2, START + timedelta(seconds=5 * i)) for i in range(5)]
+    track = encode_track(rows, tolerance_m=10)
+    assert (track['count'], track['original_count']) == (2, 5)
+    assert track['start'] == START.isoformat() and track['times'] == [0, 20]
+    assert decode_polyline(track['polyline']) == [(28.6, 77.2), (28.604, 77.2)]
+    assert encode_track([])['count'] == 0
+
+
+def test_history_endpoint_serves_the_compact_track(client, bus):
+    GPSOperations.log_gps_batch([
+        {'bus_id': bus, 'latitude': 28.600 + 0.001 * i, 'longitude': 77.2, 'timestamp': START + timedelta(seconds=i)}
+        for i in range(5)
+    ])
+
+    track = client.get(f'/api/gps/buses/{bus}/history?format=polyline&tolerance=10').json
+    assert (track['bus_id'], track['count'], track['original_count']) == (bus, 2, 5)
+    raw = client.get(f'/api/gps/buses/{bus}/history?format=polyline').json
+    assert len(decode_polyline(raw['polyline'])) == 5 and raw['times'] == [0, 1, 1, 1, 1]
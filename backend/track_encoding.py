@@ -0,0 +1,157 @@
+"""
+Track Encoding
+Compact GPS history payloads: polyline encoding, delta time arrays and line simplification
+"""
+
+import math
+import numpy as np
+from geo_utils import EARTH_RADIUS_KM
+
+# Ground resolution (metres per pixel) of Web Mercator zoom level 0 at the equator
+ZOOM0_METERS_PER_PIXEL = 156543.03392
+
+
+# ========== POLYLINE ENCODING ==========
+
+def _encode_value(value, chunks):
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    chunks.append(chr(value + 63))
+
+
+def encode_polyline(points, precision=5):
+    """Encode (lat, lng) pairs with the Google encoded polyline algorithm
+
+    Each coordinate is stored as a varint delta from the previous point, so
+    a dense track costs a few bytes per point instead of a JSON object."""
+    factor = 10 ** precision
+    chunks = []
+    prev_lat = prev_lng = 0
+    for latitude, longitude in points:
+        lat = int(round(latitude * factor))
+        lng = int(round(longitude * factor))
+        _encode_value(lat - prev_lat, chunks)
+        _encode_value(lng - prev_lng, chunks)
+        prev_lat, prev_lng = lat, lng
+    return ''.join(chunks)
+
+
+def decode_polyline(encoded, precision=5):
+    """Decode a Google encoded polyline back into (lat, lng) pairs"""
+    factor = 10 ** precision
+    points = []
+    index = lat = lng = 0
+    while index < len(encoded):
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lng += deltas[1]
+        points.append((lat / factor, lng / factor))
+    return points
+
+
+def encode_time_deltas(timestamps):
+    """Whole seconds between consecutive timestamps (first entry is 0)"""
+    deltas = []
+    previous = None
+    for timestamp in timestamps:
+        deltas.append(0 if previous is None else int(round((timestamp - previous).total_seconds())))
+        previous = timestamp
+    return deltas
+
+
+# ========== SIMPLIFICATION ==========
+
+def zoom_to_tolerance(zoom, latitude=0.0, pixels=1.0):
+    """Simplification tolerance (metres) for a map zoom level
+
+    Points closer than about one screen pixel to the simplified line are
+    invisible at that zoom, so they can be dropped."""
+    return ZOOM0_METERS_PER_PIXEL * math.cos(math.radians(latitude)) / (2 ** zoom) * pixels
+
+
+def simplify_track(lats, lngs, tolerance_m):
+    """Douglas-Peucker simplification of a track
+
+    Points are projected onto a local equirectangular plane in metres,
+    which is accurate for city- and region-sized tracks. The recursion is
+    run with an explicit stack and each segment's farthest point is found
+    with one vectorized pass, so day-long 1 Hz tracks simplify quickly.
+
+    Returns:
+        list: indices of the points to keep, in order"""
+    count = len(lats)
+    if count < 3 or tolerance_m <= 0:
+        return list(range(count))
+
+    lats = np.asarray(lats, dtype=np.float64)
+    lngs = np.asarray(lngs, dtype=np.float64)
+    scale = math.radians(1) * EARTH_RADIUS_KM * 1000
+    y = (lats - lats[0]) * scale
+    x = (lngs - lngs[0]) * scale * math.cos(math.radians(lats[0]))
+
+    keep = np.zeros(count, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, count - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        px = x[start + 1:end] - x[start]
+        py = y[start + 1:end] - y[start]
+        dx = x[end] - x[start]
+        dy = y[end] - y[start]
+        length_sq = dx * dx + dy * dy
+        if length_sq == 0:
+            distances = np.hypot(px, py)
+        else:
+            # Distance to the segment, clamped to its end points
+            t = np.clip((px * dx + py * dy) / length_sq, 0.0, 1.0)
+            distances = np.hypot(px - t * dx, py - t * dy)
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance_m:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+
+    return np.flatnonzero(keep).tolist()
+
+
+def encode_track(rows, tolerance_m=0.0, precision=5):
+    """Build the compact history payload for chronologically ordered fixes
+     Args:
+        rows: sequence of (latitude, longitude, timestamp) tuples
+        tolerance_m: Douglas-Peucker tolerance in metres (0 keeps every point)
+        precision: decimal places kept by the polyline encoding
+
+    Returns:
+        dict: polyline, start time, per-point time deltas and point counts"""
+    if not rows:
+        return {'polyline': '', 'precision': precision, 'start': None, 'times': [],
+                'count': 0, 'original_count': 0}
+
+    lats = [row[0] for row in rows]
+    lngs = [row[1] for row in rows]
+    kept = simplify_track(lats, lngs, tolerance_m)
+    timestamps = [rows[i][2] for i in kept]
+
+    return {
+        'polyline': encode_polyline(((lats[i], lngs[i]) for i in kept), precision),
+        'precision': precision,
+        'start': timestamps[0].isoformat(),
+        'times': encode_time_deltas(timestamps),
+        'count': len(kept),
+        'original_count': len(rows)
+    }